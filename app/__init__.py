@@ -1,12 +1,74 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from app.config import logger, GRACEFUL_SHUTDOWN_TIMEOUT, COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY, IPA_USERNAME
+from app.middleware.admission import AdmissionMiddleware
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.deadline import DeadlineMiddleware
+from app.middleware.context import RequestContextMiddleware
+from app.services.freeipa import service_pool
+from app.services.excel_parser import excel_parser
+from app.services.inflight import list_operations, wait_for_drain
+from app.services import jobs
+from app.services.deadline import DeadlineExceeded
+from app.services.limiter import BackendOverloaded
+from app.services.mail import mail_sender
+from app.services.snapshots import report_snapshots
+from app.utils.serialization import FastJSONResponse
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Снимки для отчётов по расписанию - только при настроенной сервисной учётке
+    if IPA_USERNAME:
+        report_snapshots.start_scheduler(service_pool.get)
+    else:
+        logger.info("SNAPSHOT: IPA_USERNAME not set, scheduled rebuild disabled")
+    yield
+    jobs.shutdown()
+    excel_parser.shutdown()
+    # uvicorn уже дождался запросов (или отменил их по GRACEFUL_SHUTDOWN_TIMEOUT). Остались
+    # фоновые операции и потоки отменённых запросов - они остановятся после текущего элемента
+    pending = list_operations()
+    if pending:
+        logger.warning("SHUTDOWN: Waiting for %s bulk operations: %s", len(pending), [op["operation"] for op in pending])
+        if not await run_in_threadpool(wait_for_drain, GRACEFUL_SHUTDOWN_TIMEOUT):
+            logger.error("SHUTDOWN: Bulk operations not finished: %s", list_operations())
+            jobs.interrupt_all()
+    # Письма, поставленные в очередь массовыми операциями
+    await run_in_threadpool(mail_sender.shutdown, 30)
+    logger.info("SHUTDOWN: Completed")
+
 
 app = FastAPI(
     title="FreeIPA API",
     description="API для управления пользователями FreeIPA",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # JSON через orjson (если установлен) для всех ручек
+    default_response_class=FastJSONResponse
 )
 
+
+@app.exception_handler(BackendOverloaded)
+async def backend_overloaded_handler(request: Request, exc: BackendOverloaded) -> JSONResponse:
+    """FreeIPA перегружена (адаптивный лимит исчерпан) - клиенту стоит повторить позже"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded) -> JSONResponse:
+    """Дедлайн запроса истёк (или клиент уже отключился) до завершения работы"""
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+# Допуск тяжёлых запросов (очередь по сессиям, 429) - внутри CORS и контекста логов,
+# чтобы ответ 429 получил заголовки CORS и X-Request-ID
+app.add_middleware(AdmissionMiddleware)
+
+# Дедлайн запроса и отмена при отключении клиента (ожидание допуска входит в дедлайн)
+app.add_middleware(DeadlineMiddleware)
+
 # CORS middleware для работы с фронтендом
 app.add_middleware(
     CORSMiddleware,
@@ -19,4 +81,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+)
+
+# Контекст запроса для логов (request_id, admin, operation)
+app.add_middleware(RequestContextMiddleware)
+
+# Сжатие больших JSON (full-info, validate-excel) и потоковых выгрузок.
+# Шаблон xlsx уже сжат - исключаем явно
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
+    exclude_paths=["/api/v1/templates/templates-excel"]
 )
\ No newline at end of file
@@ -1,19 +1,131 @@
 import os
 import logging
 from dotenv import load_dotenv
+from app.utils.log import setup_logging
 
 load_dotenv()
 
 YOPASS_URL = os.getenv("YOPASS_URL")
 YOPASS = os.getenv("YOPASS")
+YOPASS_TIMEOUT = float(os.getenv("YOPASS_TIMEOUT", "15"))  # секунд на вызов yopass
 IPA_HOST = os.getenv("IPA_HOST")
 SESSION_EXPIRATION_MINUTES = 60
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
+# Запуск сервера (main.py)
+APP_ENV = os.getenv("APP_ENV", "development")  # development | production
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+# Сессии хранятся в памяти воркера: больше одного - только если балансировщик
+# направляет запросы сессии в один и тот же процесс
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))  # только production
+GRACEFUL_SHUTDOWN_TIMEOUT = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "300"))  # секунд на завершение массовых операций
+
+# Локальное хранилище состояния (SQLite, общее для всех воркеров)
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "data/state.db")
+# Несколько воркеров uvicorn: инвалидации кэша пользователей передаются через общую SQLite
+MULTI_WORKER = APP_ENV == "production" and API_WORKERS > 1
+
+# Кэш user_show (get_user): секунд жизни записи (0 - выключен) и максимум записей
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+
+# Каталог групп: полное обновление раз в TTL секунд, при промахе - не чаще раза в MISS_REFRESH
+GROUP_CATALOG_TTL = float(os.getenv("GROUP_CATALOG_TTL", "300"))
+GROUP_CATALOG_MISS_REFRESH = float(os.getenv("GROUP_CATALOG_MISS_REFRESH", "30"))
+# Сколько пользователей передавать в одном group_add_member / group_remove_member
+GROUP_MEMBER_CHUNK = int(os.getenv("GROUP_MEMBER_CHUNK", "200"))
+
+# Индекс каталога пользователей для поиска: фоновое обновление (через сервисную учётку)
+# раз в TTL секунд, после изменений через API - не чаще раза в STALE_REFRESH секунд
+DIRECTORY_INDEX_TTL = float(os.getenv("DIRECTORY_INDEX_TTL", "300"))
+DIRECTORY_INDEX_STALE_REFRESH = float(os.getenv("DIRECTORY_INDEX_STALE_REFRESH", "30"))
+# Полный скан каталога (индекс, снимки, проверка Excel): параллельных запросов к FreeIPA
+# на процесс и пользователей в одном batch-запросе user_show
+DIRECTORY_SCAN_WORKERS = int(os.getenv("DIRECTORY_SCAN_WORKERS", "4"))
+DIRECTORY_SCAN_BATCH = int(os.getenv("DIRECTORY_SCAN_BATCH", "100"))
+
+# Сжатие ответов (gzip, Brotli - если установлен пакет brotli)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # байт
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Снимки каталога для отчётов (report/*): каталог, пересборка по расписанию
+# (секунд, 0 - выключена) и задержка пересборки после массовых операций
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "data/snapshots")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "900"))
+SNAPSHOT_REBUILD_DELAY = float(os.getenv("SNAPSHOT_REBUILD_DELAY", "10"))
+# Журнал изменений каталога (report/changes): сколько дней хранить события
+CHANGES_RETENTION_DAYS = float(os.getenv("CHANGES_RETENTION_DAYS", "30"))
+# Чекпоинты массовых операций: через сколько секунд без прогресса операция считается
+# прерванной (можно продолжить по Idempotency-Key) и сколько дней хранить журнал
+BULK_OPERATION_LEASE = float(os.getenv("BULK_OPERATION_LEASE", "120"))
+BULK_OPERATION_RETENTION_DAYS = float(os.getenv("BULK_OPERATION_RETENTION_DAYS", "7"))
+# Фоновые массовые операции (bulk-jobs): сколько одновременно выполняется на воркер
+BULK_JOB_WORKERS = int(os.getenv("BULK_JOB_WORKERS", "4"))
+# Разбор загруженных Excel / CSV (openpyxl держит GIL): сколько процессов на воркер
+EXCEL_PARSE_WORKERS = int(os.getenv("EXCEL_PARSE_WORKERS", "2"))
+# Диагностика памяти (tracemalloc): сколько именованных снимков хранить в процессе
+MEMORY_SNAPSHOTS_MAX = int(os.getenv("MEMORY_SNAPSHOTS_MAX", "5"))
+# Допуск тяжёлых запросов (массовые операции, сверка, validate-excel, полные выгрузки), на процесс:
+# одновременно всего / от одной сессии, размер очереди всего / на сессию,
+# сколько ждать в очереди (секунд) и Retry-After ответа 429
+ADMISSION_HEAVY_GLOBAL = int(os.getenv("ADMISSION_HEAVY_GLOBAL", "4"))
+ADMISSION_HEAVY_PER_SESSION = int(os.getenv("ADMISSION_HEAVY_PER_SESSION", "1"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "50"))
+ADMISSION_SESSION_QUEUE_SIZE = int(os.getenv("ADMISSION_SESSION_QUEUE_SIZE", "10"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "120"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "10"))
+# Дедлайн запроса (секунд от получения, 0 - без дедлайна); заголовок X-Request-Timeout может
+# только сократить его. Вызовы FreeIPA и Yopass не ждут дольше, массовые операции
+# останавливаются между элементами
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "900"))
+# Адаптивный лимит одновременных запросов к FreeIPA (на процесс): границы, начальное
+# значение, сколько ждать слот (секунд), порог роста задержки, пауза после 5xx/таймаута
+IPA_LIMIT_MIN = int(os.getenv("IPA_LIMIT_MIN", "2"))
+IPA_LIMIT_MAX = int(os.getenv("IPA_LIMIT_MAX", "32"))
+IPA_LIMIT_INITIAL = int(os.getenv("IPA_LIMIT_INITIAL", "8"))
+IPA_LIMIT_QUEUE_TIMEOUT = float(os.getenv("IPA_LIMIT_QUEUE_TIMEOUT", "30"))
+IPA_LIMIT_LATENCY_TOLERANCE = float(os.getenv("IPA_LIMIT_LATENCY_TOLERANCE", "2.0"))
+IPA_BACKOFF_BASE = float(os.getenv("IPA_BACKOFF_BASE", "0.5"))
+IPA_BACKOFF_MAX = float(os.getenv("IPA_BACKOFF_MAX", "10"))
+# Таймаут одного HTTP-вызова FreeIPA (секунд; не дольше дедлайна запроса)
+IPA_CALL_TIMEOUT = float(os.getenv("IPA_CALL_TIMEOUT", "60"))
+# Сервисная учётка FreeIPA для фоновых задач (пересборка снимков)
+IPA_USERNAME = os.getenv("IPA_USERNAME")
+IPA_PASSWORD = os.getenv("IPA_PASSWORD")
+# Режим сервисной учётки: пароль и членство в ADMIN_GROUP проверяются при входе,
+# дальше все вызовы идут через пул из SERVICE_POOL_SIZE клиентов сервисной учётки
+SERVICE_ACCOUNT_MODE = os.getenv("SERVICE_ACCOUNT_MODE", "false").lower() in ("1", "true", "yes")
+ADMIN_GROUP = os.getenv("ADMIN_GROUP", "admins")
+SERVICE_POOL_SIZE = int(os.getenv("SERVICE_POOL_SIZE", "4"))
+# SMTP для отправки учётных данных (без SMTP_HOST отправка отключена).
+# SMTP_SECURITY: starttls | ssl | none. Очередь писем ограничена SMTP_QUEUE_SIZE,
+# временные ошибки повторяются SMTP_RETRIES раз, соединение закрывается после SMTP_IDLE_TIMEOUT секунд простоя
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "starttls").lower()
+SMTP_FROM = os.getenv("SMTP_FROM")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_QUEUE_SIZE = int(os.getenv("SMTP_QUEUE_SIZE", "1000"))
+SMTP_QUEUE_TIMEOUT = float(os.getenv("SMTP_QUEUE_TIMEOUT", "30"))
+SMTP_RETRIES = int(os.getenv("SMTP_RETRIES", "3"))
+SMTP_RETRY_DELAY = float(os.getenv("SMTP_RETRY_DELAY", "2"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+
+# Логирование: записи уходят в очередь и пишутся фоновым потоком
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_REPEAT_BURST = int(os.getenv("LOG_REPEAT_BURST", "20"))  # одинаковых сообщений на окно, 0 - без ограничения
+LOG_REPEAT_WINDOW = float(os.getenv("LOG_REPEAT_WINDOW", "10"))  # секунд
+
+setup_logging(
+    level=LOG_LEVEL,
+    fmt=LOG_FORMAT,
+    queue_size=LOG_QUEUE_SIZE,
+    repeat_burst=LOG_REPEAT_BURST,
+    repeat_window=LOG_REPEAT_WINDOW
 )
 logger = logging.getLogger(__name__)
\ No newline at end of file
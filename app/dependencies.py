@@ -1,13 +1,36 @@
 from fastapi import HTTPException, Request
 from python_freeipa import Client
 from datetime import datetime, timedelta
-from app.services.freeipa import create_freeipa_client
+from typing import Any, Optional
+from app.config import logger, SERVICE_ACCOUNT_MODE, ADMIN_GROUP
+from app.services.checkpoints import BulkOperation, BulkOperationConflict, fingerprint
+from app.services.freeipa import create_freeipa_client, is_admin, service_pool
+from app.services.mail import mail_sender
+from app.services.storage import register_schema
 
 # Хранилище сессий (в продакшене используйте Redis или базу)
 user_sessions = {}
 # Словарь для хранения клиентов FreeIPA по сессии
 ipa_clients = {}
 
+# Сессии больше не пишутся на диск - удаляем таблицу (с cookie FreeIPA), оставшуюся от прежних версий
+register_schema("DROP TABLE IF EXISTS sessions;")
+
+
+def store_session(session_id: str, username: str, client: Optional[Client], expires: datetime) -> None:
+    """
+    Сохраняет сессию и клиент FreeIPA
+
+    client=None - режим сервисной учётки, своего клиента у сессии нет
+    """
+    user_sessions[session_id] = {
+        "username": username,
+        "created": datetime.now(),
+        "expires": expires
+    }
+    if client is not None:
+        ipa_clients[session_id] = client
+
 
 def cleanup_session(session_id: str) -> None:
     """Удаляет сессию и связанный FreeIPA клиент"""
@@ -17,18 +40,31 @@ def cleanup_session(session_id: str) -> None:
         del ipa_clients[session_id]
 
 
-def authenticate_user(username: str, password: str) -> Client:
-    """Аутентификация пользователя в FreeIPA"""
+def authenticate_user(username: str, password: str) -> Optional[Client]:
+    """
+    Аутентификация пользователя в FreeIPA
+
+    В режиме сервисной учётки пароль и членство в ADMIN_GROUP проверяются один раз,
+    клиент администратора не сохраняется - возвращается None
+    """
     try:
         client = create_freeipa_client()
         client.login(username, password)
-        return client
     except Exception as e:
         raise HTTPException(
             status_code=401,
             detail=f"Ошибка аутентификации: {str(e)}"
         )
 
+    if not SERVICE_ACCOUNT_MODE:
+        return client
+
+    client._session.close()
+    if not is_admin(username):
+        logger.warning("Login denied: %s is not in %s", username, ADMIN_GROUP)
+        raise HTTPException(status_code=403, detail=f"Пользователь не входит в группу {ADMIN_GROUP}")
+    return None
+
 
 def get_session_username(request: Request) -> str:
     """Получает username текущего пользователя из сессии"""
@@ -58,7 +94,48 @@ def get_user_client(request: Request) -> Client:
         cleanup_session(session_id)
         raise HTTPException(status_code=401, detail="Сессия истекла")
 
+    if SERVICE_ACCOUNT_MODE:
+        # Вызовы от сервисной учётки, реальный администратор - в аудит-логе (admin из контекста)
+        return service_pool.get()
+
     if session_id not in ipa_clients:
         raise HTTPException(status_code=401, detail="Ошибка сессии")
 
-    return ipa_clients[session_id]
\ No newline at end of file
+    return ipa_clients[session_id]
+
+
+def open_bulk_operation(request: Request, kind: str, payload: Any,
+                        idempotency_key: Optional[str]) -> BulkOperation:
+    """Чекпоинты массовой операции (продолжение - по тому же Idempotency-Key)"""
+    try:
+        return BulkOperation.open(kind, get_session_username(request), fingerprint(payload), idempotency_key)
+    except BulkOperationConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+def require_admin(request: Request) -> str:
+    """
+    Ручки только для членов ADMIN_GROUP (диагностика). Возвращает username
+
+    В режиме сервисной учётки членство уже проверено при входе; иначе - user_show
+    от имени самого администратора.
+    """
+    client = get_user_client(request)
+    username = get_session_username(request)
+    if SERVICE_ACCOUNT_MODE:
+        return username
+    try:
+        allowed = is_admin(username, client)
+    except Exception as e:
+        logger.error("Admin check failed for %s - %s", username, e)
+        raise HTTPException(status_code=503, detail="Не удалось проверить членство в группе администраторов")
+    if not allowed:
+        logger.warning("Access denied: %s is not in %s", username, ADMIN_GROUP)
+        raise HTTPException(status_code=403, detail=f"Пользователь не входит в группу {ADMIN_GROUP}")
+    return username
+
+
+def require_mail() -> None:
+    """send_email=true без настроенного SMTP - ошибка до начала операции"""
+    if not mail_sender.enabled:
+        raise HTTPException(status_code=400, detail="Отправка на email недоступна: SMTP не настроен")
@@ -0,0 +1,52 @@
+import json
+from starlette.requests import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.services.admission import admission, classify, request_class_var, AdmissionRejected
+
+
+class AdmissionMiddleware:
+    """
+    Допуск тяжёлых запросов (массовые операции, сверка, validate-excel, полные выгрузки)
+
+    Тяжёлые запросы проходят через AdmissionController: ограничение на сессию и на
+    процесс, очередь по кругу сессий. Переполнение очереди - 429 с Retry-After.
+    Интерактивные запросы пропускаются сразу. Слот освобождается после отправки
+    ответа целиком (для потоковых выгрузок - после последнего куска).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_class = classify(scope["method"], scope["path"])
+        request_class_var.set(request_class)
+        if request_class != "heavy":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        session = request.cookies.get("ipa_session") or (request.client.host if request.client else "-")
+        try:
+            await admission.acquire(session)
+        except AdmissionRejected as e:
+            body = json.dumps({"detail": str(e)}, ensure_ascii=False).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"retry-after", str(e.retry_after).encode("latin-1")),
+                ]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(session)
@@ -0,0 +1,152 @@
+import zlib
+from typing import Iterable, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # Brotli опционален: uv add brotli
+    brotli = None
+
+# Уже сжатые форматы - повторно не жмём
+ALREADY_COMPRESSED_MEDIA_TYPES = (
+    "application/vnd.openxmlformats-officedocument",  # xlsx, docx
+    "application/gzip",
+    "application/zip",
+    "application/x-gzip",
+    "image/",
+    "video/",
+    "audio/",
+)
+
+
+class _Encoder:
+    """Потоковый кодировщик gzip или br"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31 - gzip-заголовок
+
+    def compress(self, data: bytes) -> bytes:
+        """Сжимает кусок и сбрасывает буфер - клиент получает данные сразу, без буферизации всего тела"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов gzip / Brotli (если установлен пакет brotli)
+
+    - ответы меньше minimum_size отдаются как есть
+    - уже сжатые ответы (Content-Encoding, xlsx, gz, zip, картинки) и exclude_paths не трогаем
+    - StreamingResponse сжимается по мере отдачи кусков, тело целиком не буферизуется
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6,
+                 brotli_quality: int = 4, exclude_paths: Iterable[str] = ()):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.exclude_paths = set(exclude_paths)
+
+    def _choose_encoding(self, scope: Scope) -> Optional[str]:
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        accepted = {item.split(";")[0].strip().lower() for item in accept.split(",")}
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._choose_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Решает по первому куску тела: сжимать, отдать как есть или сжимать потоком"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message: Optional[Message] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+
+    def _new_encoder(self) -> _Encoder:
+        return _Encoder(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+
+    def _set_encoding_headers(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "")
+            if "content-encoding" in headers or media_type.startswith(ALREADY_COMPRESSED_MEDIA_TYPES):
+                self.passthrough = True
+                await self._send(message)
+            else:
+                # Заголовки отправим, когда увидим первый кусок тела
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+
+            if not more_body:
+                # Тело целиком в одном сообщении (JSONResponse и т.п.)
+                if len(body) < self.middleware.minimum_size:
+                    self.passthrough = True
+                    await self._send(start)
+                    await self._send(message)
+                    return
+
+                encoder = self._new_encoder()
+                compressed = encoder.compress(body) + encoder.finish()
+                self._set_encoding_headers(headers)
+                headers["Content-Length"] = str(len(compressed))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Потоковый ответ - длина заранее неизвестна, сжимаем по кускам
+            self.encoder = self._new_encoder()
+            self._set_encoding_headers(headers)
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self._send(start)
+
+        if more_body:
+            await self._send({"type": "http.response.body", "body": self.encoder.compress(body), "more_body": True})
+        else:
+            await self._send({"type": "http.response.body", "body": self.encoder.compress(body) + self.encoder.finish()})
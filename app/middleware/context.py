@@ -0,0 +1,46 @@
+import uuid
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.dependencies import get_session_username
+from app.services.inflight import is_bulk_path, begin_operation, end_operation
+from app.utils.log import bind_log_context
+
+
+class RequestContextMiddleware:
+    """
+    Привязывает к запросу request_id и администратора для структурированных логов
+
+    request_id берётся из заголовка X-Request-ID (если прокси его прислал)
+    либо генерируется, и возвращается клиенту в ответе.
+    Массовые операции дополнительно регистрируются как выполняющиеся (graceful shutdown).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+        admin = get_session_username(request)
+        operation = f"{scope['method']} {scope['path']}"
+        bind_log_context(request_id=request_id, admin=admin, operation=operation)
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"].append((b"x-request-id", request_id.encode("latin-1")))
+            await send(message)
+
+        if not is_bulk_path(scope["path"]):
+            await self.app(scope, receive, send_with_request_id)
+            return
+
+        op_id = begin_operation(operation, admin)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            end_operation(op_id)
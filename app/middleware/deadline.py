@@ -0,0 +1,83 @@
+import asyncio
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config import logger, REQUEST_DEADLINE
+from app.services.deadline import RequestDeadline, deadline_var
+
+
+def _requested_timeout(scope: Scope) -> float:
+    """REQUEST_DEADLINE или X-Request-Timeout клиента, если он меньше"""
+    timeout = REQUEST_DEADLINE
+    for name, value in scope["headers"]:
+        if name == b"x-request-timeout":
+            try:
+                requested = float(value)
+            except ValueError:
+                break
+            if requested > 0 and (not timeout or requested < timeout):
+                timeout = requested
+            break
+    return timeout
+
+
+class DeadlineMiddleware:
+    """
+    Дедлайн запроса и отмена при отключении клиента
+
+    Дедлайн отсчитывается от получения запроса (ожидание в очереди допуска входит в него).
+    Сообщения клиента с самого начала читает отдельная задача и передаёт приложению
+    через очередь на одно сообщение: тело запроса идёт с той же скоростью, с какой его
+    читает приложение, а http.disconnect виден сразу - и у GET без тела, который
+    приложение никогда не читает. Клиент закрыл вкладку или прокси оборвал соединение
+    по таймауту - дедлайн отменяется, массовая операция останавливается перед следующим
+    элементом, а новые вызовы FreeIPA не выполняются. То же при отмене задачи запроса
+    (остановка сервера).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = RequestDeadline(_requested_timeout(scope))
+        deadline_var.set(deadline)
+        messages: "asyncio.Queue[Message]" = asyncio.Queue(maxsize=1)
+        response_sent = False
+
+        async def receive_from_watcher() -> Message:
+            message = await messages.get()
+            if message["type"] == "http.disconnect":
+                # Следующие вызовы receive тоже получают disconnect, как от сервера
+                messages.put_nowait(message)
+            return message
+
+        async def send_tracking_response(message: Message) -> None:
+            nonlocal response_sent
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_sent = True
+            await send(message)
+
+        async def watch_receive() -> None:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not response_sent:
+                        deadline.cancel("disconnected")
+                        logger.warning("DEADLINE: Client disconnected, stopping %s %s", scope["method"], scope["path"])
+                    await messages.put(message)
+                    return
+                # Следующую часть тела читаем, только когда приложение забрало эту
+                await messages.put(message)
+
+        watcher = asyncio.create_task(watch_receive())
+        try:
+            await self.app(scope, receive_from_watcher, send_tracking_response)
+        except asyncio.CancelledError:
+            # uvicorn отменяет задачу по истечении GRACEFUL_SHUTDOWN_TIMEOUT, но поток
+            # run_in_threadpool продолжает работать - останавливаем его перед следующим элементом
+            deadline.cancel("shutdown")
+            raise
+        finally:
+            watcher.cancel()
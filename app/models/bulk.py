@@ -0,0 +1,41 @@
+from pydantic import BaseModel
+from typing import Any, Optional
+
+
+class BulkResult(BaseModel):
+    """Результат синхронной массовой операции: элементы - как вернул обработчик элемента"""
+    success: list[dict[str, Any]]
+    failed: list[dict[str, Any]]
+    operation_id: str
+    replayed: int = 0  # успешные элементы, возвращённые из журнала (Idempotency-Key)
+    cancelled: Optional[bool] = None
+    stopped: Optional[str] = None  # deadline / disconnected / shutdown - остановлена до конца списка
+
+
+class BulkJobStarted(BaseModel):
+    """Фоновая операция запущена"""
+    operation_id: str
+    status: str
+    total: int
+
+
+class BulkProgress(BaseModel):
+    """Прогресс фоновой операции: счётчики и элементы, завершённые после курсора"""
+    id: str
+    kind: str
+    admin: Optional[str] = None
+    status: str
+    updated: float
+    total: Optional[int] = None
+    processed: int
+    success: int
+    failed: int
+    items: list[dict[str, Any]]
+    cursor: int
+
+
+class MembershipResult(BaseModel):
+    """Массовое изменение членства: статус по каждой паре (пользователь, группа)"""
+    summary: dict[str, int]
+    ipa_calls: int
+    results: list[dict[str, Any]]
@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+
+
+class GroupMembership(BaseModel):
+    """Пользователи (username или email) и группы для массового изменения членства"""
+    users: list[str] = Field(min_length=1)
+    groups: list[str] = Field(min_length=1)
@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class UserRow(BaseModel):
+    """Строка таблицы пользователей (вкладка "Аналитика")"""
+    uid: Optional[str] = None
+    mail: Optional[str] = None
+    cn: Optional[str] = None
+    title: Optional[str] = None
+    enabled: bool
+    groups: list[str] = []
+
+
+class UsersTablePage(BaseModel):
+    total: int
+    page: int
+    page_size: int
+    pages: int
+    index_age: float
+    users: list[UserRow]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Any, Literal, Optional
 
 class UserCreate(BaseModel):
     first_name: str
@@ -7,4 +7,47 @@ class UserCreate(BaseModel):
     email: EmailStr
     title: str = None
     phone: str = None
-    groups: list[str] = []
\ No newline at end of file
+    groups: list[str] = []
+
+class BulkJob(BaseModel):
+    """Фоновая массовая операция над списком username / email"""
+    action: Literal["delete", "disable", "enable", "reset-password"]
+    identifiers: list[str]
+    send_email: bool = False  # reset-password: отправить Yopass ссылки на email пользователей
+
+class UserSummary(BaseModel):
+    """Компактная запись пользователя (поиск, списки)"""
+    uid: Optional[str] = None
+    mail: Optional[str] = None
+    cn: Optional[str] = None
+    title: Optional[str] = None
+    givenname: Optional[str] = None
+    sn: Optional[str] = None
+    telephonenumber: Optional[str] = None
+    enabled: bool
+    groups: list[str] = []
+
+class UserSearchPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    source: Literal["index", "ipa"]
+    index_age: Optional[float] = None  # только для source=index
+    users: list[UserSummary]
+
+class ExcelValidation(BaseModel):
+    """Отчёт проверки Excel перед массовым созданием"""
+    valid: bool
+    total_rows: int
+    would_create: int
+    conflicts_count: int
+    warnings_count: int
+    conflicts: list[dict[str, Any]]
+    warnings: list[dict[str, Any]]
+
+class ReconcileResponse(BaseModel):
+    """План сверки и (при apply=true) результат применения"""
+    applied: bool
+    plan: dict[str, Any]
+    plan_fingerprint: str
+    result: Optional[dict[str, Any]] = None
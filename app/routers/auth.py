@@ -2,7 +2,7 @@ from fastapi import APIRouter, Request, Form, HTTPException
 from fastapi.responses import JSONResponse
 from datetime import datetime, timedelta
 from app.config import logger, SESSION_EXPIRATION_MINUTES
-from app.dependencies import authenticate_user, user_sessions, ipa_clients, cleanup_session
+from app.dependencies import authenticate_user, store_session, cleanup_session
 import uuid
 
 
@@ -15,7 +15,7 @@ def login(request: Request,
                 ) -> JSONResponse:
     """Аутентификация пользователя в FreeIPA"""
     try:
-        logger.info(f"Login attempt: {username}")
+        logger.info("Login attempt: %s", username)
         # Аутентифицируем пользователя в FreeIPA
         client = authenticate_user(username, password)
 
@@ -23,15 +23,8 @@ def login(request: Request,
         session_id = str(uuid.uuid4())
         expires = datetime.now() + timedelta(minutes=SESSION_EXPIRATION_MINUTES)
 
-        # Сохраняем данные сессии
-        user_sessions[session_id] = {
-            "username": username,
-            "created": datetime.now(),
-            "expires": expires
-        }
-
-        # Сохраняем клиент FreeIPA
-        ipa_clients[session_id] = client
+        # Сохраняем данные сессии и клиент FreeIPA
+        store_session(session_id, username, client, expires)
 
         # Создаём ответ с кукой
         response = JSONResponse(
@@ -51,11 +44,14 @@ def login(request: Request,
             samesite="lax"  # Работает для same-site запросов
         )
 
-        logger.info(f"Login successful: {username}")
+        logger.info("Login successful: %s", username)
         return response
 
+    except HTTPException as e:
+        logger.warning("Login failed: %s - %s", username, e.detail)
+        raise
     except Exception as e:
-        logger.warning(f"Login failed: {username} - {str(e)}")
+        logger.warning("Login failed: %s - %s", username, e)
         raise HTTPException(status_code=401, detail=f"Ошибка авторизации: {str(e)}")
 
 
@@ -1,176 +1,260 @@
-from app.dependencies import get_user_client
-from app.services.freeipa import resolve_username
-from fastapi import APIRouter, Request
-from typing import Dict, List, Any
+from app.config import logger, SMTP_TIMEOUT
+from app.dependencies import get_user_client, open_bulk_operation, get_session_username, require_mail
+from app.models.bulk import BulkJobStarted, BulkProgress, BulkResult
+from app.models.user import BulkJob
+from app.services.bulk import (
+    run_bulk, delete_user, disable_user, enable_user, reset_password, reset_password_with_link, CredentialMailer
+)
+from app.services.checkpoints import get_operation, get_progress
+from app.services.jobs import start_job, job_progress, request_cancel
+from app.services.snapshots import report_snapshots
+from app.services.yopass import create_yopass_link
+from app.utils.log import bind_log_context
+from app.utils.serialization import FastJSONResponse
+from fastapi import APIRouter, Request, Header, HTTPException, Query
+from typing import Dict, List, Any, Optional
 
 
 router = APIRouter()
 
-@router.post("/api/v1/users/bulk-delete")
-def bulk_delete_users(identifiers: List[str], request: Request) -> Dict[str, List[Dict[str, Any]]]:
+# action фоновой операции -> (kind операции, имя для логов, обработчик элемента)
+BULK_JOB_ACTIONS = {
+    "delete": ("bulk-delete", "BULK_DELETE", delete_user),
+    "disable": ("bulk-disable", "BULK_DISABLE", disable_user),
+    "enable": ("bulk-enable", "BULK_ENABLE", enable_user),
+    # Результаты фоновой операции читаются из журнала, где паролей нет - отдаём Yopass ссылки
+    "reset-password": ("bulk-reset-password-link", "BULK_RESET_PASSWORD", reset_password_with_link),
+}
+
+
+def _own_operation(operation: Optional[Dict[str, Any]], operation_id: str, request: Request) -> Dict[str, Any]:
+    """Операция текущего администратора; чужая - 404, как несуществующая (в результатах - Yopass ссылки)"""
+    if operation is None or operation["admin"] != get_session_username(request):
+        raise HTTPException(status_code=404, detail=f"Операция {operation_id} не найдена")
+    return operation
+
+
+@router.post("/api/v1/users/bulk-delete", responses={200: {"model": BulkResult}})
+def bulk_delete_users(
+    identifiers: List[str],
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+) -> FastJSONResponse:
     """
     Массовое удаление пользователей
-    
+
     Принимает username или email
 
     ["ivan.ivanov", "petr@test.com", "petya.petrov"]
+
+    Idempotency-Key - повторная отправка с тем же ключом продолжит прерванную операцию
     """
-    results = {"success": [], "failed": []}
     client = get_user_client(request)
+    operation = open_bulk_operation(request, "bulk-delete", identifiers, idempotency_key)
 
-    for identifier in identifiers:
-        try:
-            # Находим username (по email или напрямую)
-            username = resolve_username(client, identifier)
-            
-            # Удаляем пользователя
-            client._request("user_del", args=[username], params={})
-            
-            # Добавляем в успешные
-            results["success"].append({
-                "identifier": identifier,
-                "username": username
-            })
-            
-        except ValueError as e:
-            # Пользователь не найден
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
-        except Exception as e:
-            # Любая другая ошибка (FreeIPA, сеть и т.д.)
-            results["failed"].append({
-                "identifier": identifier,
-                "error": f"Ошибка удаления: {str(e)}"
-            })
+    bind_log_context(operation="BULK_DELETE")
+    logger.warning("BULK_DELETE: Started, %s identifiers, operation %s", len(identifiers), operation.id)
+
+    results = run_bulk(client, operation, ((str(i), x) for i, x in enumerate(identifiers)), delete_user)
 
-    return results
+    logger.info("BULK_DELETE: Completed - Success: %s, Failed: %s", len(results['success']), len(results['failed']))
+    if results["success"]:
+        report_snapshots.schedule_rebuild()
+    return FastJSONResponse(results)
 
 
-@router.post("/api/v1/users/bulk-disable")
-def bulk_disable_users(identifiers: List[str], request: Request) -> Dict[str, List[Dict[str, Any]]]:
+@router.post("/api/v1/users/bulk-disable", responses={200: {"model": BulkResult}})
+def bulk_disable_users(
+    identifiers: List[str],
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+) -> FastJSONResponse:
     """
     Массовое отключение пользователей
-    
+
     Принимает username или email
 
     ["ivan.ivanov", "petr@test.com", "petya.petrov"]
+
+    Idempotency-Key - повторная отправка с тем же ключом продолжит прерванную операцию
     """
-    results = {"success": [], "failed": []}
     client = get_user_client(request)
+    operation = open_bulk_operation(request, "bulk-disable", identifiers, idempotency_key)
 
-    for identifier in identifiers:
-        try:
-            # Находим username (по email или напрямую)
-            username = resolve_username(client, identifier)
-            
-            # Удаляем пользователя
-            client._request("user_disable", args=[username], params={})
-            
-            # Добавляем в успешные
-            results["success"].append({
-                "identifier": identifier,
-                "username": username
-            })
-            
-        except ValueError as e:
-            # Пользователь не найден
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
-        except Exception as e:
-            # Любая другая ошибка (FreeIPA, сеть и т.д.)
-            results["failed"].append({
-                "identifier": identifier,
-                "error": f"Ошибка отключения: {str(e)}"
-            })
+    bind_log_context(operation="BULK_DISABLE")
+    logger.warning("BULK_DISABLE: Started, %s identifiers, operation %s", len(identifiers), operation.id)
+
+    results = run_bulk(client, operation, ((str(i), x) for i, x in enumerate(identifiers)), disable_user)
 
-    return results
+    logger.info("BULK_DISABLE: Completed - Success: %s, Failed: %s", len(results['success']), len(results['failed']))
+    if results["success"]:
+        report_snapshots.schedule_rebuild()
+    return FastJSONResponse(results)
 
 
-@router.post("/api/v1/users/bulk-enable")
-def bulk_enable_users(identifiers: List[str], request: Request) -> Dict[str, List[Dict[str, Any]]]:
+@router.post("/api/v1/users/bulk-enable", responses={200: {"model": BulkResult}})
+def bulk_enable_users(
+    identifiers: List[str],
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+) -> FastJSONResponse:
     """
     Массовое включение пользователей
-    
+
     Принимает username или email
 
     ["ivan.ivanov", "petr@test.com", "petya.petrov"]
+
+    Idempotency-Key - повторная отправка с тем же ключом продолжит прерванную операцию
     """
-    results = {"success": [], "failed": []}
     client = get_user_client(request)
+    operation = open_bulk_operation(request, "bulk-enable", identifiers, idempotency_key)
 
-    for identifier in identifiers:
-        try:
-            # Находим username (по email или напрямую)
-            username = resolve_username(client, identifier)
-            
-            # Удаляем пользователя
-            client._request("user_enable", args=[username], params={})
-            
-            # Добавляем в успешные
-            results["success"].append({
-                "identifier": identifier,
-                "username": username
-            })
-            
-        except ValueError as e:
-            # Пользователь не найден
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
-        except Exception as e:
-            # Любая другая ошибка (FreeIPA, сеть и т.д.)
-            results["failed"].append({
-                "identifier": identifier,
-                "error": f"Ошибка включения: {str(e)}"
-            })
+    bind_log_context(operation="BULK_ENABLE")
+    logger.warning("BULK_ENABLE: Started, %s identifiers, operation %s", len(identifiers), operation.id)
 
-    return results
+    results = run_bulk(client, operation, ((str(i), x) for i, x in enumerate(identifiers)), enable_user)
 
+    logger.info("BULK_ENABLE: Completed - Success: %s, Failed: %s", len(results['success']), len(results['failed']))
+    if results["success"]:
+        report_snapshots.schedule_rebuild()
+    return FastJSONResponse(results)
 
-@router.post("/api/v1/users/bulk-reset-password")
-def bulk_reset_password(identifiers: List[str], request: Request) -> Dict[str, List[Dict[str, Any]]]:
+
+@router.post("/api/v1/users/bulk-reset-password", responses={200: {"model": BulkResult}})
+def bulk_reset_password(
+    identifiers: List[str],
+    request: Request,
+    send_email: bool = False,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+) -> FastJSONResponse:
     """
     Массовый сброс паролей пользователей
 
     Можно передавать username или email - API сам определит:
     ["ivan.ivanov", "petr@test.com", "elena.sidorova"]
+
+    send_email=true - отправить новый пароль на email пользователя (SMTP), статус
+    письма - в поле delivery каждого успешного элемента.
+    Idempotency-Key - повторная отправка с тем же ключом продолжит прерванную операцию.
+    Пароли не сохраняются: уже обработанные пользователи вернутся без password
+    и с credentials_unavailable: true - им нужен повторный сброс
+    """
+    client = get_user_client(request)
+    if send_email:
+        require_mail()
+    operation = open_bulk_operation(request, "bulk-reset-password", identifiers, idempotency_key)
+
+    bind_log_context(operation="BULK_RESET_PASSWORD")
+    logger.warning("BULK_RESET_PASSWORD: Started, %s identifiers, operation %s", len(identifiers), operation.id)
+
+    mailer = CredentialMailer(client, operation, "reset") if send_email else None
+    results = run_bulk(client, operation, ((str(i), x) for i, x in enumerate(identifiers)), reset_password,
+                       after_item=mailer)
+    if mailer is not None:
+        mailer.wait(SMTP_TIMEOUT)
+
+    logger.info("BULK_RESET_PASSWORD: Completed - Success: %s, Failed: %s", len(results['success']), len(results['failed']))
+    return FastJSONResponse(results)
+
+
+@router.get("/api/v1/bulk-operations/{operation_id}")
+def bulk_operation_status(operation_id: str, request: Request) -> Dict[str, Any]:
+    """
+    Прогресс массовой операции по operation_id из ответа
+
+    pending - элемент, на котором операция прервалась (результат неизвестен).
+    Доступно только администратору, запустившему операцию
+    """
+    get_user_client(request)
+
+    return _own_operation(get_operation(operation_id), operation_id, request)
+
+
+@router.post("/api/v1/users/bulk-jobs", status_code=202, response_model=BulkJobStarted)
+def start_bulk_job(
+    job: BulkJob,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+) -> Dict[str, Any]:
     """
-    results = {
-        "success": [],
-        "failed": []
-    }
+    Фоновая массовая операция: delete / disable / enable / reset-password
 
+    {"action": "disable", "identifiers": ["ivan.ivanov", "petr@test.com"]}
+
+    Сразу возвращает operation_id; прогресс - GET /api/v1/bulk-operations/{id}/progress,
+    остановка - POST /api/v1/bulk-operations/{id}/cancel.
+    reset-password возвращает Yopass ссылки вместо паролей; send_email=true - ссылки
+    уходят пользователям на email, статус письма - в поле delivery элемента.
+    """
     client = get_user_client(request)
+    kind, log_name, action = BULK_JOB_ACTIONS[job.action]
+    if job.send_email:
+        if job.action != "reset-password":
+            raise HTTPException(status_code=400, detail="send_email поддерживается только для reset-password")
+        require_mail()
 
-    for identifier in identifiers:
+    if job.action == "reset-password":
+        # Проверяем Yopass до сброса паролей - без него новые пароли не передать
         try:
-            # Находим username (вся логика внутри функции)
-            username = resolve_username(client, identifier)  # ← ВОТ И ВСЁ!
+            create_yopass_link("test", "test123")
+        except Exception as e:
+            logger.error("%s: Yopass unavailable - %s", log_name, e)
+            raise HTTPException(status_code=503, detail=f"Yopass недоступен: {str(e)}. Сброс паролей отменён.")
 
-            # Сбрасываем пароль
-            reset_result = client._request(
-                "user_mod",
-                args=[username],
-                params={"random": True}
-            )
+    operation = open_bulk_operation(request, kind, job.identifiers, idempotency_key)
+    bind_log_context(operation=log_name)
 
-            password = reset_result['result']['randompassword']
+    def on_finish(results: Dict[str, Any]) -> None:
+        if results["success"] and job.action != "reset-password":
+            report_snapshots.schedule_rebuild()
 
-            results["success"].append({
-                "identifier": identifier,
-                "username": username,
-                "password": password
-            })
+    return start_job(
+        client,
+        operation,
+        log_name,
+        get_session_username(request),
+        [(str(i), x) for i, x in enumerate(job.identifiers)],
+        action,
+        on_finish,
+        after_item=CredentialMailer(client, operation, "reset") if job.send_email else None
+    )
 
-        except Exception as e:
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
 
-    return results
+@router.get("/api/v1/bulk-operations/{operation_id}/progress", response_model=BulkProgress)
+def bulk_operation_progress(
+    operation_id: str,
+    request: Request,
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000)
+) -> Dict[str, Any]:
+    """
+    Прогресс фоновой операции для опроса
+
+    Возвращает total, processed, success, failed, status и результаты элементов,
+    завершённых после курсора since. Следующий запрос - с since=cursor из ответа.
+    status: running | cancelling | completed | cancelled | interrupted
+    """
+    get_user_client(request)
+
+    return _own_operation(job_progress(operation_id, since, limit), operation_id, request)
+
+
+@router.post("/api/v1/bulk-operations/{operation_id}/cancel", status_code=202)
+def cancel_bulk_operation(operation_id: str, request: Request) -> Dict[str, Any]:
+    """
+    Остановка фоновой операции перед следующим элементом
+
+    Уже обработанные элементы не откатываются. Продолжить можно, отправив
+    тот же запрос с тем же Idempotency-Key.
+    """
+    get_user_client(request)
+
+    operation = _own_operation(get_progress(operation_id, limit=0), operation_id, request)
+    if operation["status"] != "running":
+        raise HTTPException(status_code=409, detail=f"Операция уже завершена ({operation['status']})")
+    if not request_cancel(operation_id):
+        raise HTTPException(status_code=409, detail="Синхронную операцию нельзя остановить")
+
+    logger.warning("BULK_OPERATION: Cancel requested for %s", operation_id)
+    return {"operation_id": operation_id, "status": "cancelling"}
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from app.dependencies import user_sessions, ipa_clients, require_admin
+from app.services import jobs
+from app.services.admission import admission
+from app.services.cache import user_cache
+from app.services.diagnostics import memory_tracer, process_memory, SnapshotNotFound, GROUP_BY
+from app.services.directory import directory_index
+from app.services.excel_parser import excel_parser
+from app.services.freeipa import ipa_singleflight
+from app.services.groups import group_catalog
+from app.services.inflight import list_operations
+from app.services.mail import mail_sender
+from app.utils.log import bind_log_context
+from typing import Any, Dict, Literal, Optional
+
+# Все ручки - только для членов ADMIN_GROUP; данные - по текущему процессу (воркеру), см. pid
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+def _app_structures() -> Dict[str, Any]:
+    """Размеры собственных структур приложения в этом процессе"""
+    operations = list_operations()
+    return {
+        "user_sessions": len(user_sessions),
+        "ipa_clients": len(ipa_clients),
+        "user_cache_entries": len(user_cache),
+        "group_catalog_entries": len(group_catalog),
+        "directory_index_entries": len(directory_index),
+        "inflight_operations": len(operations),
+        "bulk_jobs_active": jobs.active_jobs(),
+        "ipa_coalescing_inflight": ipa_singleflight.metrics()["inflight"],
+        "admission_running": admission.metrics()["running"],
+        "admission_queued": admission.metrics()["queued"],
+        "excel_parser_pending": excel_parser.metrics()["pending"],
+        "mail_queued": mail_sender.metrics()["queued"]
+    }
+
+
+def _run(call, *args):
+    try:
+        return call(*args)
+    except SnapshotNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/api/v1/diagnostics/memory")
+def memory_overview() -> Dict[str, Any]:
+    """
+    Память процесса: RSS, состояние трассировки аллокаций и размеры структур приложения
+
+    (сессии и клиенты FreeIPA, кэши, индекс каталога, выполняющиеся операции и фоновые задачи)
+    """
+    return {
+        "process": process_memory(),
+        "structures": _app_structures(),
+        "tracing": memory_tracer.status()
+    }
+
+
+@router.post("/api/v1/diagnostics/memory/tracing/start")
+def start_tracing(frames: int = Query(1, ge=1, le=50)) -> Dict[str, Any]:
+    """
+    Включает трассировку аллокаций (tracemalloc)
+
+    frames - глубина стека для каждой аллокации (больше - точнее traceback, но дороже).
+    Замедляет процесс - выключайте после разбора (tracing/stop)
+    """
+    bind_log_context(operation="MEMORY_TRACING")
+    return _run(memory_tracer.start, frames)
+
+
+@router.post("/api/v1/diagnostics/memory/tracing/stop")
+def stop_tracing() -> Dict[str, Any]:
+    """Выключает трассировку и удаляет сохранённые снимки"""
+    bind_log_context(operation="MEMORY_TRACING")
+    return memory_tracer.stop()
+
+
+@router.post("/api/v1/diagnostics/memory/snapshots")
+def take_snapshot() -> Dict[str, Any]:
+    """Сохраняет снимок аллокаций (для top и diff); хранятся последние MEMORY_SNAPSHOTS_MAX"""
+    result = _run(memory_tracer.snapshot)
+    result["process"] = process_memory()
+    result["structures"] = _app_structures()
+    return result
+
+
+@router.get("/api/v1/diagnostics/memory/top")
+def top_allocations(
+    snapshot: Optional[str] = Query(None, description="id сохранённого снимка; без него - текущее состояние"),
+    group_by: Literal[GROUP_BY] = "lineno",
+    limit: int = Query(20, ge=1, le=200)
+) -> Dict[str, Any]:
+    """Места с наибольшим объёмом живых аллокаций (строка кода, файл или стек целиком)"""
+    return _run(memory_tracer.top, snapshot, group_by, limit)
+
+
+@router.get("/api/v1/diagnostics/memory/diff")
+def diff_allocations(
+    base: str = Query(..., description="id снимка - точка отсчёта"),
+    current: Optional[str] = Query(None, description="id более позднего снимка; без него - текущее состояние"),
+    group_by: Literal[GROUP_BY] = "lineno",
+    limit: int = Query(20, ge=1, le=200)
+) -> Dict[str, Any]:
+    """Прирост памяти между снимками по местам аллокаций (сначала наибольший по модулю)"""
+    return _run(memory_tracer.diff, base, current, group_by, limit)
@@ -0,0 +1,90 @@
+from fastapi import APIRouter, Request, HTTPException, Query
+from app.config import logger
+from app.dependencies import get_user_client
+from app.models.bulk import MembershipResult
+from app.models.group import GroupMembership
+from app.services.groups import group_catalog
+from app.services.membership import change_membership
+from app.services.snapshots import report_snapshots
+from app.utils.log import bind_log_context
+from app.utils.serialization import FastJSONResponse
+from typing import Optional, Dict, Any
+
+router = APIRouter()
+
+
+@router.get("/api/v1/groups")
+def list_groups(
+    request: Request,
+    query: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500)
+) -> Dict[str, Any]:
+    """
+    Список групп FreeIPA с пагинацией
+
+    Отдаётся из каталога групп (обновляется раз в GROUP_CATALOG_TTL секунд),
+    `query` - фильтр по подстроке имени. Если ничего не найдено - подсказки похожих имён.
+    """
+    try:
+        client = get_user_client(request)
+        total, groups = group_catalog.page(client, query=query, offset=offset, limit=limit)
+
+        response = {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "groups": groups
+        }
+        if query and total == 0:
+            response["suggestions"] = group_catalog.suggest(client, query)
+
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка получения групп: {str(e)}"
+        )
+
+
+@router.post("/api/v1/groups/bulk-add-members", responses={200: {"model": MembershipResult}})
+def bulk_add_members(membership: GroupMembership, request: Request) -> FastJSONResponse:
+    """
+    Массовое добавление пользователей в группы
+
+    {"users": ["ivan.ivanov", "petr@test.com"], "groups": ["developers", "vpn"]}
+
+    Email определяются по индексу каталога, в FreeIPA уходит один group_add_member
+    на группу (по GROUP_MEMBER_CHUNK пользователей). Результат - по каждой паре
+    (пользователь, группа): added / already_member / failed
+    """
+    client = get_user_client(request)
+    bind_log_context(operation="GROUP_ADD_MEMBERS")
+    logger.warning("GROUP_ADD_MEMBERS: %s users to %s", len(membership.users), membership.groups)
+
+    result = change_membership(client, "add", membership.users, membership.groups)
+    if result["summary"].get("added"):
+        report_snapshots.schedule_rebuild()
+    return FastJSONResponse(result)
+
+
+@router.post("/api/v1/groups/bulk-remove-members", responses={200: {"model": MembershipResult}})
+def bulk_remove_members(membership: GroupMembership, request: Request) -> FastJSONResponse:
+    """
+    Массовое удаление пользователей из групп
+
+    {"users": ["ivan.ivanov", "petr@test.com"], "groups": ["developers"]}
+
+    Результат - по каждой паре (пользователь, группа): removed / not_member / failed
+    """
+    client = get_user_client(request)
+    bind_log_context(operation="GROUP_REMOVE_MEMBERS")
+    logger.warning("GROUP_REMOVE_MEMBERS: %s users from %s", len(membership.users), membership.groups)
+
+    result = change_membership(client, "remove", membership.users, membership.groups)
+    if result["summary"].get("removed"):
+        report_snapshots.schedule_rebuild()
+    return FastJSONResponse(result)
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends
+from app.dependencies import require_admin
+from app.services.admission import admission
+from app.services.cache import user_cache
+from app.services.directory import directory_index
+from app.services.excel_parser import excel_parser
+from app.services.freeipa import ipa_singleflight
+from app.services.groups import group_catalog
+from app.services.limiter import ipa_limiter
+from app.services.mail import mail_sender
+from typing import Dict, Any
+
+router = APIRouter()
+
+
+@router.get("/api/v1/metrics", dependencies=[Depends(require_admin)])
+def metrics() -> Dict[str, Any]:
+    """
+    Метрики процесса (воркера): адаптивный лимит запросов к FreeIPA, допуск тяжёлых запросов и кэши
+
+    Только для членов ADMIN_GROUP (в метриках - методы и задержки FreeIPA, размеры очередей).
+
+    ipa_limiter.limit - текущее число разрешённых одновременных запросов,
+    latency_ms - быстрая EWMA задержки по методам FreeIPA
+    """
+    return {
+        "ipa_limiter": ipa_limiter.metrics(),
+        "admission": admission.metrics(),
+        "ipa_coalescing": ipa_singleflight.metrics(),
+        "user_cache": {"size": len(user_cache), "hits": user_cache.hits, "misses": user_cache.misses},
+        "group_catalog": {"size": len(group_catalog)},
+        "directory_index": {"size": len(directory_index), "age": directory_index.age},
+        "mail": mail_sender.metrics(),
+        "excel_parser": excel_parser.metrics()
+    }
@@ -1,10 +1,97 @@
-from fastapi import APIRouter, Request, HTTPException
+import time
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import APIRouter, Request, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
+from app.config import IPA_USERNAME
 from app.dependencies import get_user_client
-from typing import List, Dict, Any
+from app.services.changes import list_changes, WatermarkExpired
+from app.services.directory import directory_index
+from app.services.snapshots import report_snapshots
+from app.utils.export import export_response, iter_gzip, CSV_BATCH_ROWS
+from app.utils.serialization import dumps
+from app.models.report import UsersTablePage
+from typing import Any, BinaryIO, Dict, Iterator, List, Literal, Optional, Tuple
 
 router = APIRouter()
 
+
+def _get_snapshot(request: Request, fresh: bool) -> Tuple[Dict[str, Any], BinaryIO]:
+    """
+    Последний снимок каталога и его открытый файл. fresh=true или снимка ещё нет - живой скан FreeIPA
+
+    Файл открывается сразу: пересборка, случившаяся во время выгрузки, удалит его
+    из каталога, но не оборвёт чтение.
+    """
+    client = get_user_client(request)
+    snapshot = None if fresh else report_snapshots.open_latest()
+    if snapshot is None:
+        meta = report_snapshots.build(client)
+        snapshot = meta, report_snapshots.open(meta)
+    return snapshot
+
+
+def _cache_headers(meta: Dict[str, Any], variant: str) -> Dict[str, str]:
+    """
+    ETag - id снимка + вариант выгрузки (формат, gzip). Слабый, т.к. тело может
+    дополнительно сжать CompressionMiddleware
+    """
+    return {
+        "ETag": f'W/"{meta["id"]}-{variant}"',
+        "Last-Modified": formatdate(meta["created"], usegmt=True),
+        "Cache-Control": "private, no-cache",
+        "X-Snapshot-Age": str(int(time.time() - meta["created"]))
+    }
+
+
+def _not_modified(request: Request, headers: Dict[str, str]) -> Optional[Response]:
+    """304, если у клиента уже есть эта версия (If-None-Match приоритетнее If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or headers["ETag"].removeprefix("W/") in tags:
+            return Response(status_code=304, headers=headers)
+        return None
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return None
+        if int(parsedate_to_datetime(headers["Last-Modified"]).timestamp()) <= since:
+            return Response(status_code=304, headers=headers)
+    return None
+
+
+def _iter_full_info_json(meta: Dict[str, Any], snapshot: BinaryIO) -> Iterator[bytes]:
+    """Ответ user_find в исходном виде, собранный из строк снимка без декодирования"""
+    yield b'{"result": ['
+    batch = []
+    first = True
+    for line in report_snapshots.iter_raw(snapshot):
+        batch.append(line)
+        if len(batch) == CSV_BATCH_ROWS:
+            yield (b"" if first else b",") + b",".join(batch)
+            batch, first = [], False
+    if batch:
+        yield (b"" if first else b",") + b",".join(batch)
+
+    tail = {"count": meta["count"], "truncated": meta["truncated"], "summary": meta["summary"]}
+    yield b"], " + dumps(tail)[1:]
+
+
+def _iter_full_info_ndjson(snapshot: BinaryIO) -> Iterator[bytes]:
+    """Строки снимка как есть - он уже хранится в NDJSON"""
+    batch = []
+    for line in report_snapshots.iter_raw(snapshot):
+        batch.append(line)
+        if len(batch) == CSV_BATCH_ROWS:
+            yield b"\n".join(batch) + b"\n"
+            batch = []
+    if batch:
+        yield b"\n".join(batch) + b"\n"
+
 @router.post("/api/v1/utils/text-to-json")
 def text_to_json(users_text: str) -> List[str]:
     """
@@ -24,120 +111,202 @@ def text_to_json(users_text: str) -> List[str]:
     ]
     return identifiers
 
-@router.get("/api/v1/users/search-by-email/{email}")
-def search_user_by_email_debug(email: str, request: Request) -> Dict[str, Any]:
+@router.get("/api/v1/report/full-usersgroups-info")
+def fullusersgroupsinfo(
+    request: Request,
+    export_format: Literal["csv", "xlsx", "ndjson"] = Query("csv", alias="format"),
+    gzip: bool = False,
+    fresh: bool = False
+) -> StreamingResponse:
     """
-    Поиск пользователя по email (для отладки)
+    Получение информации о всех пользователях и его группах
 
-    Показывает что именно возвращает FreeIPA при поиске
+    format: csv (по умолчанию), xlsx или ndjson. gzip=true - сжатый файл .gz.
+    Файл формируется построчно из последнего снимка каталога; fresh=1 - живой скан.
+    Поддерживается If-None-Match / If-Modified-Since (304).
     """
     try:
-        client = get_user_client(request)
-
-        # Пробуем разные варианты поиска
-        results = {}
-
-        # 1. Точное совпадение
-        try:
-            search_exact = client._request(
-                "user_find",
-                args=[],
-                params={"mail": email}
-            )
-            results["exact_match"] = {
-                "query": email,
-                "type": str(type(search_exact)),
-                "is_dict": isinstance(search_exact, dict),
-                "is_list": isinstance(search_exact, list),
-                "data": search_exact
-            }
-        except Exception as e:
-            results["exact_match"] = {"error": str(e)}
+        meta, snapshot = _get_snapshot(request, fresh)
+        headers = _cache_headers(meta, f"usersgroups-{export_format}{'-gz' if gzip else ''}")
+        not_modified = _not_modified(request, headers)
+        if not_modified:
+            snapshot.close()
+            return not_modified
 
-        # 2. Lowercase
-        try:
-            search_lower = client._request(
-                "user_find",
-                args=[],
-                params={"mail": email.lower()}
-            )
-            results["lowercase"] = {
-                "query": email.lower(),
-                "type": str(type(search_lower)),
-                "is_dict": isinstance(search_lower, dict),
-                "is_list": isinstance(search_lower, list),
-                "data": search_lower
+        rows = (
+            {
+                "username": user['uid'][0],
+                "email": user.get('mail', [None])[0],
+                "groups": user.get('memberof_group', [])
             }
-        except Exception as e:
-            results["lowercase"] = {"error": str(e)}
-
-        # 3. Поиск по username (если это вдруг username)
-        try:
-            user_show = client._request("user_show", args=[email.split('@')[0]], params={})
-            results["by_username"] = user_show.get('result', {})
-        except Exception as e:
-            results["by_username"] = {"error": str(e)}
+            for user in report_snapshots.iter_records(snapshot)
+        )
 
-        return results
+        response = export_response(
+            ["username", "email", "groups"],
+            rows,
+            export_format,
+            filename="users_groups_report",
+            gzip=gzip,
+            title="Users and groups"
+        )
+        response.headers.update(headers)
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка: {str(e)}"
+        )
 
-@router.get("/api/v1/report/full-usersgroups-info")
-def fullusersgroupsinfo(request: Request) -> StreamingResponse:
+@router.get("/api/v1/report/full-info")
+def full_info(
+    request: Request,
+    export_format: Literal["json", "csv", "xlsx", "ndjson"] = Query("json", alias="format"),
+    gzip: bool = False,
+    fresh: bool = False
+):
     """
     Получение информации о всех пользователях и его группах
+
+    format: json (по умолчанию, ответ FreeIPA как есть), csv, xlsx или ndjson.
+    В csv/xlsx колонки - все встретившиеся атрибуты, многозначные склеены через ';'.
+    Данные из последнего снимка каталога; fresh=1 - живой скан.
+    Поддерживается If-None-Match / If-Modified-Since (304).
     """
     try:
-        client = get_user_client(request)
-        result = client._request("user_find", args=[], params={"all":True})
-
-        user_data = []
-        csv_lines = ["username,email,groups"]
-
-        for user in result['result']:
-            username = user['uid'][0]
-            email = user.get('mail', [None])[0]
-            groups = user.get('memberof_group', [])
-
-            user_info = {
-                "username": username,
-                "email": email,
-                "groups": groups
-            }
-            user_data.append(user_info)
+        meta, snapshot = _get_snapshot(request, fresh)
+        headers = _cache_headers(meta, f"fullinfo-{export_format}{'-gz' if gzip else ''}")
+        not_modified = _not_modified(request, headers)
+        if not_modified:
+            snapshot.close()
+            return not_modified
 
-            email_str = email or ''
-            groups_str = ';'.join(groups)
-            csv_lines.append(f"{username},{email_str},{groups_str}")
+        if export_format in ("json", "ndjson"):
+            # Без декодирования записей: байты снимка уходят клиенту как есть
+            if export_format == "json":
+                chunks = _iter_full_info_json(meta, snapshot)
+                media_type = "application/json"
+            else:
+                chunks = _iter_full_info_ndjson(snapshot)
+                media_type = "application/x-ndjson"
+                headers["Content-Disposition"] = "attachment; filename=users_full_info.ndjson"
+            if gzip:
+                chunks = iter_gzip(chunks)
+                media_type = "application/gzip"
+                headers["Content-Disposition"] = f"attachment; filename=users_full_info.{export_format}.gz"
+            return StreamingResponse(chunks, media_type=media_type, headers=headers)
 
-        csv_content = '\n'.join(csv_lines)
-        return StreamingResponse(
-            iter([csv_content]),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=users_groups_report.csv"}
+        response = export_response(
+            meta["columns"],
+            report_snapshots.iter_records(snapshot),
+            export_format,
+            filename="users_full_info",
+            gzip=gzip,
+            title="Users"
         )
+        response.headers.update(headers)
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка: {str(e)}"
         )
 
-@router.get("/api/v1/report/full-info")
-def full_info(request: Request) -> Dict[str, Any]:
+# Поля, по которым можно сортировать таблицу пользователей
+USERS_TABLE_SORT_FIELDS = ("uid", "mail", "cn", "title", "enabled")
+
+
+@router.get("/api/v1/report/users", response_model=UsersTablePage)
+def users_table(
+    request: Request,
+    q: Optional[str] = Query(None, description="Начало uid, email, ФИО или должности"),
+    group: Optional[str] = None,
+    enabled: Optional[bool] = None,
+    email_domain: Optional[str] = Query(None, description="Домен email, например company.com"),
+    sort: Literal[USERS_TABLE_SORT_FIELDS] = "uid",
+    order: Literal["asc", "desc"] = "asc",
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500)
+) -> Dict[str, Any]:
     """
-    Получение информации о всех пользователях и его группах
+    Таблица пользователей и групп постранично: фильтры, сортировка и пагинация на сервере
+
+    Обслуживается из индекса каталога в памяти (как /api/v1/users/search) - клиент
+    получает только одну страницу. Пока индекс загружается впервые, запрос ждёт
+    его до 30 секунд, затем 503 с Retry-After. Индекс строит сервисная учётка -
+    без IPA_USERNAME таблица недоступна.
     """
-    try:
-        client = get_user_client(request)
-        result = client._request("user_find", args=[], params={"all":True})
+    get_user_client(request)
 
-        return result
+    if not IPA_USERNAME and not directory_index.loaded:
+        raise HTTPException(status_code=503, detail="Индекс каталога недоступен: не задана сервисная учётка IPA_USERNAME")
 
-    except Exception as e:
+    if not directory_index.ensure_fresh() and not directory_index.wait(30):
         raise HTTPException(
-            status_code=500,
-            detail=f"Ошибка: {str(e)}"
+            status_code=503,
+            detail="Индекс каталога ещё загружается, повторите запрос позже",
+            headers={"Retry-After": "10"}
+        )
+
+    total, users = directory_index.search(
+        q, enabled=enabled, group=group, email_domain=email_domain,
+        sort=sort, descending=order == "desc",
+        offset=(page - 1) * page_size, limit=page_size
+    )
+    return {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "pages": max(1, -(-total // page_size)),
+        "index_age": round(directory_index.age, 1),
+        # Лишние поля записей индекса отбрасывает модель ответа
+        "users": users
+    }
+
+
+@router.get("/api/v1/report/changes")
+def directory_changes(
+    request: Request,
+    watermark: Optional[str] = None,
+    since: Optional[datetime] = None,
+    limit: int = Query(1000, ge=1, le=10000)
+) -> Dict[str, Any]:
+    """
+    Лента изменений каталога: созданные, изменённые, отключённые, включённые и удалённые пользователи
+
+    watermark - значение из предыдущего ответа (непрозрачная строка), since - ISO 8601
+    или unix time для первой синхронизации. Ответ: changes, watermark (передать в
+    следующий запрос), has_more. Изменения через этот API видны сразу, сделанные
+    в FreeIPA напрямую - после очередного снимка каталога (SNAPSHOT_INTERVAL).
+    410 - watermark старше хранимого журнала, нужна полная выгрузка (full-info).
+    """
+    get_user_client(request)
+
+    try:
+        position = int(watermark) if watermark else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Некорректный watermark: {watermark}")
+
+    try:
+        changes, new_watermark, has_more = list_changes(
+            watermark=position,
+            since=since.timestamp() if since else None,
+            limit=limit
+        )
+    except WatermarkExpired:
+        raise HTTPException(
+            status_code=410,
+            detail="Watermark устарел, выполните полную синхронизацию через /api/v1/report/full-info"
         )
+
+    return {
+        "changes": changes,
+        "watermark": str(new_watermark),
+        "has_more": has_more
+    }
@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Request, HTTPException, Query
+from app.dependencies import get_user_client
+from app.services.cache import user_cache
+from app.services.directory import directory_index, slim_user, SEARCH_FIELDS
+from app.models.user import UserSearchPage
+from typing import Optional, Dict, Any, Literal
+
+router = APIRouter()
+
+
+@router.get("/api/v1/users/search", response_model=UserSearchPage)
+def search_users(
+    request: Request,
+    q: Optional[str] = Query(None, description="Строка поиска"),
+    fields: str = Query(",".join(SEARCH_FIELDS), description="Поля через запятую: uid, mail, cn, title"),
+    mode: Literal["prefix", "substring"] = "prefix",
+    enabled: Optional[bool] = None,
+    group: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=200)
+) -> Dict[str, Any]:
+    """
+    Поиск пользователей по uid, mail, cn и title с фильтрами и пагинацией
+
+    Обслуживается из индексированной копии каталога в памяти (обновляется в фоне).
+    Пока индекс не загружен - поиск в FreeIPA через pkey_only запрос,
+    полные записи подгружаются только для текущей страницы.
+    """
+    try:
+        client = get_user_client(request)
+
+        search_fields = tuple(f.strip() for f in fields.split(",") if f.strip() in SEARCH_FIELDS)
+        if not search_fields:
+            raise HTTPException(status_code=400, detail=f"Допустимые поля: {', '.join(SEARCH_FIELDS)}")
+
+        if directory_index.ensure_fresh():
+            total, users = directory_index.search(
+                q, fields=search_fields, mode=mode, enabled=enabled, group=group,
+                offset=offset, limit=limit
+            )
+            return {
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "source": "index",
+                "index_age": round(directory_index.age, 1),
+                "users": users
+            }
+
+        # Индекс ещё строится - ищем напрямую (FreeIPA ищет подстроку по своим полям поиска)
+        params = {"pkey_only": True, "sizelimit": 0}
+        if group:
+            params["in_group"] = group
+        if enabled is not None:
+            params["nsaccountlock"] = not enabled
+
+        result = client._request("user_find", args=[q] if q else [], params=params)
+        uids = sorted(u['uid'][0] for u in result['result'])
+
+        session_id = request.cookies.get("ipa_session")
+        users = []
+        for uid in uids[offset:offset + limit]:
+            user = user_cache.get_or_load(
+                (session_id, uid.lower()),
+                lambda: client._request("user_show", args=[uid], params={"all": True}),
+                tag=uid.lower()
+            )
+            users.append(slim_user(user['result']))
+
+        return {
+            "total": len(uids),
+            "offset": offset,
+            "limit": limit,
+            "source": "ipa",
+            "users": users
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка поиска: {str(e)}"
+        )
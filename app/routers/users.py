@@ -1,14 +1,27 @@
-from fastapi import APIRouter, Request, Form, HTTPException, UploadFile, File
-from app.config import logger
-from app.dependencies import user_sessions, get_user_client
-from app.utils.transliteration import transliterate
+from fastapi import APIRouter, Request, Form, HTTPException, UploadFile, File, Query, Header
+from starlette.concurrency import run_in_threadpool
+from app.config import logger, SMTP_TIMEOUT, IPA_USERNAME
+from app.dependencies import user_sessions, get_user_client, open_bulk_operation, get_session_username, require_mail
+from excel_import.rows import parse_groups
+from excel_import.transliteration import transliterate
 from app.utils.validation import is_valid_email
-from app.utils.excel import parse_excel_row, parse_fio, parse_groups
 from app.services.yopass import create_yopass_link
-from app.models.user import UserCreate
-from typing import Optional, Dict, Any
-import openpyxl
-from io import BytesIO
+from app.services.freeipa import scan_users
+from app.services.deadline import DeadlineExceeded
+from app.services.excel_parser import excel_parser
+from app.services.cache import user_cache, invalidate_user
+from app.services.changes import record_change
+from app.services.snapshots import report_snapshots
+from app.services.bulk import run_bulk, create_user_from_row, CredentialMailer
+from app.services.jobs import start_job
+from app.services.reconcile import build_plan, apply_plan, public_plan, fingerprint_plan
+from app.services.groups import group_catalog
+from app.utils.log import bind_log_context
+from app.utils.export import export_response
+from app.utils.serialization import FastJSONResponse
+from app.models.bulk import BulkJobStarted, BulkResult
+from app.models.user import UserCreate, ExcelValidation, ReconcileResponse
+from typing import Optional, Dict, Any, List, Literal, Tuple
 
 
 router = APIRouter()
@@ -25,8 +38,13 @@ def get_user(username: str, request: Request) -> Dict[str, Any]:
         # Получаем клиент из сессии
         client = get_user_client(request)
         
-        # Получаем информацию о пользователе
-        user = client._request("user_show", args=[username], params={"all": True})
+        # Получаем информацию о пользователе (короткий кэш, сбрасывается при изменениях)
+        session_id = request.cookies.get("ipa_session")
+        user = user_cache.get_or_load(
+            (session_id, username.lower()),
+            lambda: client._request("user_show", args=[username], params={"all": True}),
+            tag=username.lower()
+        )
         return user
         
     except HTTPException:
@@ -49,12 +67,14 @@ def delete_user(username: str, request: Request) -> Dict[str, str]:
     try:
         session_id = request.cookies.get("ipa_session")
         admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.warning(f"USER_DELETE: {username} by {admin}")
+        logger.warning("USER_DELETE: %s by %s", username, admin)
 
         client = get_user_client(request)
         result = client._request("user_del", args=[username], params={})
+        invalidate_user(username)
+        record_change(username, "deleted")
         
-        logger.info(f"USER_DELETE SUCCESS: {username}")
+        logger.info("USER_DELETE SUCCESS: %s", username)
         return {
             "username": username,
             "message": f"Пользователь {username} успешно удалён",
@@ -62,7 +82,7 @@ def delete_user(username: str, request: Request) -> Dict[str, str]:
         }
 
     except Exception as e:
-        logger.error(f"USER_DELETE FAILED: {username} - {str(e)}")
+        logger.error("USER_DELETE FAILED: %s - %s", username, e)
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка удаления пользователя: {str(e)}"
@@ -78,6 +98,8 @@ def disable_user(username: str, request: Request) -> Dict[str, str]:
     try:
         client = get_user_client(request)
         result = client._request("user_disable", args=[username], params={})
+        invalidate_user(username)
+        record_change(username, "disabled")
 
         return {
             "username": username,
@@ -101,6 +123,8 @@ def enable_user(username: str, request: Request) -> Dict[str, str]:
     try:
         client = get_user_client(request)
         result = client._request("user_enable", args=[username], params={})
+        invalidate_user(username)
+        record_change(username, "enabled")
 
         return {
             "username": username,
@@ -128,10 +152,11 @@ def reset_password(username: str, request: Request) -> Dict[str, Any]:
     try:
         session_id = request.cookies.get("ipa_session")
         admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.warning(f"PASSWORD_RESET: {username} by {admin}")
+        logger.warning("PASSWORD_RESET: %s by %s", username, admin)
 
         client = get_user_client(request)
         result = client._request("user_mod", args=[username], params={"random": True})
+        invalidate_user(username)
 
         password = result['result']['randompassword']
 
@@ -145,11 +170,11 @@ def reset_password(username: str, request: Request) -> Dict[str, Any]:
             "message": f"Пароль пользователя {username} успешно сброшен"
         }
 
-        logger.info(f"PASSWORD_RESET SUCCESS: {username}")
+        logger.info("PASSWORD_RESET SUCCESS: %s", username)
         return response
 
     except Exception as e:
-        logger.error(f"PASSWORD_RESET FAILED: {username} - {str(e)}")
+        logger.error("PASSWORD_RESET FAILED: %s - %s", username, e)
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка сброса пароля: {str(e)}"
@@ -182,7 +207,7 @@ def create_user(user: UserCreate, request: Request) -> Dict[str, Any]:
 
         session_id = request.cookies.get("ipa_session")
         admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.info(f"USER_CREATE: {username} ({user.email}) by {admin}")
+        logger.info("USER_CREATE: %s (%s) by %s", username, user.email, admin)
 
         client = get_user_client(request)
 
@@ -202,12 +227,21 @@ def create_user(user: UserCreate, request: Request) -> Dict[str, Any]:
         )
 
         password = result['result']['randompassword']
+        invalidate_user(username)
+        record_change(username, "created")
 
         # Тут вызываю новый метод group_add_member т.к в user_add нет такого функционала
         added_groups = []
         failed_groups = []
 
+        # Несуществующие группы отсекаем по каталогу, без запросов в FreeIPA
+        missing_groups = group_catalog.missing(client, user.groups)
+        for group in missing_groups:
+            failed_groups.append({"group": group, "error": f"Группа не существует: {group_catalog.describe_missing(client, [group])}"})
+
         for group in user.groups:
+            if group in missing_groups:
+                continue
             try:
                 client._request(
                     "group_add_member",
@@ -217,6 +251,7 @@ def create_user(user: UserCreate, request: Request) -> Dict[str, Any]:
                 added_groups.append(group)
             except Exception as e:
                 failed_groups.append({"group": group, "error": str(e)})
+        invalidate_user(username)
 
         response = {
             "username": username,
@@ -231,8 +266,10 @@ def create_user(user: UserCreate, request: Request) -> Dict[str, Any]:
             if len(added_groups) == 0:
                 try:
                     client._request("user_del", args=[username], params={})
+                    invalidate_user(username)
+                    record_change(username, "deleted")
                 except Exception as e:
-                    logger.warning(f"Failed to delete user {username} during rollback: {e}")
+                    logger.warning("Failed to delete user %s during rollback: %s", username, e)
 
                 raise HTTPException(
                     status_code=500,
@@ -245,13 +282,13 @@ def create_user(user: UserCreate, request: Request) -> Dict[str, Any]:
                 "failed": failed_groups
             }
 
-        logger.info(f"USER_CREATE SUCCESS: {username} with groups {added_groups}")
+        logger.info("USER_CREATE SUCCESS: %s with groups %s", username, added_groups)
         return response
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"USER_CREATE FAILED: {username} - {str(e)}")
+        logger.error("USER_CREATE FAILED: %s - %s", username, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/api/v1/users/create-form")
@@ -294,6 +331,8 @@ def create_user_form(
         )
 
         password = result['result']['randompassword']
+        invalidate_user(username)
+        record_change(username, "created")
 
         added_groups = []
         failed_groups = []
@@ -303,7 +342,13 @@ def create_user_form(
         if groups and groups.strip(): # Проверяю что groups не null
             groups_list = [g.strip() for g in groups.split(',') if g.strip()]   # тут split убирает пробелы т.к 100 процентов будут ошибки и split чтобы разбивать если несколько групп то есть ["admins", "dev", "ops"]
 
+        missing_groups = group_catalog.missing(client, groups_list)
+        for group in missing_groups:
+            failed_groups.append({"group": group, "error": f"Группа не существует: {group_catalog.describe_missing(client, [group])}"})
+
         for group in groups_list:
+            if group in missing_groups:
+                continue
             try:
                 client._request(
                     "group_add_member",
@@ -313,6 +358,7 @@ def create_user_form(
                 added_groups.append(group)
             except Exception as e:
                 failed_groups.append({"group": group, "error": str(e)})
+        invalidate_user(username)
 
         response = {
             "username": username,
@@ -325,8 +371,10 @@ def create_user_form(
             if len(added_groups) == 0:
                 try:
                     client._request("user_del", args=[username], params={})
+                    invalidate_user(username)
+                    record_change(username, "deleted")
                 except Exception as e:
-                    logger.warning(f"Failed to delete user {username} during rollback: {e}")
+                    logger.warning("Failed to delete user %s during rollback: %s", username, e)
                 raise HTTPException(
                     status_code=500,
                     detail=f"Пользователь создан, но не удалось добавить ни в одну группу. Пользователь удален. Ошибки: {failed_groups}"
@@ -403,8 +451,26 @@ def search_user_by_email(email: str, request: Request) -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/api/v1/users/validate-excel")
-async def validate_excel(request: Request, file: UploadFile = File(...)):
+def existing_logins_and_emails(client) -> Tuple[set, set]:
+    """Логины и email (в нижнем регистре) всех пользователей каталога"""
+    usernames = set()
+    emails = set()
+    for user in scan_users(client):
+        usernames.add(user['uid'][0])
+        # Собираем существующие email (безопасно)
+        mail = user.get('mail')
+        if mail and isinstance(mail, list) and len(mail) > 0 and mail[0]:
+            emails.add(mail[0].lower())
+    return usernames, emails
+
+
+def missing_group_hints(client, groups: List[str]) -> Dict[str, str]:
+    """Группы из списка, которых нет в FreeIPA -> текст ошибки с подсказками (каталог может обновиться)"""
+    return {name: group_catalog.describe_missing(client, [name]) for name in group_catalog.missing(client, groups)}
+
+
+@router.post("/api/v1/users/validate-excel", responses={200: {"model": ExcelValidation}})
+async def validate_excel(request: Request, file: UploadFile = File(...)) -> FastJSONResponse:
     """
     Валидация Excel файла перед массовым созданием пользователей
 
@@ -424,45 +490,28 @@ async def validate_excel(request: Request, file: UploadFile = File(...)):
 
         session_id = request.cookies.get("ipa_session")
         admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.info(f"VALIDATE_EXCEL: Started by {admin}")
+        bind_log_context(operation="VALIDATE_EXCEL")
+        logger.info("VALIDATE_EXCEL: Started by %s", admin)
 
-        # Читаем Excel файл
+        # Читаем Excel файл и разбираем его в пуле процессов (не в event loop)
         contents = await file.read()
-        workbook = openpyxl.load_workbook(BytesIO(contents))
-        sheet = workbook.active
+        rows = await excel_parser.parse(file.filename, contents)
 
         conflicts = []
         warnings = []
         would_create = 0
         emails_in_file = {}  # Для отслеживания дубликатов внутри файла
 
-        # Получаем список всех существующих пользователей из FreeIPA
-        existing_users = client._request("user_find", args=[], params={"all": True})
-        existing_usernames = {u['uid'][0] for u in existing_users['result']}
-
-        # Собираем существующие email (безопасно)
-        existing_emails = set()
-        for u in existing_users['result']:
-            mail = u.get('mail')
-            if mail and isinstance(mail, list) and len(mail) > 0 and mail[0]:
-                existing_emails.add(mail[0].lower())
-
-        # Кэш для проверки групп (чтобы не проверять одну группу несколько раз)
-        groups_cache = {}
-
-        # Проходим по строкам
-        for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            # Пропускаем пустые строки
-            if not row or not row[0]:
-                continue
+        # Все существующие логины и email из FreeIPA (полный скан - обрезанный
+        # ответ user_find пропустил бы конфликты); скан - в пуле потоков, не в event loop
+        existing_usernames, existing_emails = await run_in_threadpool(existing_logins_and_emails, client)
+        # Группы всех строк проверяются разом: холодный каталог - это group_find, тоже в пуле потоков
+        file_groups = sorted({group for _, values, _ in rows for group in parse_groups(values[4])})
+        missing_groups = await run_in_threadpool(missing_group_hints, client, file_groups) if file_groups else {}
 
+        # Проходим по строкам (пустые строки уже пропущены, значения нормализованы)
+        for row_num, (fio, email, phone, title, groups_str), username in rows:
             try:
-                # Извлекаем данные
-                fio = str(row[0]).strip() if row[0] else ""
-                email = str(row[1]).strip() if len(row) > 1 and row[1] else ""
-                phone = str(row[2]).strip() if len(row) > 2 and row[2] else None
-                title = str(row[3]).strip() if len(row) > 3 and row[3] else None
-                groups_str = str(row[4]).strip() if len(row) > 4 and row[4] else ""
 
                 # Проверка 1: ФИО заполнено
                 if not fio:
@@ -501,9 +550,8 @@ async def validate_excel(request: Request, file: UploadFile = File(...)):
                     continue
                 emails_in_file[email_lower] = row_num
 
-                # Парсим ФИО
-                fio_parts = fio.split()
-                if len(fio_parts) < 2:
+                # username из ФИО сгенерирован при разборе файла
+                if not username:
                     conflicts.append({
                         "row": row_num,
                         "fio": fio,
@@ -511,14 +559,6 @@ async def validate_excel(request: Request, file: UploadFile = File(...)):
                     })
                     continue
 
-                last_name = fio_parts[0]
-                first_name = fio_parts[1]
-
-                # Генерируем username
-                last_name_en = transliterate(last_name).lower()
-                first_name_en = transliterate(first_name).lower()
-                username = f"{first_name_en}.{last_name_en}"
-
                 # Проверка 5 и 6: Собираем все конфликты для этой строки
                 row_errors = []
 
@@ -543,27 +583,15 @@ async def validate_excel(request: Request, file: UploadFile = File(...)):
 
                 # Проверка 7: Существование групп
                 if groups_str:
-                    groups_list = [g.strip() for g in groups_str.split(',') if g.strip()]
-                    non_existing_groups = []
-
-                    for group in groups_list:
-                        # Проверяем кэш
-                        if group not in groups_cache:
-                            try:
-                                client._request("group_show", args=[group])
-                                groups_cache[group] = True
-                            except Exception:
-                                groups_cache[group] = False
-
-                        if not groups_cache[group]:
-                            non_existing_groups.append(group)
+                    groups_list = parse_groups(groups_str)
+                    non_existing_groups = [group for group in groups_list if group in missing_groups]
 
                     if non_existing_groups:
                         conflicts.append({
                             "row": row_num,
                             "fio": fio,
                             "username": username,
-                            "error": f"Группы не существуют: {', '.join(non_existing_groups)}"
+                            "error": f"Группы не существуют: {', '.join(missing_groups[group] for group in non_existing_groups)}"
                         })
                         continue
 
@@ -595,7 +623,7 @@ async def validate_excel(request: Request, file: UploadFile = File(...)):
                 })
 
         # Формируем результат
-        total_rows = sheet.max_row - 1  # Минус заголовок
+        total_rows = len(rows)  # Без заголовка и пустых строк
         valid = len(conflicts) == 0
 
         result = {
@@ -608,198 +636,263 @@ async def validate_excel(request: Request, file: UploadFile = File(...)):
             "warnings": warnings
         }
 
-        logger.info(f"VALIDATE_EXCEL: Completed by {admin} - Valid: {valid}, Would create: {would_create}, Conflicts: {len(conflicts)}")
-        return result
+        logger.info("VALIDATE_EXCEL: Completed by %s - Valid: %s, Would create: %s, Conflicts: %s", admin, valid, would_create, len(conflicts))
+        return FastJSONResponse(result)
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
-        logger.error(f"VALIDATE_EXCEL: Critical error - {str(e)}")
+        logger.error("VALIDATE_EXCEL: Critical error - %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка валидации Excel файла: {str(e)}"
         )
 
-@router.post("/api/v1/users/bulk-create-from-excel")
-async def bulk_create_from_excel(request: Request, file: UploadFile = File(...)) -> Dict[str, Any]:
+# Колонки XLSX с результатами массового создания (пароли в файл не пишем - только Yopass ссылки)
+BULK_CREATE_RESULT_COLUMNS = ["row", "status", "fio", "username", "email", "yopass_link", "groups_added", "groups_failed", "delivery", "error"]
+
+
+def bulk_create_result_rows(results: Dict[str, Any]):
+    """Строки отчёта по результатам bulk_create_from_excel"""
+    for entry in results["success"]:
+        groups = entry.get("groups", {})
+        yield {
+            **entry,
+            "status": "created",
+            "groups_added": groups.get("added", []),
+            "groups_failed": [f"{g['group']}: {g['error']}" for g in groups.get("failed", [])],
+            "delivery": entry.get("delivery", {}).get("status")
+        }
+    for entry in results["failed"]:
+        yield {**entry, "status": "failed"}
+
+
+async def excel_create_items(filename: str, contents: bytes) -> List[Tuple[str, Tuple[int, tuple]]]:
+    """Строки Excel для run_bulk: (номер строки, (номер строки, значения)), без заголовка и пустых строк"""
+    rows = await excel_parser.parse(filename, contents)
+    return [(str(row_num), (row_num, values)) for row_num, values, _ in rows]
+
+
+def create_from_excel_item(client, item: Tuple[int, tuple], resuming: bool = False):
+    return create_user_from_row(client, *item, resuming=resuming)
+
+
+@router.post("/api/v1/users/bulk-create-from-excel", responses={200: {"model": BulkResult}})
+async def bulk_create_from_excel(
+    request: Request,
+    file: UploadFile = File(...),
+    export_format: Literal["json", "xlsx"] = Query("json", alias="format"),
+    send_email: bool = False,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+) -> FastJSONResponse:
     """
     Парсинг excel и создание пользователя
+
+    format=xlsx - вернуть результаты файлом Excel (без паролей, только Yopass ссылки)
+    send_email=true - отправить Yopass ссылку на email из строки (SMTP), статус письма -
+    в поле delivery
+    Idempotency-Key - повторная отправка того же файла с тем же ключом продолжит
+    прерванную операцию: уже созданные строки не создаются повторно
     """
     try:
         # Сначала проверяем авторизацию (до чтения файла!)
         client = get_user_client(request)
+        if send_email:
+            require_mail()
 
         session_id = request.cookies.get("ipa_session")
         admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.info(f"BULK_CREATE_EXCEL: Started by {admin}")
+        bind_log_context(operation="BULK_CREATE_EXCEL")
+        logger.info("BULK_CREATE_EXCEL: Started by %s", admin)
 
         # Читаем Excel файл (только если авторизован)
         contents = await file.read()
-        workbook = openpyxl.load_workbook(BytesIO(contents)) # превращаем биты в читаемый файл
-        sheet = workbook.active # Активный листы
+        rows = await excel_create_items(file.filename, contents)
 
         # Проверяем доступность Yopass ДО начала создания пользователей
         try:
-            test_link = create_yopass_link("test", "test123")
-            logger.info(f"BULK_CREATE_EXCEL: Yopass check OK - {test_link}")
+            test_link = await run_in_threadpool(create_yopass_link, "test", "test123")
+            logger.info("BULK_CREATE_EXCEL: Yopass check OK - %s", test_link)
         except Exception as e:
-            logger.error(f"BULK_CREATE_EXCEL: Yopass unavailable - {str(e)}")
+            logger.error("BULK_CREATE_EXCEL: Yopass unavailable - %s", e)
             raise HTTPException(
                 status_code=503,
                 detail=f"Yopass недоступен: {str(e)}. Создание пользователей отменено."
             )
 
-        results = {"success": [], "failed": []}
-
-        # Проходим по строкам (пропускаем первую - заголовки)
-        for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            # Пропускаем пустые строки
-            if not row or not row[0]:
-                continue
-
-            try:
-                # Парсим строку Excel
-                data = parse_excel_row(row)
-                fio = data["fio"]
-                email = data["email"]
-
-                # Валидация обязательных полей
-                if not fio:
-                    results["failed"].append({"row": row_num, "error": "ФИО не заполнено"})
-                    continue
-
-                if not email:
-                    results["failed"].append({"row": row_num, "fio": fio, "error": "Email не заполнен"})
-                    continue
+        operation = await run_in_threadpool(open_bulk_operation, request, "bulk-create-from-excel", contents, idempotency_key)
+        logger.info("BULK_CREATE_EXCEL: Operation %s", operation.id)
+
+        mailer = CredentialMailer(client, operation, "create") if send_email else None
+        # Создание идёт в пуле потоков - event loop продолжает обслуживать другие запросы
+        results = await run_in_threadpool(run_bulk, client, operation, rows, create_from_excel_item, after_item=mailer)
+        if mailer is not None:
+            await run_in_threadpool(mailer.wait, SMTP_TIMEOUT)
+
+        logger.info("BULK_CREATE_EXCEL: Completed by %s - Success: %s, Failed: %s", admin, len(results['success']), len(results['failed']))
+        if results["success"]:
+            report_snapshots.schedule_rebuild()
+
+        if export_format == "xlsx":
+            return export_response(
+                BULK_CREATE_RESULT_COLUMNS,
+                bulk_create_result_rows(results),
+                "xlsx",
+                filename="bulk_create_results",
+                title="Results"
+            )
 
-                if not is_valid_email(email):
-                    results["failed"].append({"row": row_num, "fio": fio, "error": f"Невалидный email: {email}"})
-                    continue
+        return FastJSONResponse(results)
 
-                # Парсим ФИО
-                fio_parsed = parse_fio(fio)
-                if not fio_parsed:
-                    results["failed"].append({"row": row_num, "fio": fio, "error": "ФИО должно содержать минимум Фамилию и Имя"})
-                    continue
+    except (HTTPException, DeadlineExceeded):
+        raise
+    except Exception as e:
+        logger.error("BULK_CREATE_EXCEL: Critical error - %s", e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка обработки Excel файла: {str(e)}"
+        )
 
-                last_name, first_name, username = fio_parsed
 
-                # Собираем все ошибки валидации для этой строки
-                row_errors = []
+@router.post("/api/v1/users/bulk-jobs/create-from-excel", status_code=202, response_model=BulkJobStarted)
+async def start_bulk_create_job(
+    request: Request,
+    file: UploadFile = File(...),
+    send_email: bool = False,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+) -> Dict[str, Any]:
+    """
+    Массовое создание из Excel в фоне
 
-                # Проверка: Username уже существует в FreeIPA
-                try:
-                    client._request("user_show", args=[username])
-                    # Если не упало - значит пользователь существует
-                    row_errors.append(f"Username '{username}' уже существует в FreeIPA")
-                except Exception:
-                    # Пользователь не найден - можно создавать
-                    pass
+    Сразу возвращает operation_id и число строк; результаты по строкам -
+    GET /api/v1/bulk-operations/{id}/progress (без паролей, только Yopass ссылки),
+    остановка - POST /api/v1/bulk-operations/{id}/cancel.
+    send_email=true - Yopass ссылки уходят на email из строк (статус - поле delivery)
+    """
+    try:
+        client = get_user_client(request)
+        if send_email:
+            require_mail()
+        bind_log_context(operation="BULK_CREATE_EXCEL")
 
-                # Проверка: Email уже существует в FreeIPA
-                try:
-                    # Ищем пользователей с таким email
-                    email_check = client._request("user_find", args=[], params={"mail": email})
-                    if email_check['result']:
-                        # Найден пользователь с таким email
-                        existing_username = email_check['result'][0]['uid'][0]
-                        row_errors.append(f"Email '{email}' уже используется пользователем {existing_username}")
-                except Exception:
-                    # Ошибка поиска - игнорируем и продолжаем
-                    pass
-
-                # Парсим группы
-                groups_list = parse_groups(data["groups_str"])
-
-                # Проверка: Существование всех групп
-                if groups_list:
-                    non_existing_groups = []
-                    for group in groups_list:
-                        try:
-                            client._request("group_show", args=[group])
-                        except Exception:
-                            non_existing_groups.append(group)
+        contents = await file.read()
+        rows = await excel_create_items(file.filename, contents)
 
-                    if non_existing_groups:
-                        row_errors.append(f"Группы не существуют: {', '.join(non_existing_groups)}")
+        # Проверка Yopass (подпроцесс) и журнал операций (SQLite) - в пуле потоков, не в event loop
+        try:
+            await run_in_threadpool(create_yopass_link, "test", "test123")
+        except Exception as e:
+            logger.error("BULK_CREATE_EXCEL: Yopass unavailable - %s", e)
+            raise HTTPException(
+                status_code=503,
+                detail=f"Yopass недоступен: {str(e)}. Создание пользователей отменено."
+            )
 
-                # Если есть любые ошибки валидации - не создаём пользователя
-                if row_errors:
-                    results["failed"].append({
-                        "row": row_num,
-                        "fio": fio,
-                        "username": username,
-                        "email": email,
-                        "error": "; ".join(row_errors)
-                    })
-                    continue
+        operation = await run_in_threadpool(open_bulk_operation, request, "bulk-create-from-excel", contents, idempotency_key)
+
+        def on_finish(results: Dict[str, Any]) -> None:
+            if results["success"]:
+                report_snapshots.schedule_rebuild()
+
+        return await run_in_threadpool(
+            start_job,
+            client,
+            operation,
+            "BULK_CREATE_EXCEL",
+            get_session_username(request),
+            rows,
+            create_from_excel_item,
+            on_finish,
+            after_item=CredentialMailer(client, operation, "create") if send_email else None
+        )
 
-                # Создаём пользователя в FreeIPA
-                result = client._request(
-                    "user_add",
-                    args=[username],
-                    params={
-                        "givenname": first_name,
-                        "sn": last_name,
-                        "cn": fio,
-                        "mail": email,
-                        "title": data["title"],
-                        "telephonenumber": data["phone"],
-                        "random": True,
-                    }
-                )
+    except (HTTPException, DeadlineExceeded):
+        raise
+    except Exception as e:
+        logger.error("BULK_CREATE_EXCEL: Critical error - %s", e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка обработки Excel файла: {str(e)}"
+        )
 
-                password = result['result']['randompassword']
 
-                yopass_link = create_yopass_link(username, password)
+@router.post("/api/v1/users/reconcile", responses={200: {"model": ReconcileResponse}})
+async def reconcile_users(
+    request: Request,
+    file: UploadFile = File(...),
+    apply: bool = False,
+    disable_missing: bool = False,
+    scope_group: Optional[str] = None,
+    plan_fingerprint: Optional[str] = None
+) -> FastJSONResponse:
+    """
+    Приведение каталога к списку сотрудников из шаблона (XLSX или CSV)
+
+    Файл - желаемое состояние: недостающие пользователи создаются, у существующих
+    обновляются title / телефон / email и членство в группах, упомянутых в файле.
+    disable_missing=true - отключить включённых участников scope_group, которых нет
+    в файле (без scope_group не разрешено: иначе под отключение попал бы весь каталог).
+
+    По умолчанию только возвращает план (что изменится) и его plan_fingerprint;
+    apply=true&plan_fingerprint=... - выполняет его, делая только реально нужные
+    вызовы FreeIPA. Если за это время изменился каталог или файл, план строится
+    заново и не совпадает с показанным - 409, ничего не применяется. Повторный
+    запуск с тем же файлом даёт пустой план.
+    """
+    try:
+        client = get_user_client(request)
+        if disable_missing and not scope_group:
+            raise HTTPException(
+                status_code=400,
+                detail="disable_missing требует scope_group - группу, состав которой задаёт файл"
+            )
+        if apply and not plan_fingerprint:
+            raise HTTPException(
+                status_code=400,
+                detail="apply=true требует plan_fingerprint из ответа сверки без apply"
+            )
+        admin = get_session_username(request)
+        bind_log_context(operation="RECONCILE")
 
-                # Добавляем в группы
-                added_groups = []
-                failed_groups = []
+        contents = await file.read()
+        rows = [(row_num, values) for row_num, values, _ in await excel_parser.parse(file.filename, contents)]
 
-                for group in groups_list:
-                    try:
-                        client._request(
-                            "group_add_member",
-                            args=[group],
-                            params={"user": username}
-                        )
-                        added_groups.append(group)
-                    except Exception as e:
-                        failed_groups.append({"group": group, "error": str(e)})
+        plan = await run_in_threadpool(build_plan, client, rows, disable_missing, scope_group, {admin, IPA_USERNAME})
+        logger.info("RECONCILE: Plan by %s - %s", admin, plan["summary"])
+        response = {"applied": False, "plan": public_plan(plan), "plan_fingerprint": fingerprint_plan(plan)}
+        if not apply:
+            return FastJSONResponse(response)
 
-                # Если валидация прошла успесното добавляем сюда
-                success_entry = {
-                    "row": row_num,
-                    "fio": fio,
-                    "username": username,
-                    "email": email,
-                    "password": password,
-                    "yopass_link": yopass_link
-                }
-
-                if groups_list:
-                    success_entry["groups"] = {
-                        "added": added_groups,
-                        "failed": failed_groups
-                    }
-
-                results["success"].append(success_entry)
-                logger.info(f"BULK_CREATE_EXCEL: Created {username} from row {row_num}")
+        if response["plan_fingerprint"] != plan_fingerprint:
+            logger.warning("RECONCILE: Plan by %s changed since it was reviewed, not applied", admin)
+            raise HTTPException(
+                status_code=409,
+                detail="План изменился с момента просмотра (каталог или файл отличаются). Получите план заново"
+            )
 
+        if plan["create"]:
+            try:
+                await run_in_threadpool(create_yopass_link, "test", "test123")
             except Exception as e:
-                results["failed"].append({
-                    "row": row_num,
-                    "fio": fio if 'fio' in locals() else "unknown",
-                    "error": str(e)
-                })
-                logger.error(f"BULK_CREATE_EXCEL: Failed row {row_num} - {str(e)}")
-
-        logger.info(f"BULK_CREATE_EXCEL: Completed by {admin} - Success: {len(results['success'])}, Failed: {len(results['failed'])}")
+                logger.error("RECONCILE: Yopass unavailable - %s", e)
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"Yopass недоступен: {str(e)}. Изменения не применены."
+                )
 
-        return results
+        response["applied"] = True
+        response["result"] = await run_in_threadpool(apply_plan, client, plan)
+        if response["result"]["created"] or response["result"]["changed_users"]:
+            report_snapshots.schedule_rebuild()
+        return FastJSONResponse(response)
 
+    except (HTTPException, DeadlineExceeded):
+        raise
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV должен быть в кодировке UTF-8")
     except Exception as e:
-        logger.error(f"BULK_CREATE_EXCEL: Critical error - {str(e)}")
+        logger.error("RECONCILE: Critical error - %s", e)
         raise HTTPException(
             status_code=500,
-            detail=f"Ошибка обработки Excel файла: {str(e)}"
+            detail=f"Ошибка сверки пользователей: {str(e)}"
         )
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Form, HTTPException
 from fastapi.responses import PlainTextResponse
 import subprocess
-from app.config import logger, YOPASS, YOPASS_URL
+from app.config import logger, YOPASS, YOPASS_URL, YOPASS_TIMEOUT
+from app.services.deadline import call_timeout
 
 router = APIRouter()
 
@@ -20,20 +21,27 @@ def generate_yopass_link(data: str = Form()):
             input=data,
             capture_output=True,
             text=True,
-            check=True
+            check=True,
+            timeout=call_timeout(YOPASS_TIMEOUT)
         )
-        logger.info(f"Ссылка успешно сгенерирована")
+        logger.info("Ссылка успешно сгенерирована")
         return result.stdout.strip()
 
         
     except subprocess.CalledProcessError as e:
-        logger.error(f"Ошибка - {str(e)}")
+        logger.error("Ошибка - %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка {e.stderr}"
         )
-    except FileNotFoundError:
-        logger.error(f"Yopass binary не найден. Проверьте путь - {str(e)}")
+    except subprocess.TimeoutExpired:
+        logger.error("Yopass не ответил за %.0fс", YOPASS_TIMEOUT)
+        raise HTTPException(
+            status_code=504,
+            detail="Yopass не ответил вовремя"
+        )
+    except FileNotFoundError as e:
+        logger.error("Yopass binary не найден. Проверьте путь - %s", e)
         raise HTTPException(
             status_code=500,
             detail="Yopass binary не найден. Проверьте путь"
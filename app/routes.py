@@ -1,10 +1,15 @@
 from fastapi import FastAPI
-from app.routers import auth, users, bulk, reports, yopass, templates
+from app.routers import auth, users, bulk, reports, yopass, templates, groups, search, metrics, diagnostics
 
 def setup_routes(app: FastAPI) -> None:
     app.include_router(auth.router, tags=["Authentication"])
+    # search раньше users: иначе /api/v1/users/search поймает /api/v1/users/{username}
+    app.include_router(search.router, tags=["Users - Search"])
     app.include_router(users.router, tags=["Users - CRUD"])
     app.include_router(bulk.router, tags=["Users - Bulk"])
+    app.include_router(groups.router, tags=["Groups"])
     app.include_router(reports.router, tags=["Analytics"])
     app.include_router(yopass.router, tags=["Yopass"])
-    app.include_router(templates.router, tags=["Template"])
\ No newline at end of file
+    app.include_router(templates.router, tags=["Template"])
+    app.include_router(metrics.router, tags=["Metrics"])
+    app.include_router(diagnostics.router, tags=["Diagnostics"])
\ No newline at end of file
@@ -0,0 +1,173 @@
+import asyncio
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict
+from app.config import (
+    logger, ADMISSION_HEAVY_GLOBAL, ADMISSION_HEAVY_PER_SESSION, ADMISSION_QUEUE_SIZE,
+    ADMISSION_SESSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER
+)
+
+# Класс текущего запроса: interactive | heavy. Выставляется middleware допуска,
+# через контекст доходит до потоков запроса (ipa_limiter пропускает interactive вперёд)
+request_class_var: ContextVar[str] = ContextVar("request_class", default="interactive")
+
+# Тяжёлые ручки: массовые операции, сверка, проверка Excel, полные выгрузки.
+# Запуск фоновых bulk-jobs - лёгкий (сами операции ограничены BULK_JOB_WORKERS)
+HEAVY_PREFIXES = (
+    "/api/v1/users/bulk-",
+    "/api/v1/users/validate-excel",
+    "/api/v1/users/reconcile",
+    "/api/v1/groups/bulk-",
+    "/api/v1/report/full-",
+)
+LIGHT_PREFIXES = ("/api/v1/users/bulk-jobs",)
+
+
+def classify(method: str, path: str) -> str:
+    """interactive или heavy"""
+    if path.startswith(HEAVY_PREFIXES) and not path.startswith(LIGHT_PREFIXES):
+        return "heavy"
+    return "interactive"
+
+
+class AdmissionRejected(Exception):
+    """Очередь тяжёлых запросов переполнена или ожидание истекло - 429 + Retry-After"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Допуск тяжёлых запросов (на процесс, в event loop)
+
+    - одновременно не больше `global_limit` тяжёлых запросов и `session_limit` от одной сессии
+    - остальные ждут в очереди своей сессии; освободившийся слот получает следующая
+      по кругу сессия (round-robin), а не тот, кто прислал больше запросов - импорт
+      на 10 тысяч строк не отодвигает одиночную выгрузку другого администратора
+    - очередь ограничена (`queue_size` всего, `session_queue_size` на сессию) и
+      временем ожидания `queue_timeout`; сверх этого - AdmissionRejected (429)
+
+    Интерактивные запросы через допуск не проходят.
+    """
+
+    def __init__(self, global_limit: int, session_limit: int, queue_size: int,
+                 session_queue_size: int, queue_timeout: float, retry_after: int):
+        self.global_limit = max(1, global_limit)
+        self.session_limit = max(1, session_limit)
+        self.queue_size = queue_size
+        self.session_queue_size = session_queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._running: Dict[str, int] = {}
+        self._total = 0
+        # Сессия -> ожидающие (в порядке круга: обслуженная сессия уходит в конец)
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _can_start(self, session: str) -> bool:
+        return self._total < self.global_limit and self._running.get(session, 0) < self.session_limit
+
+    def _start(self, session: str) -> None:
+        self._running[session] = self._running.get(session, 0) + 1
+        self._total += 1
+        self.admitted += 1
+
+    def _dispatch(self) -> None:
+        """Раздаёт свободные слоты ожидающим по кругу сессий"""
+        while self._total < self.global_limit:
+            for session in self._queues:
+                if self._running.get(session, 0) < self.session_limit:
+                    break
+            else:
+                return
+            waiters = self._queues[session]
+            future = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            self._start(session)
+            future.set_result(True)
+
+    def _remove_waiter(self, session: str, future: asyncio.Future) -> None:
+        waiters = self._queues.get(session)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self._queued -= 1
+            if not waiters:
+                del self._queues[session]
+
+    async def acquire(self, session: str) -> None:
+        """Ждёт слот для тяжёлого запроса сессии; после запроса - release(session)"""
+        if session not in self._queues and self._can_start(session):
+            self._start(session)
+            return
+
+        if self._queued >= self.queue_size or len(self._queues.get(session, ())) >= self.session_queue_size:
+            self.rejected += 1
+            logger.warning("ADMISSION: Queue full (%s queued, %s running), rejected", self._queued, self._total)
+            raise AdmissionRejected("Слишком много тяжёлых запросов, повторите позже", self.retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session, deque()).append(future)
+        self._queued += 1
+        self.queued_total += 1
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Клиент ушёл, пока ждал
+            if future.done():
+                self.release(session)
+            else:
+                self._remove_waiter(session, future)
+            raise
+
+        if not future.done():
+            self._remove_waiter(session, future)
+            self.timeouts += 1
+            logger.warning("ADMISSION: Waited %.0fs without a slot, rejected", self.queue_timeout)
+            raise AdmissionRejected(
+                f"Тяжёлый запрос не дождался очереди за {self.queue_timeout:.0f}с, повторите позже",
+                self.retry_after
+            )
+
+    def release(self, session: str) -> None:
+        running = self._running.get(session, 0) - 1
+        if running > 0:
+            self._running[session] = running
+        else:
+            self._running.pop(session, None)
+        self._total -= 1
+        self._dispatch()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "global_limit": self.global_limit,
+            "session_limit": self.session_limit,
+            "running": self._total,
+            "queued": self._queued,
+            "sessions_waiting": len(self._queues),
+            "admitted_total": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected_total": self.rejected,
+            "timeouts_total": self.timeouts
+        }
+
+
+admission = AdmissionController(
+    global_limit=ADMISSION_HEAVY_GLOBAL,
+    session_limit=ADMISSION_HEAVY_PER_SESSION,
+    queue_size=ADMISSION_QUEUE_SIZE,
+    session_queue_size=ADMISSION_SESSION_QUEUE_SIZE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    retry_after=ADMISSION_RETRY_AFTER
+)
@@ -0,0 +1,397 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+from python_freeipa import Client
+from python_freeipa.exceptions import AlreadyActive, AlreadyInactive, NotFound
+from app.config import logger
+from app.services.cache import invalidate_user
+from app.services.changes import record_change
+from app.services.checkpoints import BulkOperation
+from app.services.deadline import stop_reason
+from app.services.directory import _first
+from app.services.freeipa import resolve_username
+from app.services.groups import group_catalog
+from app.services.inflight import hold_operation
+from app.services.mail import MailTicket, mail_sender, wait_all
+from app.services.yopass import create_yopass_link
+from excel_import.rows import parse_excel_row, parse_fio, parse_groups
+from app.utils.validation import is_valid_email
+
+# ("success" | "failed", запись результата)
+ItemResult = Tuple[str, Dict[str, Any]]
+
+
+def _apply_to_user(client: Client, identifier: str, command: str, change: str, log_name: str,
+                   error_prefix: str, done_error: Type[Exception], resuming: bool) -> ItemResult:
+    """
+    Одна команда над пользователем (user_del / user_disable / user_enable)
+
+    resuming - прошлая попытка прервалась на этом элементе: ошибка done_error
+    ("не найден" / "уже отключён" / "уже включён") значит, что команда успела выполниться.
+    Для удаления по email это видно уже при поиске: пользователя с таким email больше нет.
+    """
+    try:
+        # Находим username (по email или напрямую)
+        try:
+            username = resolve_username(client, identifier)
+        except (ValueError, NotFound):
+            if not (resuming and done_error is NotFound):
+                raise
+            logger.info("%s: %s already done before interruption", log_name, identifier)
+            return "success", {"identifier": identifier, "username": None}
+
+        try:
+            client._request(command, args=[username], params={})
+        except done_error:
+            if not resuming:
+                raise
+        invalidate_user(username)
+        record_change(username, change)
+        logger.info("%s: %s", log_name, username)
+
+        return "success", {"identifier": identifier, "username": username}
+
+    except ValueError as e:
+        # Пользователь не найден
+        return "failed", {"identifier": identifier, "error": str(e)}
+    except Exception as e:
+        # Любая другая ошибка (FreeIPA, сеть и т.д.)
+        return "failed", {"identifier": identifier, "error": f"{error_prefix}: {str(e)}"}
+
+
+def delete_user(client: Client, identifier: str, resuming: bool = False) -> ItemResult:
+    return _apply_to_user(client, identifier, "user_del", "deleted", "BULK_DELETE",
+                          "Ошибка удаления", NotFound, resuming)
+
+
+def disable_user(client: Client, identifier: str, resuming: bool = False) -> ItemResult:
+    return _apply_to_user(client, identifier, "user_disable", "disabled", "BULK_DISABLE",
+                          "Ошибка отключения", AlreadyInactive, resuming)
+
+
+def enable_user(client: Client, identifier: str, resuming: bool = False) -> ItemResult:
+    return _apply_to_user(client, identifier, "user_enable", "enabled", "BULK_ENABLE",
+                          "Ошибка включения", AlreadyActive, resuming)
+
+
+def reset_password(client: Client, identifier: str, resuming: bool = False) -> ItemResult:
+    """Сброс пароля на случайный. Повтор после прерывания просто генерирует новый пароль"""
+    try:
+        username = resolve_username(client, identifier)
+
+        reset_result = client._request(
+            "user_mod",
+            args=[username],
+            params={"random": True}
+        )
+        invalidate_user(username)
+        logger.info("BULK_RESET_PASSWORD: %s", username)
+
+        return "success", {
+            "identifier": identifier,
+            "username": username,
+            "password": reset_result['result']['randompassword']
+        }
+
+    except Exception as e:
+        return "failed", {"identifier": identifier, "error": str(e)}
+
+
+def reset_password_with_link(client: Client, identifier: str, resuming: bool = False) -> ItemResult:
+    """Сброс пароля с Yopass ссылкой вместо пароля (фоновые операции - результат читают из журнала)"""
+    status, entry = reset_password(client, identifier, resuming=resuming)
+    if status == "success":
+        try:
+            entry["yopass_link"] = create_yopass_link(entry["username"], entry.pop("password"))
+        except Exception as e:
+            # Пароль уже сменён - без ссылки его не передать, нужен повторный сброс
+            return "failed", {"identifier": identifier, "username": entry["username"], "error": f"Пароль сброшен, но Yopass недоступен: {e}"}
+    return status, entry
+
+
+def create_user_from_row(client: Client, row_num: int, row: tuple, resuming: bool = False) -> ItemResult:
+    """
+    Создание пользователя из строки Excel (шаблон freeipa_users_template.xlsx)
+
+    resuming - прошлая попытка прервалась на этой строке: если пользователь уже
+    есть в FreeIPA, считаем его созданным (пароль не сохранился - нужен сброс).
+    """
+    fio = None
+    try:
+        # Парсим строку Excel
+        data = parse_excel_row(row)
+        fio = data["fio"]
+        email = data["email"]
+
+        # Валидация обязательных полей
+        if not fio:
+            return "failed", {"row": row_num, "error": "ФИО не заполнено"}
+
+        if not email:
+            return "failed", {"row": row_num, "fio": fio, "error": "Email не заполнен"}
+
+        if not is_valid_email(email):
+            return "failed", {"row": row_num, "fio": fio, "error": f"Невалидный email: {email}"}
+
+        # Парсим ФИО
+        fio_parsed = parse_fio(fio)
+        if not fio_parsed:
+            return "failed", {"row": row_num, "fio": fio, "error": "ФИО должно содержать минимум Фамилию и Имя"}
+
+        last_name, first_name, username = fio_parsed
+
+        # Собираем все ошибки валидации для этой строки
+        row_errors = []
+        already_created = False
+
+        # Проверка: Username уже существует в FreeIPA
+        try:
+            client._request("user_show", args=[username])
+            # Если не упало - значит пользователь существует
+            if resuming:
+                already_created = True
+            else:
+                row_errors.append(f"Username '{username}' уже существует в FreeIPA")
+        except Exception:
+            # Пользователь не найден - можно создавать
+            pass
+
+        # Проверка: Email уже существует в FreeIPA
+        try:
+            # Ищем пользователей с таким email
+            email_check = client._request("user_find", args=[], params={"mail": email})
+            if email_check['result']:
+                # Найден пользователь с таким email
+                existing_username = email_check['result'][0]['uid'][0]
+                if not (already_created and existing_username == username):
+                    row_errors.append(f"Email '{email}' уже используется пользователем {existing_username}")
+        except Exception:
+            # Ошибка поиска - игнорируем и продолжаем
+            pass
+
+        # Парсим группы
+        groups_list = parse_groups(data["groups_str"])
+
+        # Проверка: Существование всех групп
+        if groups_list:
+            non_existing_groups = group_catalog.missing(client, groups_list)
+
+            if non_existing_groups:
+                row_errors.append(f"Группы не существуют: {group_catalog.describe_missing(client, non_existing_groups)}")
+
+        # Если есть любые ошибки валидации - не создаём пользователя
+        if row_errors:
+            return "failed", {
+                "row": row_num,
+                "fio": fio,
+                "username": username,
+                "email": email,
+                "error": "; ".join(row_errors)
+            }
+
+        if already_created:
+            password = None
+            yopass_link = None
+            logger.warning("BULK_CREATE_EXCEL: %s from row %s was created before interruption", username, row_num)
+        else:
+            # Создаём пользователя в FreeIPA
+            result = client._request(
+                "user_add",
+                args=[username],
+                params={
+                    "givenname": first_name,
+                    "sn": last_name,
+                    "cn": fio,
+                    "mail": email,
+                    "title": data["title"],
+                    "telephonenumber": data["phone"],
+                    "random": True,
+                }
+            )
+
+            password = result['result']['randompassword']
+            invalidate_user(username)
+            record_change(username, "created")
+
+            yopass_link = create_yopass_link(username, password)
+
+        # Добавляем в группы
+        added_groups = []
+        failed_groups = []
+
+        for group in groups_list:
+            try:
+                client._request(
+                    "group_add_member",
+                    args=[group],
+                    params={"user": username}
+                )
+                added_groups.append(group)
+            except Exception as e:
+                failed_groups.append({"group": group, "error": str(e)})
+        invalidate_user(username)
+
+        # Если валидация прошла успешно добавляем сюда
+        success_entry = {
+            "row": row_num,
+            "fio": fio,
+            "username": username,
+            "email": email,
+            "password": password,
+            "yopass_link": yopass_link
+        }
+        if already_created:
+            success_entry["message"] = "Пользователь создан до прерывания операции, пароль не сохранён - сбросьте пароль"
+
+        if groups_list:
+            success_entry["groups"] = {
+                "added": added_groups,
+                "failed": failed_groups
+            }
+
+        logger.info("BULK_CREATE_EXCEL: Created %s from row %s", username, row_num)
+        return "success", success_entry
+
+    except Exception as e:
+        logger.error("BULK_CREATE_EXCEL: Failed row %s - %s", row_num, e)
+        return "failed", {
+            "row": row_num,
+            "fio": fio or "unknown",
+            "error": str(e)
+        }
+
+
+@hold_operation()
+def run_bulk(client: Client, operation: BulkOperation, items: Iterable[Tuple[str, Any]],
+             action: Callable[..., ItemResult],
+             should_stop: Optional[Callable[[], bool]] = None,
+             after_item: Optional[Callable[[str, str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Выполняет action(client, payload, resuming=...) для каждого (ключ, payload) с чекпоинтами
+
+    Элементы, успешно выполненные при прошлой попытке той же операции, берутся из
+    журнала (без паролей - они не сохраняются).
+    should_stop проверяется перед каждым элементом: True - операция останавливается
+    со статусом cancelled (продолжить можно тем же Idempotency-Key). Так же операция
+    останавливается по дедлайну запроса или отключению клиента - тогда в результате
+    stopped: deadline / disconnected / shutdown и то, что успело выполниться.
+    after_item(ключ, статус, запись) вызывается после сохранения чекпоинта элемента
+    (запись ещё с паролем) - например, для отправки письма.
+    """
+    results = {"success": [], "failed": [], "operation_id": operation.id, "replayed": 0}
+
+    try:
+        for key, payload in items:
+            if should_stop is not None and should_stop():
+                operation.set_status("cancelled")
+                logger.warning("BULK_OPERATION: %s cancelled", operation.id)
+                results["cancelled"] = True
+                return results
+
+            reason = stop_reason()
+            if reason:
+                operation.set_status("cancelled")
+                logger.warning("BULK_OPERATION: %s stopped (%s) - Success: %s, Failed: %s", operation.id, reason,
+                               len(results["success"]), len(results["failed"]))
+                results["cancelled"] = True
+                results["stopped"] = reason
+                return results
+
+            stored = operation.done(key)
+            if stored is not None:
+                results["success"].append(stored)
+                results["replayed"] += 1
+                continue
+
+            resuming = operation.interrupted(key)
+            operation.start(key)
+            status, entry = action(client, payload, resuming=resuming)
+            operation.finish(key, status, entry)
+            if after_item is not None:
+                after_item(key, status, entry)
+            results[status].append(entry)
+    except BaseException:
+        # Повтор с тем же Idempotency-Key можно начинать сразу, не дожидаясь BULK_OPERATION_LEASE
+        operation.set_status("interrupted")
+        raise
+
+    operation.set_status("completed")
+    return results
+
+
+# Тексты писем с учётными данными: (тема, вступление)
+CREDENTIAL_MAILS = {
+    "reset": ("Новый пароль учётной записи {username}", "Пароль вашей учётной записи {username} сброшен."),
+    "create": ("Ваша учётная запись {username}", "Для вас создана учётная запись {username}."),
+}
+
+
+class CredentialMailer:
+    """
+    Письма с учётными данными для успешных элементов массовой операции (after_item для run_bulk)
+
+    В письмо идёт Yopass ссылка, а если её нет - пароль. Адрес - email из строки Excel
+    или из записи пользователя. Статус письма (поле delivery: queued -> sent | failed)
+    попадает в ответ и в журнал операции - его видно в прогрессе фоновой операции.
+    """
+
+    def __init__(self, client: Client, operation: BulkOperation, kind: str):
+        self.client = client
+        self.operation = operation
+        self.subject, self.intro = CREDENTIAL_MAILS[kind]
+        self._tickets: List[Tuple[Dict[str, Any], MailTicket]] = []
+
+    def __call__(self, key: str, status: str, entry: Dict[str, Any]) -> None:
+        if status != "success":
+            return
+
+        username = entry["username"]
+        link, password = entry.get("yopass_link"), entry.get("password")
+        if not link and not password:
+            # Пользователь создан до прерывания операции - пароля нет
+            self._record(key, entry, {"status": "skipped", "error": "Нет пароля для отправки"})
+            return
+
+        try:
+            recipient = self._recipient(entry)
+        except Exception as e:
+            self._record(key, entry, {"status": "failed", "error": f"Не удалось получить email: {e}"})
+            return
+        if not recipient:
+            self._record(key, entry, {"status": "failed", "error": "У пользователя нет email"})
+            return
+
+        if link:
+            secret = f"Пароль доступен по одноразовой ссылке (действует 7 дней):\n{link}"
+        else:
+            secret = f"Временный пароль: {password}"
+        body = (
+            f"Здравствуйте!\n\n{self.intro.format(username=username)}\n"
+            f"Логин: {username}\n{secret}\n\n"
+            "При первом входе система попросит сменить пароль."
+        )
+
+        self._record(key, entry, {"to": recipient, "status": "queued"})
+        ticket = mail_sender.send(
+            recipient,
+            self.subject.format(username=username),
+            body,
+            on_done=lambda t: self.operation.annotate(key, {"delivery": t.as_dict()})
+        )
+        self._tickets.append((entry, ticket))
+
+    def _recipient(self, entry: Dict[str, Any]) -> Optional[str]:
+        if entry.get("email"):
+            return entry["email"]
+        if "@" in entry.get("identifier", ""):
+            return entry["identifier"]
+        user = self.client._request("user_show", args=[entry["username"]], params={})
+        return _first(user['result'].get('mail'))
+
+    def _record(self, key: str, entry: Dict[str, Any], delivery: Dict[str, Any]) -> None:
+        entry["delivery"] = delivery
+        self.operation.annotate(key, {"delivery": delivery})
+
+    def wait(self, timeout: float) -> None:
+        """Ждёт отправки писем (синхронные ручки) и переносит итоговые статусы в ответ"""
+        wait_all([ticket for _, ticket in self._tickets], timeout)
+        for entry, ticket in self._tickets:
+            entry["delivery"] = ticket.as_dict()
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Set
+from app.config import USER_CACHE_TTL, USER_CACHE_SIZE, MULTI_WORKER
+from app.services.storage import get_connection, register_schema
+from app.services.directory import directory_index
+
+# Инвалидации, видимые всем воркерам (если их несколько)
+register_schema("""
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+    cache TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    ts REAL NOT NULL,
+    PRIMARY KEY (cache, tag)
+);
+""")
+
+
+class TTLCache:
+    """
+    Потокобезопасный read-through кэш с TTL и ограничением размера (LRU)
+
+    Записи помечаются тегом (например, username), инвалидация идёт по тегу.
+    Если тег инвалидирован, пока загрузка была в полёте, результат не сохраняется -
+    после собственной записи кэш никогда не отдаст устаревшие данные.
+    С shared=True инвалидации пишутся в общую SQLite и проверяются при чтении,
+    чтобы запись через один воркер uvicorn сбрасывала кэш остальных.
+    """
+
+    def __init__(self, ttl: float, maxsize: int, name: str = "default", shared: bool = False):
+        self.ttl = ttl
+        self.name = name
+        self.shared = shared
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires, tag, value, stored)
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self._invalidated: Dict[Hashable, float] = {}  # tag -> момент последней инвалидации
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], tag: Hashable = None) -> Any:
+        """Возвращает значение из кэша или вызывает loader() и сохраняет результат"""
+        if not self.enabled:
+            return loader()
+
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            fresh = entry is not None and entry[0] > now
+
+        if fresh and not (self.shared and self._shared_invalidated_at(tag) >= entry[3]):
+            with self._lock:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                self.hits += 1
+            return entry[2]
+
+        with self._lock:
+            self.misses += 1
+
+        value = loader()
+
+        invalidated = self._shared_invalidated_at(tag) if self.shared else float("-inf")
+        with self._lock:
+            if max(invalidated, self._invalidated.get(tag, float("-inf"))) >= now:
+                return value
+            self._store(key, tag, value, now)
+        return value
+
+    def invalidate(self, tag: Hashable) -> None:
+        """Удаляет все записи с тегом"""
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                self._data.pop(key, None)
+            self._invalidated[tag] = time.time()
+            if len(self._invalidated) > self.maxsize:
+                self._prune_invalidated()
+
+        if self.shared:
+            get_connection().execute(
+                "INSERT OR REPLACE INTO cache_invalidations VALUES (?, ?, ?)",
+                (self.name, str(tag), time.time())
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _shared_invalidated_at(self, tag: Hashable) -> float:
+        row = get_connection().execute(
+            "SELECT ts FROM cache_invalidations WHERE cache = ? AND tag = ?",
+            (self.name, str(tag))
+        ).fetchone()
+        return row["ts"] if row else float("-inf")
+
+    def _store(self, key: Hashable, tag: Hashable, value: Any, stored: float) -> None:
+        self._data[key] = (stored + self.ttl, tag, value, stored)
+        self._data.move_to_end(key)
+        self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._data) > self.maxsize:
+            old_key, (_, old_tag, _, _) = self._data.popitem(last=False)
+            keys = self._tags.get(old_tag)
+            if keys is not None:
+                keys.discard(old_key)
+                if not keys:
+                    del self._tags[old_tag]
+
+    def _prune_invalidated(self) -> None:
+        """Забывает старые инвалидации (загрузки дольше горизонта уже не в полёте)"""
+        horizon = time.time() - max(self.ttl, 300)
+        for tag in [t for t, ts in self._invalidated.items() if ts < horizon]:
+            del self._invalidated[tag]
+
+
+# Записи user_show. Ключ - (session_id, username), тег - username
+user_cache = TTLCache(ttl=USER_CACHE_TTL, maxsize=USER_CACHE_SIZE, name="user", shared=MULTI_WORKER)
+
+
+def invalidate_user(username: str) -> None:
+    """Сбрасывает кэш пользователя во всех сессиях (вызывать после любой записи)"""
+    user_cache.invalidate(username.lower())
+    directory_index.mark_stale()
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.config import logger, CHANGES_RETENTION_DAYS
+from app.services.directory import slim_user, _first
+from app.services.storage import get_connection, register_schema
+
+# Журнал изменений каталога (общий для всех воркеров)
+register_schema("""
+CREATE TABLE IF NOT EXISTS directory_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT NOT NULL,
+    change TEXT NOT NULL,
+    changed REAL NOT NULL,
+    recorded REAL NOT NULL,
+    source TEXT NOT NULL,
+    user TEXT
+);
+CREATE INDEX IF NOT EXISTS directory_changes_recorded ON directory_changes (recorded);
+-- Последний seq, удалённый по CHANGES_RETENTION_DAYS: watermark меньше него устарел,
+-- даже если журнал после очистки пуст
+CREATE TABLE IF NOT EXISTS directory_changes_pruned (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS directory_digests (
+    uid TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    enabled INTEGER NOT NULL
+);
+""")
+
+CHANGE_TYPES = ("created", "modified", "disabled", "enabled", "deleted")
+
+
+class WatermarkExpired(Exception):
+    """Watermark старше хранимого журнала - нужна полная синхронизация"""
+
+
+def _digest(record: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _modified_at(user: Dict[str, Any]) -> Optional[float]:
+    """modifytimestamp FreeIPA (generalized time, 20240101120000Z), если атрибут отдан"""
+    value = _first(user.get('modifytimestamp'))
+    if isinstance(value, dict):
+        value = value.get('__datetime__')
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value), "%Y%m%d%H%M%SZ").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def record_change(username: str, change: str) -> None:
+    """Изменение, сделанное через этот API (видно в ленте сразу, до следующего скана)"""
+    now = time.time()
+    conn = get_connection()
+    conn.execute(
+        "INSERT INTO directory_changes (uid, change, changed, recorded, source) VALUES (?, ?, ?, ?, 'api')",
+        (username.lower(), change, now, now)
+    )
+    if change == "deleted":
+        # Скан не должен повторно сообщать об удалении
+        conn.execute("DELETE FROM directory_digests WHERE uid = ?", (username.lower(),))
+
+
+def record_scan(users: Iterable[Dict[str, Any]]) -> int:
+    """
+    Сравнивает полный скан каталога с предыдущим и пишет изменения в журнал
+
+    Сравниваются компактные записи (slim_user), поэтому служебные атрибуты
+    (время последнего входа и т.п.) событий не порождают. Время изменения -
+    modifytimestamp, если FreeIPA его отдала, иначе момент скана.
+    Возвращает число записанных изменений.
+    """
+    now = time.time()
+    conn = get_connection()
+    known = {row["uid"]: (row["digest"], row["enabled"]) for row in conn.execute("SELECT * FROM directory_digests")}
+
+    changes: List[Tuple[str, str, float, str]] = []
+    digests: List[Tuple[str, str, int]] = []
+    seen = set()
+
+    for user in users:
+        record = slim_user(user)
+        if not record["uid"]:
+            continue
+        uid = record["uid"].lower()
+        seen.add(uid)
+        digest = _digest(record)
+        previous = known.get(uid)
+        if previous is not None and previous[0] == digest:
+            continue
+
+        if previous is None:
+            change = "created"
+        elif bool(previous[1]) != record["enabled"]:
+            change = "enabled" if record["enabled"] else "disabled"
+        else:
+            change = "modified"
+
+        changed = _modified_at(user) or now
+        changes.append((uid, change, changed, json.dumps(record, ensure_ascii=False, default=str)))
+        digests.append((uid, digest, int(record["enabled"])))
+
+    deleted = [uid for uid in known if uid not in seen]
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT INTO directory_changes (uid, change, changed, recorded, source, user) VALUES (?, ?, ?, ?, 'scan', ?)",
+            [(uid, change, changed, now, data) for uid, change, changed, data in changes]
+        )
+        conn.executemany(
+            "INSERT INTO directory_changes (uid, change, changed, recorded, source) VALUES (?, 'deleted', ?, ?, 'scan')",
+            [(uid, now, now) for uid in deleted]
+        )
+        conn.executemany("INSERT OR REPLACE INTO directory_digests VALUES (?, ?, ?)", digests)
+        conn.executemany("DELETE FROM directory_digests WHERE uid = ?", [(uid,) for uid in deleted])
+        _prune(conn, now - CHANGES_RETENTION_DAYS * 86400)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    total = len(changes) + len(deleted)
+    if total:
+        logger.info("CHANGES: Recorded %s changes (%s deleted)", total, len(deleted))
+    return total
+
+
+def _prune(conn, cutoff: float) -> None:
+    """Удаляет события старше cutoff и запоминает последний удалённый seq (внутри транзакции)"""
+    pruned = conn.execute(
+        "SELECT MAX(seq) AS seq FROM directory_changes WHERE recorded < ?", (cutoff,)
+    ).fetchone()["seq"]
+    if pruned is None:
+        return
+    conn.execute("DELETE FROM directory_changes WHERE seq <= ?", (pruned,))
+    conn.execute(
+        "INSERT INTO directory_changes_pruned (id, seq) VALUES (1, ?) "
+        "ON CONFLICT(id) DO UPDATE SET seq = MAX(seq, excluded.seq)",
+        (pruned,)
+    )
+
+
+def list_changes(watermark: Optional[int] = None, since: Optional[float] = None,
+                 limit: int = 1000) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """
+    Страница ленты изменений после watermark (или с момента since)
+
+    Возвращает (изменения, новый watermark, есть ли ещё). Лента at-least-once:
+    изменение через API может прийти повторно из скана, применять идемпотентно.
+    """
+    conn = get_connection()
+    watermark = watermark or 0
+
+    if watermark:
+        pruned = conn.execute("SELECT seq FROM directory_changes_pruned WHERE id = 1").fetchone()
+        # MIN(seq) - для журналов, очищенных до появления directory_changes_pruned
+        oldest = conn.execute("SELECT MIN(seq) AS seq FROM directory_changes").fetchone()["seq"]
+        if (pruned is not None and watermark < pruned["seq"]) or (oldest is not None and watermark < oldest - 1):
+            raise WatermarkExpired(watermark)
+
+    query = "SELECT * FROM directory_changes WHERE seq > ?"
+    params: List[Any] = [watermark]
+    if since is not None:
+        query += " AND changed >= ?"
+        params.append(since)
+    query += " ORDER BY seq LIMIT ?"
+    params.append(limit + 1)
+
+    rows = conn.execute(query, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes = [
+        {
+            "uid": row["uid"],
+            "change": row["change"],
+            "changed": datetime.fromtimestamp(row["changed"], tz=timezone.utc).isoformat(),
+            "source": row["source"],
+            "user": json.loads(row["user"]) if row["user"] else None
+        }
+        for row in rows
+    ]
+
+    if rows:
+        watermark = rows[-1]["seq"]
+    elif not watermark:
+        # Пустая страница - отдаём текущую позицию журнала, чтобы не начинать с нуля
+        watermark = conn.execute("SELECT COALESCE(MAX(seq), 0) AS seq FROM directory_changes").fetchone()["seq"]
+    return changes, watermark, has_more
@@ -0,0 +1,300 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import logger, BULK_OPERATION_LEASE, BULK_OPERATION_RETENTION_DAYS
+from app.services.storage import get_connection, register_schema
+
+# Прогресс массовых операций (общий для всех воркеров, переживает перезапуск)
+register_schema("""
+CREATE TABLE IF NOT EXISTS bulk_operations (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    admin TEXT NOT NULL,
+    idempotency_key TEXT,
+    fingerprint TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS bulk_operations_key ON bulk_operations (kind, admin, idempotency_key);
+CREATE TABLE IF NOT EXISTS bulk_operation_items (
+    operation_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (operation_id, item)
+);
+""")
+
+# Учётные данные в результате элемента на диск не пишутся: password не хранится вовсе,
+# yopass_link (одноразовая ссылка) - только в памяти процесса, выполнившего операцию,
+# пока её журнал не удалён (BULK_OPERATION_RETENTION_DAYS). В журнале вместо них -
+# credentials_unavailable: повтор по Idempotency-Key, перезапуск или другой процесс
+# вернут элемент без пароля / ссылки, и клиент увидит, что нужен повторный сброс
+REDACTED_FIELDS = ("password",)
+MEMORY_ONLY_FIELDS = ("yopass_link",)
+_secrets_lock = threading.Lock()
+_secrets: Dict[str, Dict[str, Dict[str, Any]]] = {}  # operation_id -> item -> поля
+_secrets_updated: Dict[str, float] = {}
+
+
+class BulkOperationConflict(Exception):
+    """Idempotency-Key уже занят другой операцией"""
+
+
+def fingerprint(payload: Any) -> str:
+    """Отпечаток входных данных операции (список идентификаторов, байты файла)"""
+    if not isinstance(payload, bytes):
+        payload = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class BulkOperation:
+    """
+    Чекпоинты массовой операции
+
+    Перед обработкой элемента он помечается pending, после - success/failed с
+    результатом (без паролей и Yopass ссылок - см. REDACTED_FIELDS). Повторная отправка с тем же Idempotency-Key
+    продолжает ту же операцию: успешные элементы возвращаются из журнала без
+    запросов в FreeIPA, остальные выполняются заново. pending означает, что
+    операция прервалась на этом элементе - действие могло успеть выполниться.
+    """
+
+    def __init__(self, operation_id: str, kind: str, items: Dict[str, Tuple[str, Optional[Dict[str, Any]]]]):
+        self.id = operation_id
+        self.kind = kind
+        self.resumed = bool(items)
+        self._items = items
+
+    @classmethod
+    def open(cls, kind: str, admin: str, payload_fingerprint: str,
+             idempotency_key: Optional[str] = None) -> "BulkOperation":
+        """Новая операция или продолжение существующей с тем же Idempotency-Key"""
+        conn = get_connection()
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _prune(conn, now)
+
+            row = None
+            if idempotency_key:
+                row = conn.execute(
+                    "SELECT * FROM bulk_operations WHERE kind = ? AND admin = ? AND idempotency_key = ?",
+                    (kind, admin, idempotency_key)
+                ).fetchone()
+
+            if row is None:
+                operation_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO bulk_operations VALUES (?, ?, ?, ?, ?, 'running', ?, ?)",
+                    (operation_id, kind, admin, idempotency_key, payload_fingerprint, now, now)
+                )
+                conn.execute("COMMIT")
+                return cls(operation_id, kind, {})
+
+            if row["fingerprint"] != payload_fingerprint:
+                raise BulkOperationConflict("Idempotency-Key уже использован с другими данными")
+            if row["status"] == "running" and now - row["updated"] < BULK_OPERATION_LEASE:
+                raise BulkOperationConflict("Операция с этим Idempotency-Key ещё выполняется")
+
+            conn.execute(
+                "UPDATE bulk_operations SET status = 'running', updated = ? WHERE id = ?",
+                (now, row["id"])
+            )
+            items = {
+                item["item"]: (item["status"], json.loads(item["result"]) if item["result"] else None)
+                for item in conn.execute(
+                    "SELECT item, status, result FROM bulk_operation_items WHERE operation_id = ?",
+                    (row["id"],)
+                )
+            }
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        logger.warning("BULK_OPERATION: Resuming %s %s, %s items already recorded", kind, row["id"], len(items))
+        return cls(row["id"], kind, items)
+
+    def done(self, item: str) -> Optional[Dict[str, Any]]:
+        """
+        Результат элемента, успешно выполненного при прошлой попытке
+
+        Пароля в нём нет (credentials_unavailable), Yopass ссылка - только если
+        прошлая попытка шла в этом же процессе.
+        """
+        status, result = self._items.get(item, (None, None))
+        return with_secrets(self.id, item, result) if status == "success" else None
+
+    def interrupted(self, item: str) -> bool:
+        """Прошлая попытка прервалась на этом элементе (действие могло выполниться)"""
+        return self._items.get(item, (None,))[0] == "pending"
+
+    def start(self, item: str) -> None:
+        self._save(item, "pending", None)
+
+    def finish(self, item: str, status: str, result: Dict[str, Any]) -> None:
+        secret_fields = REDACTED_FIELDS + MEMORY_ONLY_FIELDS
+        stored = {key: value for key, value in result.items() if key not in secret_fields}
+        if any(result.get(key) for key in secret_fields):
+            stored["credentials_unavailable"] = True
+            _remember_secrets(self.id, item, {key: result[key] for key in MEMORY_ONLY_FIELDS if result.get(key)})
+        self._save(item, status, stored)
+
+    def annotate(self, item: str, fields: Dict[str, Any]) -> None:
+        """
+        Дополняет результат завершённого элемента (например, статус письма)
+
+        Строка перезаписывается и получает новый курсор - опрос прогресса увидит
+        элемент ещё раз с обновлёнными полями.
+        """
+        conn = get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT status, result FROM bulk_operation_items WHERE operation_id = ? AND item = ?",
+                (self.id, item)
+            ).fetchone()
+            if row is not None:
+                result = {**(json.loads(row["result"]) if row["result"] else {}), **fields}
+                conn.execute(
+                    "INSERT OR REPLACE INTO bulk_operation_items VALUES (?, ?, ?, ?)",
+                    (self.id, item, row["status"], json.dumps(result, ensure_ascii=False, default=str))
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def set_status(self, status: str) -> None:
+        """completed | interrupted | cancelled (running - пока операция выполняется)"""
+        get_connection().execute(
+            "UPDATE bulk_operations SET status = ?, updated = ? WHERE id = ?",
+            (status, time.time(), self.id)
+        )
+
+    def _save(self, item: str, status: str, result: Optional[Dict[str, Any]]) -> None:
+        conn = get_connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO bulk_operation_items VALUES (?, ?, ?, ?)",
+                (self.id, item, status, json.dumps(result, ensure_ascii=False, default=str) if result else None)
+            )
+            conn.execute("UPDATE bulk_operations SET updated = ? WHERE id = ?", (now, self.id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _remember_secrets(operation_id: str, item: str, fields: Dict[str, Any]) -> None:
+    if not fields:
+        return
+    now = time.time()
+    horizon = now - BULK_OPERATION_RETENTION_DAYS * 86400
+    with _secrets_lock:
+        for expired in [op for op, updated in _secrets_updated.items() if updated < horizon]:
+            _secrets.pop(expired, None)
+            del _secrets_updated[expired]
+        _secrets.setdefault(operation_id, {})[item] = fields
+        _secrets_updated[operation_id] = now
+
+
+def with_secrets(operation_id: str, item: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Результат элемента из журнала + ссылка из памяти процесса (если она здесь есть)"""
+    if not entry.get("credentials_unavailable"):
+        return entry
+    with _secrets_lock:
+        fields = _secrets.get(operation_id, {}).get(item)
+    if not fields:
+        return entry
+    entry = {**entry, **fields}
+    del entry["credentials_unavailable"]
+    return entry
+
+
+def get_operation(operation_id: str) -> Optional[Dict[str, Any]]:
+    """Состояние операции для /api/v1/bulk-operations/{id}"""
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM bulk_operations WHERE id = ?", (operation_id,)).fetchone()
+    if row is None:
+        return None
+
+    items: Dict[str, List[Dict[str, Any]]] = {"success": [], "failed": [], "pending": []}
+    for item in conn.execute(
+        "SELECT item, status, result FROM bulk_operation_items WHERE operation_id = ? ORDER BY rowid",
+        (operation_id,)
+    ):
+        entry = with_secrets(operation_id, item["item"], json.loads(item["result"]) if item["result"] else {})
+        items[item["status"]].append({"item": item["item"], **entry})
+
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "admin": row["admin"],
+        "status": row["status"],
+        "created": row["created"],
+        "updated": row["updated"],
+        **items
+    }
+
+
+def get_progress(operation_id: str, since: int = 0, limit: int = 500) -> Optional[Dict[str, Any]]:
+    """
+    Прогресс операции для опроса: счётчики и завершённые элементы после курсора since
+
+    Курсор - rowid записи элемента: завершение элемента перезаписывает его строку,
+    поэтому завершённые элементы идут по возрастанию курсора в порядке выполнения.
+    Элемент, дополненный после завершения (annotate), приходит повторно - клиенту
+    нужно заменять строки по полю item.
+    """
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM bulk_operations WHERE id = ?", (operation_id,)).fetchone()
+    if row is None:
+        return None
+
+    counts = {"success": 0, "failed": 0, "pending": 0}
+    for item in conn.execute(
+        "SELECT status, COUNT(*) AS n FROM bulk_operation_items WHERE operation_id = ? GROUP BY status",
+        (operation_id,)
+    ):
+        counts[item["status"]] = item["n"]
+
+    items = []
+    cursor = since
+    for item in conn.execute(
+        "SELECT rowid, item, status, result FROM bulk_operation_items "
+        "WHERE operation_id = ? AND rowid > ? AND status != 'pending' ORDER BY rowid LIMIT ?",
+        (operation_id, since, limit)
+    ):
+        entry = with_secrets(operation_id, item["item"], json.loads(item["result"]) if item["result"] else {})
+        items.append({"item": item["item"], "status": item["status"], **entry})
+        cursor = item["rowid"]
+
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "admin": row["admin"],
+        "status": row["status"],
+        "updated": row["updated"],
+        "success": counts["success"],
+        "failed": counts["failed"],
+        "items": items,
+        "cursor": cursor
+    }
+
+
+def _prune(conn, now: float) -> None:
+    """Удаляет журналы старых операций"""
+    horizon = now - BULK_OPERATION_RETENTION_DAYS * 86400
+    conn.execute(
+        "DELETE FROM bulk_operation_items WHERE operation_id IN (SELECT id FROM bulk_operations WHERE updated < ?)",
+        (horizon,)
+    )
+    conn.execute("DELETE FROM bulk_operations WHERE updated < ?", (horizon,))
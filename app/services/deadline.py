@@ -0,0 +1,72 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """Дедлайн запроса истёк или клиент отключился - дальнейшие вызовы не выполняются (504)"""
+
+    def __init__(self, reason: str):
+        super().__init__(
+            "Клиент отключился, запрос остановлен" if reason == "disconnected"
+            else "Сервер останавливается, запрос прерван" if reason == "shutdown"
+            else "Истекло время выполнения запроса"
+        )
+        self.reason = reason
+
+
+class RequestDeadline:
+    """
+    Дедлайн и отмена одного запроса
+
+    Создаётся middleware (app/middleware/deadline.py) и через контекст доходит до потоков
+    запроса: вызовы FreeIPA и Yopass берут из него таймаут, массовые операции проверяют
+    его между элементами. cancel() - клиент отключился или задача запроса отменена
+    при остановке сервера.
+    """
+
+    def __init__(self, timeout: Optional[float]):
+        self.expires = time.monotonic() + timeout if timeout else None
+        self.cancelled: Optional[str] = None
+
+    def cancel(self, reason: str) -> None:
+        self.cancelled = reason
+
+    def remaining(self) -> Optional[float]:
+        if self.expires is None:
+            return None
+        return self.expires - time.monotonic()
+
+    def stop_reason(self) -> Optional[str]:
+        """disconnected / shutdown / deadline, None - можно продолжать"""
+        if self.cancelled:
+            return self.cancelled
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            return "deadline"
+        return None
+
+
+# Дедлайн текущего запроса; None - без дедлайна (фоновые задачи)
+deadline_var: ContextVar[Optional[RequestDeadline]] = ContextVar("request_deadline", default=None)
+
+
+def stop_reason() -> Optional[str]:
+    deadline = deadline_var.get()
+    return deadline.stop_reason() if deadline is not None else None
+
+
+def check_deadline() -> None:
+    reason = stop_reason()
+    if reason:
+        raise DeadlineExceeded(reason)
+
+
+def call_timeout(default: float) -> float:
+    """Таймаут внешнего вызова: default, но не дольше остатка дедлайна (DeadlineExceeded, если он истёк)"""
+    check_deadline()
+    deadline = deadline_var.get()
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is None:
+        return default
+    return max(0.1, min(default, remaining))
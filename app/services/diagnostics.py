@@ -0,0 +1,167 @@
+import gc
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from app.config import logger, MEMORY_SNAPSHOTS_MAX
+
+try:
+    import resource
+except ImportError:  # не Unix
+    resource = None
+
+# Аллокации самого tracemalloc и импорта модулей в отчёт не попадают
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+GROUP_BY = ("lineno", "filename", "traceback")
+
+
+class SnapshotNotFound(Exception):
+    """Снимка с таким id нет (не снимался или вытеснен более новыми)"""
+
+
+def process_memory() -> Dict[str, Any]:
+    """RSS процесса сейчас (Linux, /proc) и пиковый"""
+    rss = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss - в килобайтах на Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource is not None else None
+    return {"pid": os.getpid(), "rss_bytes": rss, "peak_rss_bytes": peak, "gc_counts": gc.get_count()}
+
+
+def _stat(stat: Any, group_by: str) -> Dict[str, Any]:
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    entry = {
+        "site": frames[0] if group_by != "filename" else stat.traceback[0].filename,
+        "size_bytes": stat.size,
+        "count": stat.count
+    }
+    if group_by == "traceback":
+        entry["traceback"] = frames
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_bytes"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+class MemoryTracer:
+    """
+    Трассировка аллокаций (tracemalloc) по запросу администратора, на процесс
+
+    start() включает трассировку (замедляет аллокации - держать включённой только на
+    время разбора), snapshot() сохраняет именованный снимок (хранятся последние
+    `max_snapshots`), top() - места с наибольшим объёмом памяти, diff() - прирост
+    между двумя снимками или снимком и текущим состоянием.
+    """
+
+    def __init__(self, max_snapshots: int):
+        self.max_snapshots = max(1, max_snapshots)
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._counter = 0
+        self.started_at: Optional[float] = None
+
+    def start(self, frames: int) -> Dict[str, Any]:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                if tracemalloc.get_traceback_limit() != frames:
+                    raise ValueError(
+                        f"Трассировка уже включена с frames={tracemalloc.get_traceback_limit()}, сначала остановите её"
+                    )
+            else:
+                tracemalloc.start(frames)
+                self.started_at = time.time()
+                logger.warning("MEMORY: Allocation tracing started (%s frames)", frames)
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        """Выключает трассировку; снимки удаляются (их трассы держат память)"""
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.warning("MEMORY: Allocation tracing stopped")
+            self._snapshots.clear()
+            self.started_at = None
+        return self.status()
+
+    def _take(self) -> tracemalloc.Snapshot:
+        """Снимок текущего состояния; вызывается под self._lock - иначе stop() между проверкой и снимком даёт RuntimeError"""
+        if not tracemalloc.is_tracing():
+            raise ValueError("Трассировка не включена - POST /api/v1/diagnostics/memory/tracing/start")
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Снимает и сохраняет снимок, самый старый сверх max_snapshots вытесняется"""
+        with self._lock:
+            snapshot = self._take()
+            traced, peak = tracemalloc.get_traced_memory()
+            self._counter += 1
+            snapshot_id = str(self._counter)
+            self._snapshots[snapshot_id] = {"snapshot": snapshot, "created": time.time(),
+                                            "traced_bytes": traced, "peak_traced_bytes": peak}
+            # Ответ - под той же блокировкой: снимок могут вытеснить или удалить (stop) параллельные вызовы
+            described = {"id": snapshot_id, **self._describe(snapshot_id)}
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return described
+
+    def _get(self, snapshot_id: Optional[str]) -> tracemalloc.Snapshot:
+        """Сохранённый снимок или (None) снимок текущего состояния"""
+        with self._lock:
+            if snapshot_id is None:
+                return self._take()
+            stored = self._snapshots.get(snapshot_id)
+        if stored is None:
+            raise SnapshotNotFound(f"Снимок {snapshot_id} не найден")
+        return stored["snapshot"]
+
+    def top(self, snapshot_id: Optional[str], group_by: str, limit: int) -> Dict[str, Any]:
+        stats = self._get(snapshot_id).statistics(group_by)
+        return {
+            "snapshot": snapshot_id or "now",
+            "total_bytes": sum(stat.size for stat in stats),
+            "top": [_stat(stat, group_by) for stat in stats[:limit]]
+        }
+
+    def diff(self, base_id: str, current_id: Optional[str], group_by: str, limit: int) -> Dict[str, Any]:
+        base = self._get(base_id)
+        stats = self._get(current_id).compare_to(base, group_by)
+        return {
+            "base": base_id,
+            "current": current_id or "now",
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [_stat(stat, group_by) for stat in stats[:limit]]
+        }
+
+    def _describe(self, snapshot_id: str) -> Dict[str, Any]:
+        stored = self._snapshots[snapshot_id]
+        return {key: value for key, value in stored.items() if key != "snapshot"}
+
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        traced, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        with self._lock:
+            snapshots = [{"id": snapshot_id, **self._describe(snapshot_id)} for snapshot_id in self._snapshots]
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "started_at": self.started_at,
+            "traced_bytes": traced,
+            "peak_traced_bytes": peak,
+            # Память, которую занимает сама трассировка
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0,
+            "snapshots": snapshots
+        }
+
+
+memory_tracer = MemoryTracer(MEMORY_SNAPSHOTS_MAX)
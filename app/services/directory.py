@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from python_freeipa import Client
+from app.config import logger, DIRECTORY_INDEX_TTL, DIRECTORY_INDEX_STALE_REFRESH
+from app.services.freeipa import background_client, scan_users
+
+# Поля, по которым ищем
+SEARCH_FIELDS = ("uid", "mail", "cn", "title")
+
+
+def _first(value: Any) -> Optional[str]:
+    """FreeIPA отдаёт атрибуты списками - берём первое значение"""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _is_locked(value: Any) -> bool:
+    """nsaccountlock приходит как bool, как список ["TRUE"] или отсутствует"""
+    value = _first(value)
+    if isinstance(value, str):
+        return value.upper() == "TRUE"
+    return bool(value)
+
+
+def slim_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Компактная запись пользователя (то, что нужно для поиска и списков)"""
+    return {
+        "uid": _first(user.get('uid')),
+        "mail": _first(user.get('mail')),
+        "cn": _first(user.get('cn')),
+        "title": _first(user.get('title')),
+        "givenname": _first(user.get('givenname')),
+        "sn": _first(user.get('sn')),
+        "telephonenumber": _first(user.get('telephonenumber')),
+        "enabled": not _is_locked(user.get('nsaccountlock')),
+        "groups": user.get('memberof_group', [])
+    }
+
+
+class DirectoryIndex:
+    """
+    Индексированная копия каталога пользователей в памяти
+
+    Загружается полным сканом каталога (scan_users) и обновляется в фоне раз в `ttl` секунд.
+    После изменений через API (mark_stale()) - раньше, но не чаще раза в `stale_refresh`
+    секунд: массовая операция даёт одну пересборку на интервал, а не скан на каждую запись.
+    Пока идёт обновление, запросы обслуживаются предыдущей копией.
+
+    Копия общая для всех администраторов, поэтому фоновое обновление идёт через
+    сервисную учётку (background_client); без IPA_USERNAME индекс строится только явным
+    refresh(), а поиск идёт напрямую в FreeIPA.
+
+    Для префиксного поиска по каждому полю держим отсортированный список
+    (значение, позиция) - поиск через bisect. Подстрочный поиск - линейный
+    проход по заранее приведённым к нижнему регистру значениям.
+    """
+
+    def __init__(self, ttl: float, stale_refresh: float):
+        self.ttl = ttl
+        self.stale_refresh = stale_refresh
+        # Защищает _refreshing; ждущие первой загрузки (wait) просыпаются по notify_all
+        self._refresh_lock = threading.Condition()
+        self._refreshing = False
+        self._stale = False
+        self._no_client_logged = False
+        # (записи, {поле: [(значение, позиция), ...]}, момент загрузки) - меняются одним присваиванием
+        self._snapshot: Optional[Tuple[List[Dict[str, Any]], Dict[str, List[Tuple[str, int]]], float]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def age(self) -> Optional[float]:
+        return time.monotonic() - self._snapshot[2] if self._snapshot else None
+
+    def mark_stale(self) -> None:
+        """Каталог изменился через API - обновление не позже чем через stale_refresh секунд после прошлого"""
+        self._stale = True
+
+    def needs_refresh(self) -> bool:
+        if self._snapshot is None:
+            return True
+        age = self.age
+        return age > self.ttl or (self._stale and age >= self.stale_refresh)
+
+    def refresh(self, client: Client) -> None:
+        """Полная перезагрузка индекса"""
+        started = time.monotonic()
+        self._stale = False
+        # Полные записи не копятся - сразу сжимаются до slim_user
+        records = sorted((slim_user(u) for u in scan_users(client)), key=lambda r: r["uid"] or "")
+        keys = {}
+        for field in SEARCH_FIELDS:
+            keys[field] = sorted(
+                ((r[field] or "").lower(), pos) for pos, r in enumerate(records) if r[field]
+            )
+
+        self._snapshot = (records, keys, time.monotonic())
+        with self._refresh_lock:
+            self._refresh_lock.notify_all()
+        logger.info("DIRECTORY_INDEX: Loaded %s users in %.2fs", len(records), time.monotonic() - started)
+
+    def refresh_in_background(self) -> None:
+        """Запускает обновление в фоне через сервисную учётку (не больше одного одновременно)"""
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                client = background_client()
+                if client is None:
+                    if not self._no_client_logged:
+                        logger.warning("DIRECTORY_INDEX: IPA_USERNAME not set, background refresh disabled")
+                        self._no_client_logged = True
+                    return
+                self.refresh(client)
+            except Exception as e:
+                logger.error("DIRECTORY_INDEX: Refresh failed - %s", e)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing = False
+                    self._refresh_lock.notify_all()
+
+        threading.Thread(target=run, name="directory-index-refresh", daemon=True).start()
+
+    def ensure_fresh(self) -> bool:
+        """Запускает фоновое обновление при необходимости. True - индекс можно использовать"""
+        if self.needs_refresh():
+            self.refresh_in_background()
+        return self._snapshot is not None
+
+    def wait(self, timeout: float) -> bool:
+        """Ждёт первой загрузки индекса. False - не загрузился за timeout секунд (или обновление не удалось)"""
+        with self._refresh_lock:
+            self._refresh_lock.wait_for(lambda: self._snapshot is not None or not self._refreshing, timeout)
+        return self._snapshot is not None
+
+    def lookup(self, field: str, values: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Точные совпадения по полю (без учёта регистра): значение.lower() -> запись"""
+        records, keys, _ = self._snapshot
+        field_keys = keys[field]
+        found = {}
+        for value in values:
+            value = value.lower()
+            start = bisect.bisect_left(field_keys, (value, -1))
+            if start < len(field_keys) and field_keys[start][0] == value:
+                found[value] = records[field_keys[start][1]]
+        return found
+
+    def search(self, query: Optional[str] = None,
+               fields: Tuple[str, ...] = SEARCH_FIELDS,
+               mode: str = "prefix",
+               enabled: Optional[bool] = None,
+               group: Optional[str] = None,
+               email_domain: Optional[str] = None,
+               sort: str = "uid",
+               descending: bool = False,
+               offset: int = 0,
+               limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        """Поиск по индексу с фильтрами, сортировкой и пагинацией. Возвращает (всего, страница)"""
+        records, keys, _ = self._snapshot
+
+        if query:
+            query = query.lower()
+            positions = set()
+            for field in fields:
+                if mode == "prefix":
+                    field_keys = keys[field]
+                    start = bisect.bisect_left(field_keys, (query, -1))
+                    for value, pos in field_keys[start:]:
+                        if not value.startswith(query):
+                            break
+                        positions.add(pos)
+                else:
+                    positions.update(pos for value, pos in keys[field] if query in value)
+            matched = [records[pos] for pos in sorted(positions)]
+        else:
+            matched = records
+
+        if enabled is not None:
+            matched = [r for r in matched if r["enabled"] == enabled]
+        if group:
+            group = group.lower()
+            matched = [r for r in matched if group in (g.lower() for g in r["groups"])]
+        if email_domain:
+            suffix = "@" + email_domain.lower().lstrip("@")
+            matched = [r for r in matched if r["mail"] and r["mail"].lower().endswith(suffix)]
+
+        if sort != "uid" or descending:
+            matched = sorted(matched, key=lambda r: (r.get(sort) is None, str(r.get(sort) or "").lower()), reverse=descending)
+
+        return len(matched), matched[offset:offset + limit]
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0]) if self._snapshot else 0
+
+
+directory_index = DirectoryIndex(ttl=DIRECTORY_INDEX_TTL, stale_refresh=DIRECTORY_INDEX_STALE_REFRESH)
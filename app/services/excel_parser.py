@@ -0,0 +1,88 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import logger, EXCEL_PARSE_WORKERS
+from excel_import.rows import parse_upload
+
+
+class ExcelParser:
+    """
+    Разбор загруженных Excel / CSV в отдельных процессах
+
+    openpyxl - чистый Python и держит GIL: большой файл, разбираемый в процессе API,
+    останавливает остальные запросы воркера, а две загрузки идут строго по очереди.
+    Здесь файл разбирается в пуле из `workers` процессов (создаётся при первом файле,
+    spawn - без копий потоков и блокировок родителя), в запрос возвращаются только
+    компактные кортежи строк (parse_upload). parse_upload лежит вне пакета app
+    (excel_import): процесс пула импортирует только его и openpyxl, а не приложение
+    с конфигурацией, логированием и роутерами. Сверх `workers` файлы ждут в очереди пула;
+    общее число тяжёлых запросов ограничивает допуск (admission).
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._running = 0  # отправлены в пул и ещё не разобраны
+
+        self.parsed = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        """Процесс пула умер (например, не хватило памяти) - следующий файл получит новый пул"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self.restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def parse(self, filename: str, contents: bytes) -> List[Tuple[int, tuple, Optional[str]]]:
+        """Строки файла (см. parse_upload); ошибки разбора пробрасываются как есть"""
+        pool = self._get_pool()
+        self._running += 1
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(pool, parse_upload, filename, contents)
+        except BrokenProcessPool:
+            self.failed += 1
+            self._discard(pool)
+            logger.error("EXCEL_PARSER: Worker process died while parsing %s (%s bytes)", filename, len(contents))
+            raise RuntimeError("Процесс разбора файла аварийно завершился, возможно файл слишком большой")
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self._running -= 1
+        self.parsed += 1
+        return rows
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "started": self._pool is not None,
+            "pending": self._running,
+            "parsed_total": self.parsed,
+            "failed_total": self.failed,
+            "restarts_total": self.restarts
+        }
+
+
+excel_parser = ExcelParser(EXCEL_PARSE_WORKERS)
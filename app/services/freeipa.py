@@ -1,16 +1,220 @@
 from python_freeipa import Client
+from python_freeipa.exceptions import FreeIPAError, Unauthorized
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import contextvars
+import itertools
+import json
+import threading
+import requests
 import urllib3
-from app.config import IPA_HOST
+from app.config import (
+    logger, IPA_HOST, IPA_USERNAME, IPA_PASSWORD, ADMIN_GROUP, SERVICE_POOL_SIZE,
+    DIRECTORY_SCAN_WORKERS, DIRECTORY_SCAN_BATCH, IPA_CALL_TIMEOUT
+)
+from app.services.deadline import DeadlineExceeded, call_timeout, check_deadline, stop_reason
+from app.services.limiter import ipa_limiter
+from app.services.singleflight import SingleFlight
+from app.utils.log import admin_var
+
+# Методы FreeIPA только на чтение (в аудит-лог не пишутся)
+READ_ONLY_SUFFIXES = ("_find", "_show", "ping")
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+
+def is_read_only(method: str, args=None) -> bool:
+    """Вызов только на чтение (batch - если все вложенные вызовы на чтение)"""
+    if method == "batch":
+        return all(call.get("method", "").endswith(READ_ONLY_SUFFIXES) for call in args or [])
+    return method.endswith(READ_ONLY_SUFFIXES)
+
+
+# Одинаковые одновременные чтения из FreeIPA - один запрос на всех
+# DeadlineExceeded лидера - его дедлайн или его отключившийся клиент: ожидающие повторяют вызов
+ipa_singleflight = SingleFlight(retry_errors=(DeadlineExceeded,))
+
+
+def _coalesce_key(client: "LimitedClient", method: str, args, params) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Ключ объединения: сервер, учётка, метод и нормализованные аргументы.
+    Ответы разных учёток не смешиваются (у них могут быть разные права на чтение);
+    клиент без известной учётки не объединяется
+    """
+    if client.principal is None or not is_read_only(method, args):
+        return None
+    try:
+        normalized = json.dumps([args or [], params or {}], sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        return None
+    return client._host, client.principal, method, normalized
+
+
+class _TimeoutSession(requests.Session):
+    """HTTP-сессия с таймаутом на каждый вызов: IPA_CALL_TIMEOUT, но не дольше дедлайна запроса"""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", call_timeout(IPA_CALL_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+class LimitedClient(Client):
+    """
+    Клиент FreeIPA, все вызовы которого проходят через адаптивный лимит (ipa_limiter)
+
+    Одинаковые одновременные чтения (_find / _show / batch из чтений) одной учётки
+    объединяются (ipa_singleflight): в FreeIPA уходит один запрос, остальные получают
+    его результат или ошибку - кроме DeadlineExceeded лидера, после которой повторяют
+    вызов со своим дедлайном. У каждого вызова есть таймаут (см. _TimeoutSession);
+    после дедлайна запроса или отключения клиента вызовы не выполняются (DeadlineExceeded).
+    """
+
+    # Учётка, под которой выполнены вызовы (ключ объединения чтений)
+    principal: Optional[str] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session = _TimeoutSession()
+
+    def login(self, username, password):
+        result = super().login(username, password)
+        self.principal = username
+        return result
+
+    def _request(self, method, args=None, params=None):
+        key = _coalesce_key(self, method, args, params)
+        if key is None:
+            return self._limited_request(method, args, params)
+        return ipa_singleflight.do(key, lambda: self._limited_request(method, args, params))
+
+    def _limited_request(self, method, args=None, params=None):
+        check_deadline()
+        with ipa_limiter.slot(method) as slot:
+            try:
+                return super()._request(method, args, params)
+            except FreeIPAError as e:
+                # HTTP 5xx - перегрузка; ошибки JSON-RPC (NotFound и т.п.) приходят с 200
+                # и своими кодами 4001, 4002...
+                code = getattr(e, "code", None)  # Unauthorized и др. создаются без code
+                if isinstance(code, int) and 500 <= code < 600:
+                    slot.mark_overloaded()
+                raise
+            except requests.exceptions.RequestException as e:
+                reason = stop_reason()
+                if reason:
+                    # Таймаут укоротил дедлайн запроса - это не признак перегрузки FreeIPA
+                    raise DeadlineExceeded(reason) from e
+                # Таймаут, обрыв соединения
+                slot.mark_overloaded()
+                raise
+
+
 def create_freeipa_client(host: str = None) -> Client:
     """Создаёт клиент FreeIPA без авторизации"""
     host = host or IPA_HOST
     if not host:
         raise Exception("Не задан IPA_HOST в .env файле")
     
-    return Client(host=host, verify_ssl=False)
+    return LimitedClient(host=host, verify_ssl=False)
+
+
+class ServiceClient(LimitedClient):
+    """
+    Клиент под сервисной учёткой (IPA_USERNAME / IPA_PASSWORD)
+
+    Сессия FreeIPA продлевается сама: на 401 клиент заново логинится и повторяет
+    вызов. Изменяющие вызовы пишутся в аудит-лог с реальным администратором
+    (из контекста запроса), т.к. в журнале FreeIPA они видны от сервисной учётки.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._login_lock = threading.Lock()
+        self._generation = 0
+
+    def service_login(self) -> None:
+        with self._login_lock:
+            self.login(IPA_USERNAME, IPA_PASSWORD)
+            self._generation += 1
+
+    def _request(self, method, args=None, params=None):
+        if not is_read_only(method, args):
+            logger.info("AUDIT: %s %s by %s", method, args, admin_var.get())
+
+        generation = self._generation
+        try:
+            return super()._request(method, args, params)
+        except Unauthorized:
+            # Сессия сервисной учётки истекла - перелогиниваемся (один раз на всех ждущих)
+            with self._login_lock:
+                if self._generation == generation:
+                    logger.info("SERVICE_ACCOUNT: Session expired, logging in again")
+                    self.login(IPA_USERNAME, IPA_PASSWORD)
+                    self._generation += 1
+            return super()._request(method, args, params)
+
+
+def create_service_client() -> ServiceClient:
+    """Клиент под сервисной учёткой для фоновых задач и режима SERVICE_ACCOUNT_MODE"""
+    if not IPA_USERNAME or not IPA_PASSWORD:
+        raise Exception("Не заданы IPA_USERNAME / IPA_PASSWORD в .env файле")
+    if not IPA_HOST:
+        raise Exception("Не задан IPA_HOST в .env файле")
+
+    client = ServiceClient(host=IPA_HOST, verify_ssl=False)
+    client.service_login()
+    return client
+
+
+class ServiceClientPool:
+    """
+    Небольшой пул долгоживущих клиентов сервисной учётки
+
+    Клиенты создаются при первом обращении и выдаются по кругу. Один клиент
+    (requests.Session) обслуживает несколько запросов одновременно - пул лишь
+    распределяет соединения.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        self._clients: List[ServiceClient] = []
+        self._counter = itertools.count()
+
+    def get(self) -> ServiceClient:
+        if len(self._clients) < self.size:
+            with self._lock:
+                if len(self._clients) < self.size:
+                    while len(self._clients) < self.size:
+                        self._clients.append(create_service_client())
+                    logger.info("SERVICE_ACCOUNT: Pool of %s clients ready", self.size)
+        return self._clients[next(self._counter) % self.size]
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+service_pool = ServiceClientPool(size=SERVICE_POOL_SIZE)
+
+
+def background_client() -> Optional[ServiceClient]:
+    """
+    Клиент для фоновых задач, результат которых видят все администраторы
+    (индекс каталога, пересборка снимков): сервисная учётка. None - IPA_USERNAME не задан
+    """
+    return service_pool.get() if IPA_USERNAME else None
+
+
+def is_admin(username: str, client: Optional[Client] = None) -> bool:
+    """
+    Состоит ли пользователь (напрямую или через вложенные группы) в ADMIN_GROUP
+
+    client - от чьего имени проверять (по умолчанию сервисная учётка)
+    """
+    user = (client or service_pool.get())._request("user_show", args=[username], params={})['result']
+    groups = user.get('memberof_group', []) + user.get('memberofindirect_group', [])
+    return ADMIN_GROUP.lower() in (group.lower() for group in groups)
 
 
 def resolve_username(client: Client, identifier: str) -> str:
@@ -46,4 +250,119 @@ def resolve_username(client: Client, identifier: str) -> str:
     if not users_list:
         raise ValueError(f"Пользователь с email '{identifier}' не найден")
     
-    return users_list[0]['uid'][0]
\ No newline at end of file
+    return users_list[0]['uid'][0]
+
+
+# Символы uid во FreeIPA (логины хранятся в нижнем регистре)
+UID_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789._-"
+# Глубже не дробим: подстрока из 4 символов, которая всё ещё упирается в лимит, -
+# значит лимит сервера слишком мал для скана
+SCAN_MAX_TERM = 4
+# Сколько batch-запросов скана в работе или готовы сразу: запас на параллельность,
+# но не весь каталог в памяти, если вызывающий читает медленнее FreeIPA
+SCAN_WINDOW = DIRECTORY_SCAN_WORKERS * 2
+
+_scan_executor = ThreadPoolExecutor(max_workers=DIRECTORY_SCAN_WORKERS, thread_name_prefix="directory-scan")
+
+
+class ScanIncomplete(Exception):
+    """Каталог не удалось перечислить целиком (лимиты FreeIPA)"""
+
+
+def _submit(fn, *args):
+    # Контекст логов (request_id, admin) - в поток скана
+    return _scan_executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _find_uids(client: Client, term: str, exact: bool = False) -> Tuple[Set[str], bool]:
+    """Логины по подстроке (поиск FreeIPA по uid, имени, фамилии...) или точному uid. (логины, truncated)"""
+    if exact:
+        result = client._request("user_find", args=[], params={"uid": term, "pkey_only": True, "sizelimit": 0})
+    else:
+        result = client._request("user_find", args=[term] if term else [], params={"pkey_only": True, "sizelimit": 0})
+    return {u['uid'][0] for u in result['result']}, bool(result.get('truncated'))
+
+
+def _list_uids(client: Client) -> Set[str]:
+    """
+    Все логины каталога
+
+    Сначала один user_find pkey_only. Если FreeIPA обрезала ответ (лимит размера
+    или времени поиска), каталог делится на части поиском по подстроке:
+    по одному символу, а обрезанные части - дальше (term+символ, символ+term и
+    точный uid=term). Части выполняются параллельно, результаты объединяются.
+    """
+    uids, truncated = _find_uids(client, "")
+    if not truncated:
+        return uids
+
+    logger.warning("DIRECTORY_SCAN: user_find truncated at %s users, scanning by partitions", len(uids))
+    seen = set(UID_ALPHABET)
+    pending = [(c, False) for c in UID_ALPHABET]
+    queries = 1
+    while pending:
+        futures = {_submit(_find_uids, client, term, exact): term for term, exact in pending}
+        queries += len(pending)
+        pending = []
+        for future in as_completed(futures):
+            term = futures[future]
+            found, truncated = future.result()
+            uids.update(found)
+            if not truncated:
+                continue
+            if len(term) >= SCAN_MAX_TERM:
+                raise ScanIncomplete(f"Поиск по '{term}' всё ещё обрезан лимитом FreeIPA - увеличьте лимит поиска")
+            pending.append((term, True))
+            for c in UID_ALPHABET:
+                for child in (term + c, c + term):
+                    if child not in seen:
+                        seen.add(child)
+                        pending.append((child, False))
+
+    logger.info("DIRECTORY_SCAN: %s users listed in %s queries", len(uids), queries)
+    return uids
+
+
+def _show_batch(client: Client, uids: List[str]) -> List[Dict[str, Any]]:
+    """Полные записи (all=True) одним batch-запросом"""
+    result = client._request(
+        "batch",
+        args=[{"method": "user_show", "params": [[uid], {"all": True}]} for uid in uids],
+        params={}
+    )
+    users = []
+    for uid, item in zip(uids, result['results']):
+        if item.get('error'):
+            if item.get('error_name') == "NotFound":
+                # Удалён между перечислением и чтением
+                continue
+            raise FreeIPAError(message=f"user_show {uid}: {item['error']}", code=item.get('error_code'))
+        users.append(item['result'])
+    return users
+
+
+def scan_users(client: Client) -> Iterator[Dict[str, Any]]:
+    """
+    Полный скан каталога: записи всех пользователей (как user_find all=True), по uid
+
+    В отличие от одного user_find all=True не обрезается лимитами FreeIPA (см. _list_uids):
+    если каталог перечислить не удалось - ScanIncomplete, а не молча неполный результат.
+    Записи читаются batch-запросами по DIRECTORY_SCAN_BATCH пользователей, до
+    DIRECTORY_SCAN_WORKERS одновременно, и отдаются по мере готовности. Вперёд
+    отправлено не больше SCAN_WINDOW запросов: следующий уходит, когда вызывающий
+    забрал очередной, - ни вызывающему, ни скану не нужно держать весь ответ FreeIPA в памяти.
+    """
+    uids = sorted(_list_uids(client))
+    batches = (uids[start:start + DIRECTORY_SCAN_BATCH] for start in range(0, len(uids), DIRECTORY_SCAN_BATCH))
+    futures = deque(_submit(_show_batch, client, batch) for batch in itertools.islice(batches, SCAN_WINDOW))
+    try:
+        while futures:
+            users = futures.popleft().result()
+            batch = next(batches, None)
+            if batch is not None:
+                futures.append(_submit(_show_batch, client, batch))
+            yield from users
+    finally:
+        # Вызывающий прервал чтение или ошибка - невыполненные части не нужны
+        for future in futures:
+            future.cancel()
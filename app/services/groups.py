@@ -0,0 +1,102 @@
+import difflib
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from python_freeipa import Client
+from app.config import logger, GROUP_CATALOG_TTL, GROUP_CATALOG_MISS_REFRESH
+
+
+class GroupCatalog:
+    """
+    Каталог групп FreeIPA, общий для всех запросов
+
+    Все группы загружаются одним group_find и обновляются раз в `ttl` секунд.
+    Проверки существования и подсказки "возможно, вы имели в виду" считаются локально.
+    Если группа не найдена, каталог один раз перечитывается (не чаще чем раз в
+    `miss_refresh` секунд) - чтобы только что созданная группа не считалась отсутствующей.
+    """
+
+    def __init__(self, ttl: float, miss_refresh: float):
+        self.ttl = ttl
+        self.miss_refresh = miss_refresh
+        self._lock = threading.Lock()
+        # (name.lower() -> {"name", "description"}, отсортированные ключи) - меняются одним присваиванием
+        self._snapshot: Tuple[Dict[str, Dict[str, Any]], List[str]] = ({}, [])
+        self._loaded_at = 0.0
+
+    def refresh(self, client: Client, max_age: float = 0) -> None:
+        """Перечитывает все группы одним запросом (если каталог старше max_age секунд)"""
+        with self._lock:
+            # Пока ждали блокировку, каталог мог обновить другой запрос
+            if self._loaded_at and time.monotonic() - self._loaded_at < max_age:
+                return
+
+            result = client._request(
+                "group_find",
+                args=[],
+                params={"sizelimit": 0, "no_members": True}
+            )
+
+            groups = {}
+            for group in result['result']:
+                name = group['cn'][0]
+                groups[name.lower()] = {
+                    "name": name,
+                    "description": group.get('description', [None])[0]
+                }
+
+            self._snapshot = (groups, sorted(groups))
+            self._loaded_at = time.monotonic()
+            logger.info("GROUP_CATALOG: Loaded %s groups", len(groups))
+
+    def _ensure_loaded(self, client: Client) -> None:
+        if not self._loaded_at or time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh(client, max_age=self.ttl)
+
+    def missing(self, client: Client, names: List[str]) -> List[str]:
+        """Возвращает группы из списка, которых нет в FreeIPA"""
+        self._ensure_loaded(client)
+        missing = [name for name in names if name.lower() not in self._snapshot[0]]
+
+        if missing and time.monotonic() - self._loaded_at > self.miss_refresh:
+            self.refresh(client, max_age=self.miss_refresh)
+            missing = [name for name in missing if name.lower() not in self._snapshot[0]]
+
+        return missing
+
+    def exists(self, client: Client, name: str) -> bool:
+        return not self.missing(client, [name])
+
+    def suggest(self, client: Client, name: str, limit: int = 3) -> List[str]:
+        """Похожие имена групп для сообщений об ошибках"""
+        self._ensure_loaded(client)
+        groups, keys = self._snapshot
+        matches = difflib.get_close_matches(name.lower(), keys, n=limit, cutoff=0.6)
+        return [groups[match]["name"] for match in matches]
+
+    def describe_missing(self, client: Client, names: List[str]) -> str:
+        """Текст ошибки по отсутствующим группам с подсказками"""
+        parts = []
+        for name in names:
+            suggestions = self.suggest(client, name)
+            if suggestions:
+                parts.append(f"{name} (возможно: {', '.join(suggestions)})")
+            else:
+                parts.append(name)
+        return ", ".join(parts)
+
+    def page(self, client: Client, query: Optional[str] = None,
+             offset: int = 0, limit: int = 50) -> Tuple[int, List[Dict[str, Any]]]:
+        """Страница каталога (сортировка по имени, фильтр по подстроке)"""
+        self._ensure_loaded(client)
+        groups, keys = self._snapshot
+        if query:
+            query = query.lower()
+            keys = [key for key in keys if query in key]
+        return len(keys), [groups[key] for key in keys[offset:offset + limit]]
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+
+
+group_catalog = GroupCatalog(ttl=GROUP_CATALOG_TTL, miss_refresh=GROUP_CATALOG_MISS_REFRESH)
@@ -0,0 +1,77 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+# Массовые операции, которые выполняются прямо сейчас (для graceful shutdown и диагностики)
+_lock = threading.Condition()
+_operations: Dict[str, Dict[str, Any]] = {}
+# Операция текущего запроса - доходит до потоков, куда передан контекст (run_in_threadpool)
+operation_var: ContextVar[Optional[str]] = ContextVar("bulk_operation", default=None)
+
+
+def is_bulk_path(path: str) -> bool:
+    """Массовые ручки: users/bulk-* (delete, disable, enable, reset-password, create-from-excel, jobs), users/reconcile, groups/bulk-*"""
+    return "/users/bulk-" in path or "/users/reconcile" in path or "/groups/bulk-" in path
+
+
+def begin_operation(name: str, admin: str) -> str:
+    """Регистрирует начало операции, делает её текущей для контекста и возвращает её id"""
+    op_id = uuid.uuid4().hex
+    with _lock:
+        _operations[op_id] = {
+            "id": op_id,
+            "operation": name,
+            "admin": admin,
+            "started": time.time(),
+            "holders": 1
+        }
+    operation_var.set(op_id)
+    return op_id
+
+
+def end_operation(op_id: str) -> None:
+    """
+    Снимает операцию с учёта
+
+    Если операцию ещё держат потоки (hold_operation), она остаётся в учёте до их выхода:
+    задачу запроса uvicorn может отменить, а поток с вызовами FreeIPA продолжает работу.
+    """
+    with _lock:
+        op = _operations.get(op_id)
+        if op is None:
+            return
+        op["holders"] -= 1
+        if op["holders"] <= 0:
+            del _operations[op_id]
+        if not _operations:
+            _lock.notify_all()
+
+
+@contextmanager
+def hold_operation() -> Iterator[None]:
+    """Держит операцию текущего контекста в учёте, пока поток выполняет её элементы"""
+    op_id = operation_var.get()
+    with _lock:
+        held = op_id in _operations
+        if held:
+            _operations[op_id]["holders"] += 1
+    try:
+        yield
+    finally:
+        if held:
+            end_operation(op_id)
+
+
+def list_operations() -> List[Dict[str, Any]]:
+    """Снимок выполняющихся операций"""
+    with _lock:
+        return [dict(op) for op in _operations.values()]
+
+
+def wait_for_drain(timeout: float) -> bool:
+    """Ждёт завершения всех операций. Возвращает False, если время вышло"""
+    with _lock:
+        return _lock.wait_for(lambda: not _operations, timeout=timeout)
@@ -0,0 +1,181 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from python_freeipa import Client
+from app.config import logger, BULK_JOB_WORKERS, BULK_OPERATION_LEASE
+from app.services.admission import request_class_var
+from app.services.bulk import ItemResult, run_bulk
+from app.services.checkpoints import BulkOperation, get_progress
+from app.services.deadline import deadline_var
+from app.services.inflight import begin_operation, end_operation
+from app.services.storage import get_connection, register_schema
+
+# Фоновые массовые операции: прогресс - в журнале чекпоинтов, здесь только размер и отмена
+# (общие для всех воркеров - опрос и отмена могут прийти в любой)
+register_schema("""
+CREATE TABLE IF NOT EXISTS bulk_jobs (
+    operation_id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+""")
+
+_executor = ThreadPoolExecutor(max_workers=BULK_JOB_WORKERS, thread_name_prefix="bulk-job")
+# Выставляется, если операции не успели завершиться за GRACEFUL_SHUTDOWN_TIMEOUT
+_stopping = threading.Event()
+# Запущенные и ждущие свободного потока операции этого процесса. Пока процесс жив,
+# пульс (_heartbeat) обновляет их updated в журнале - операция, ждущая в очереди пула
+# или на долгом элементе, не выглядит брошенной (interrupted) дольше BULK_OPERATION_LEASE
+_active_lock = threading.Lock()
+_active: Set[str] = set()
+_heartbeat: Optional[threading.Thread] = None
+
+
+class JobInterrupted(Exception):
+    """Процесс завершается - операция остановлена (interrupted, продолжить по Idempotency-Key)"""
+
+
+def start_job(client: Client, operation: BulkOperation, name: str, admin: str,
+              items: List[Tuple[str, Any]], action: Callable[..., ItemResult],
+              on_finish: Optional[Callable[[Dict[str, Any]], None]] = None,
+              after_item: Optional[Callable[[str, str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Запускает run_bulk в фоне и сразу возвращает operation_id
+
+    Операция регистрируется как выполняющаяся (graceful shutdown ждёт её так же,
+    как синхронные bulk-запросы). Контекст логов запроса (request_id, admin)
+    переносится в поток операции. on_finish(results) вызывается после завершения,
+    after_item - после каждого элемента (как в run_bulk).
+    """
+    conn = get_connection()
+    # Строки операций, удалённых по BULK_OPERATION_RETENTION_DAYS
+    conn.execute("DELETE FROM bulk_jobs WHERE operation_id NOT IN (SELECT id FROM bulk_operations)")
+    conn.execute(
+        "INSERT OR REPLACE INTO bulk_jobs (operation_id, total, cancel_requested) VALUES (?, ?, 0)",
+        (operation.id, len(items))
+    )
+    op_id = begin_operation(name, admin)
+
+    def run() -> None:
+        # Фоновая операция - тяжёлая, даже если запущена лёгким запросом bulk-jobs
+        request_class_var.set("heavy")
+        # Дедлайн и отключение запустившего запроса к фоновой операции не относятся
+        deadline_var.set(None)
+        try:
+            results = run_bulk(client, operation, items, action, should_stop=lambda: _should_stop(operation.id),
+                               after_item=after_item)
+            logger.info("%s: Job %s finished - Success: %s, Failed: %s", name, operation.id,
+                        len(results['success']), len(results['failed']))
+            if on_finish is not None:
+                on_finish(results)
+        except Exception as e:
+            logger.error("%s: Job %s failed - %s", name, operation.id, e)
+        finally:
+            end_operation(op_id)
+            _untrack(operation.id)
+
+    _track(operation.id)
+    try:
+        _executor.submit(contextvars.copy_context().run, run)
+    except RuntimeError:
+        _untrack(operation.id)
+        # Пул уже остановлен (процесс завершается)
+        end_operation(op_id)
+        operation.set_status("interrupted")
+        raise
+
+    logger.warning("%s: Job %s started, %s items", name, operation.id, len(items))
+    return {"operation_id": operation.id, "status": "running", "total": len(items)}
+
+
+def _track(operation_id: str) -> None:
+    global _heartbeat
+    with _active_lock:
+        _active.add(operation_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat_forever, name="bulk-job-heartbeat", daemon=True)
+            _heartbeat.start()
+
+
+def _untrack(operation_id: str) -> None:
+    with _active_lock:
+        _active.discard(operation_id)
+
+
+def _beat() -> None:
+    """Отмечает операции процесса живыми (updated = сейчас)"""
+    with _active_lock:
+        operation_ids = list(_active)
+    if not operation_ids:
+        return
+    get_connection().execute(
+        f"UPDATE bulk_operations SET updated = ? WHERE status = 'running' "
+        f"AND id IN ({', '.join('?' * len(operation_ids))})",
+        (time.time(), *operation_ids)
+    )
+
+
+def _beat_forever() -> None:
+    while True:
+        time.sleep(BULK_OPERATION_LEASE / 4)
+        try:
+            _beat()
+        except Exception as e:
+            logger.error("BULK_JOB: Heartbeat failed - %s", e)
+
+
+def _should_stop(operation_id: str) -> bool:
+    if _stopping.is_set():
+        raise JobInterrupted(operation_id)
+    return cancel_requested(operation_id)
+
+
+def cancel_requested(operation_id: str) -> bool:
+    row = get_connection().execute(
+        "SELECT cancel_requested FROM bulk_jobs WHERE operation_id = ?", (operation_id,)
+    ).fetchone()
+    return bool(row and row["cancel_requested"])
+
+
+def request_cancel(operation_id: str) -> bool:
+    """Просит фоновую операцию остановиться перед следующим элементом. False - такой операции нет"""
+    cursor = get_connection().execute(
+        "UPDATE bulk_jobs SET cancel_requested = 1 WHERE operation_id = ?", (operation_id,)
+    )
+    return cursor.rowcount > 0
+
+
+def job_progress(operation_id: str, since: int = 0, limit: int = 500) -> Optional[Dict[str, Any]]:
+    """Прогресс фоновой операции: total, счётчики и новые результаты после курсора since"""
+    progress = get_progress(operation_id, since, limit)
+    if progress is None:
+        return None
+
+    row = get_connection().execute(
+        "SELECT total, cancel_requested FROM bulk_jobs WHERE operation_id = ?", (operation_id,)
+    ).fetchone()
+    progress["total"] = row["total"] if row else None
+    progress["processed"] = progress["success"] + progress["failed"]
+    if progress["status"] == "running" and time.time() - progress["updated"] > BULK_OPERATION_LEASE:
+        # Пульс процесса, принявшего операцию, пропал - продолжить можно тем же Idempotency-Key
+        progress["status"] = "interrupted"
+    elif row and row["cancel_requested"] and progress["status"] == "running":
+        progress["status"] = "cancelling"
+    return progress
+
+
+def active_jobs() -> int:
+    """Фоновые операции процесса: выполняются или ждут свободного потока"""
+    return len(_active)
+
+
+def shutdown() -> None:
+    """Новые фоновые операции не принимаются; выполняющиеся дожидается wait_for_drain"""
+    _executor.shutdown(wait=False)
+
+
+def interrupt_all() -> None:
+    """Останавливает фоновые операции перед следующим элементом (не дождались при остановке)"""
+    _stopping.set()
@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+from app.services.admission import request_class_var
+from app.config import (
+    logger, IPA_LIMIT_MIN, IPA_LIMIT_MAX, IPA_LIMIT_INITIAL, IPA_LIMIT_QUEUE_TIMEOUT,
+    IPA_LIMIT_LATENCY_TOLERANCE, IPA_BACKOFF_BASE, IPA_BACKOFF_MAX
+)
+
+
+class BackendOverloaded(Exception):
+    """FreeIPA перегружена - запрос не дождался свободного слота"""
+
+
+class _Slot:
+    """Результат одного вызова для ограничителя"""
+
+    def __init__(self):
+        self.overloaded = False
+
+    def mark_overloaded(self) -> None:
+        """5xx, таймаут, обрыв соединения"""
+        self.overloaded = True
+
+
+class AdaptiveLimiter:
+    """
+    Адаптивный лимит одновременных запросов к FreeIPA (AIMD)
+
+    - успешный вызов при полностью занятом лимите: +1/limit (примерно +1 за "круг" запросов)
+    - задержка метода выше `latency_tolerance` x его базовой задержки: limit x 0.9
+      (базовая считается по каждому методу отдельно - полный user_find всегда дольше user_show)
+    - 5xx / таймаут / обрыв: limit x 0.5 и пауза перед новыми запросами
+      (экспоненциальная с джиттером, от `backoff_base` до `backoff_max` секунд)
+
+    Когда слотов не хватает, интерактивные запросы получают слот раньше тяжёлых
+    (request_class_var) - одиночный сброс пароля не ждёт за тысячей строк импорта.
+
+    Лимит держится в пределах [min_limit, max_limit]. Лимит на процесс: при
+    нескольких воркерах uvicorn суммарно к FreeIPA идёт до workers x limit запросов.
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, initial: int, queue_timeout: float,
+                 latency_tolerance: float, backoff_base: float, backoff_max: float):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_timeout = queue_timeout
+        self.latency_tolerance = latency_tolerance
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._cond = threading.Condition()
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._inflight = 0
+        self._waiting = 0
+        self._waiting_interactive = 0
+        self._latency: Dict[str, List[float]] = {}  # метод -> [быстрая EWMA, медленная EWMA], секунды
+        self._backoff_until = 0.0
+        self._consecutive_overloads = 0
+        self._last_decrease = 0.0
+
+        self.requests = 0
+        self.overloads = 0
+        self.rejected = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _acquire(self) -> None:
+        deadline = time.monotonic() + self.queue_timeout
+        interactive = request_class_var.get() != "heavy"
+        with self._cond:
+            self._waiting += 1
+            if interactive:
+                self._waiting_interactive += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if (now >= self._backoff_until and self._inflight < int(self._limit)
+                            and (interactive or not self._waiting_interactive)):
+                        self._inflight += 1
+                        return
+                    if now >= deadline:
+                        self.rejected += 1
+                        raise BackendOverloaded(
+                            f"FreeIPA перегружена: нет свободного слота за {self.queue_timeout:.0f}с (лимит {self.limit})"
+                        )
+                    wake = min(deadline, self._backoff_until) if now < self._backoff_until else deadline
+                    self._cond.wait(max(wake - now, 0.01))
+            finally:
+                self._waiting -= 1
+                if interactive:
+                    self._waiting_interactive -= 1
+                    # Тяжёлые ждали, пока есть интерактивные
+                    self._cond.notify_all()
+
+    def _release(self, method: str, latency: float, overloaded: bool) -> None:
+        with self._cond:
+            saturated = self._inflight >= int(self._limit)
+            self._inflight -= 1
+            self.requests += 1
+
+            if overloaded:
+                self.overloads += 1
+                self._consecutive_overloads += 1
+                self._limit = max(self.min_limit, self._limit * 0.5)
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (self._consecutive_overloads - 1))
+                self._backoff_until = time.monotonic() + delay * random.uniform(0.5, 1.0)
+                logger.warning("IPA_LIMITER: Backend overloaded, limit %s, backoff %.1fs", self.limit, delay)
+            else:
+                self._consecutive_overloads = 0
+                stats = self._latency.setdefault(method, [latency, latency])
+                stats[0] = 0.8 * stats[0] + 0.2 * latency
+                # Базовая быстро идёт вниз и медленно вверх - под долгой перегрузкой не "привыкает" к ней
+                weight = 0.5 if latency < stats[1] else 0.001
+                stats[1] = (1 - weight) * stats[1] + weight * latency
+
+                now = time.monotonic()
+                # Не чаще раза за время одного запроса - иначе одна медленная волна обнулит лимит
+                if stats[0] > self.latency_tolerance * stats[1] and now - self._last_decrease > stats[0]:
+                    self._limit = max(self.min_limit, self._limit * 0.9)
+                    self._last_decrease = now
+                elif saturated:
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, method: str):
+        """Слот для одного вызова FreeIPA. Ошибки перегрузки отмечать через slot.mark_overloaded()"""
+        self._acquire()
+        slot = _Slot()
+        started = time.monotonic()
+        try:
+            yield slot
+        finally:
+            self._release(method, time.monotonic() - started, slot.overloaded)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "inflight": self._inflight,
+                "waiting": self._waiting,
+                "waiting_interactive": self._waiting_interactive,
+                "latency_ms": {method: round(stats[0] * 1000, 1) for method, stats in self._latency.items()},
+                "backoff_remaining": round(max(0.0, self._backoff_until - time.monotonic()), 2),
+                "requests_total": self.requests,
+                "overloads_total": self.overloads,
+                "rejected_total": self.rejected
+            }
+
+
+ipa_limiter = AdaptiveLimiter(
+    min_limit=IPA_LIMIT_MIN,
+    max_limit=IPA_LIMIT_MAX,
+    initial=IPA_LIMIT_INITIAL,
+    queue_timeout=IPA_LIMIT_QUEUE_TIMEOUT,
+    latency_tolerance=IPA_LIMIT_LATENCY_TOLERANCE,
+    backoff_base=IPA_BACKOFF_BASE,
+    backoff_max=IPA_BACKOFF_MAX
+)
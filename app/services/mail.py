@@ -0,0 +1,234 @@
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from typing import Any, Callable, Dict, List, Optional
+from app.config import (
+    logger, SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, SMTP_SECURITY, SMTP_FROM,
+    SMTP_TIMEOUT, SMTP_QUEUE_SIZE, SMTP_QUEUE_TIMEOUT, SMTP_RETRIES, SMTP_RETRY_DELAY, SMTP_IDLE_TIMEOUT
+)
+
+
+class MailTicket:
+    """Письмо в очереди: status queued -> sent | failed"""
+
+    def __init__(self, to: str, message: EmailMessage, on_done: Optional[Callable[["MailTicket"], None]] = None):
+        self.to = to
+        self.message = message
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self._on_done = on_done
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def as_dict(self) -> Dict[str, Any]:
+        result = {"to": self.to, "status": self.status}
+        if self.error:
+            result["error"] = self.error
+        return result
+
+    def _finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self._done.set()
+        if self._on_done is not None:
+            try:
+                self._on_done(self)
+            except Exception as e:
+                logger.error("MAIL: Status callback failed for %s - %s", self.to, e)
+
+
+class MailSender:
+    """
+    Отправка писем через одно SMTP-соединение из фонового потока
+
+    - письма ставятся в ограниченную очередь (`queue_size`); если она полна дольше
+      `queue_timeout` секунд, письмо сразу получает failed - отправитель не копит память
+    - соединение (STARTTLS/SSL + логин) открывается при первом письме и переиспользуется;
+      закрывается после `idle_timeout` секунд без писем
+    - временные ошибки (обрыв, таймаут, 4xx) повторяются до `retries` раз с паузой
+      `retry_delay` x 2^попытка и переподключением; 5xx (адрес отклонён) - сразу failed
+    """
+
+    def __init__(self, host: Optional[str], port: int, username: Optional[str], password: Optional[str],
+                 security: str, sender: Optional[str], timeout: float, queue_size: int,
+                 queue_timeout: float, retries: int, retry_delay: float, idle_timeout: float):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.sender = sender or username
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+
+        self._queue: "queue.Queue[Optional[MailTicket]]" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._smtp: Optional[smtplib.SMTP] = None
+
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.host and self.sender)
+
+    def send(self, to: str, subject: str, body: str,
+             on_done: Optional[Callable[[MailTicket], None]] = None) -> MailTicket:
+        """Ставит письмо в очередь. Результат - в ticket (status, error) и через on_done"""
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+
+        ticket = MailTicket(to, message, on_done)
+        if not self.enabled:
+            ticket._finish("failed", "SMTP не настроен")
+            return ticket
+
+        self._ensure_worker()
+        try:
+            self._queue.put(ticket, timeout=self.queue_timeout)
+        except queue.Full:
+            self.failed += 1
+            ticket._finish("failed", "Очередь писем переполнена")
+            logger.error("MAIL: Queue full, dropped message to %s", to)
+        return ticket
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="mail-sender", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                ticket = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            if ticket is None:
+                self._disconnect()
+                return
+            try:
+                self._deliver(ticket)
+            finally:
+                self._queue.task_done()
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._smtp is None:
+            if self.security == "ssl":
+                smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+            else:
+                smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+                if self.security == "starttls":
+                    smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            self._smtp = smtp
+            self.connections += 1
+            logger.info("MAIL: Connected to %s:%s", self.host, self.port)
+        return self._smtp
+
+    def _disconnect(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _deliver(self, ticket: MailTicket) -> None:
+        error = None
+        for attempt in range(self.retries + 1):
+            ticket.attempts = attempt + 1
+            try:
+                self._connect().send_message(ticket.message)
+                self.sent += 1
+                ticket._finish("sent")
+                logger.info("MAIL: Sent to %s", ticket.to)
+                return
+            except smtplib.SMTPRecipientsRefused as e:
+                # Адрес отклонён сервером - повтор не поможет
+                self.failed += 1
+                ticket._finish("failed", f"Адрес отклонён: {e.recipients.get(ticket.to, e.recipients)}")
+                logger.warning("MAIL: Recipient refused %s", ticket.to)
+                return
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500:
+                    self.failed += 1
+                    ticket._finish("failed", f"SMTP {e.smtp_code}: {e.smtp_error!r}")
+                    logger.warning("MAIL: Permanent failure for %s - %s", ticket.to, e.smtp_code)
+                    return
+                error = f"SMTP {e.smtp_code}: {e.smtp_error!r}"
+            except (smtplib.SMTPException, OSError) as e:
+                error = str(e) or e.__class__.__name__
+
+            # Временная ошибка - новое соединение и пауза
+            self._disconnect()
+            if attempt < self.retries:
+                delay = self.retry_delay * 2 ** attempt
+                logger.warning("MAIL: Attempt %s for %s failed (%s), retry in %.0fs", attempt + 1, ticket.to, error, delay)
+                time.sleep(delay)
+
+        self.failed += 1
+        ticket._finish("failed", error)
+        logger.error("MAIL: Giving up on %s after %s attempts - %s", ticket.to, ticket.attempts, error)
+
+    def shutdown(self, timeout: float) -> None:
+        """Дожидается отправки очереди (не дольше timeout) и закрывает соединение"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if self._queue.unfinished_tasks:
+            logger.error("MAIL: %s messages not sent on shutdown", self._queue.unfinished_tasks)
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "sent_total": self.sent,
+            "failed_total": self.failed,
+            "connections_total": self.connections
+        }
+
+
+def wait_all(tickets: List[MailTicket], timeout: float) -> None:
+    """Ждёт результата всех писем (общий таймаут)"""
+    deadline = time.monotonic() + timeout
+    for ticket in tickets:
+        if not ticket.wait(max(0.0, deadline - time.monotonic())):
+            break
+
+
+mail_sender = MailSender(
+    host=SMTP_HOST,
+    port=SMTP_PORT,
+    username=SMTP_USERNAME,
+    password=SMTP_PASSWORD,
+    security=SMTP_SECURITY,
+    sender=SMTP_FROM,
+    timeout=SMTP_TIMEOUT,
+    queue_size=SMTP_QUEUE_SIZE,
+    queue_timeout=SMTP_QUEUE_TIMEOUT,
+    retries=SMTP_RETRIES,
+    retry_delay=SMTP_RETRY_DELAY,
+    idle_timeout=SMTP_IDLE_TIMEOUT
+)
@@ -0,0 +1,159 @@
+from typing import Any, Dict, List, Optional, Tuple
+from python_freeipa import Client
+from app.config import logger, GROUP_MEMBER_CHUNK
+from app.services.cache import invalidate_user
+from app.services.changes import record_change
+from app.services.directory import directory_index
+from app.services.freeipa import resolve_username
+from app.services.groups import group_catalog
+from app.services.inflight import hold_operation
+
+# Ответы FreeIPA по участнику, которые означают "уже в нужном состоянии"
+ALREADY_DONE = {
+    "add": ("already a member", "already_member"),
+    "remove": ("not a member", "not_member"),
+}
+
+
+def resolve_identifiers(client: Client, identifiers: List[str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    username / email -> username для многих пользователей сразу
+
+    Email ищутся в индексе каталога (без запросов в FreeIPA), не найденные там -
+    отдельным user_find (пользователь мог появиться после загрузки индекса).
+    Возвращает (identifier -> username, identifier -> ошибка).
+    """
+    resolved: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    emails = [identifier for identifier in identifiers if "@" in identifier]
+    for identifier in identifiers:
+        if "@" not in identifier:
+            resolved[identifier] = identifier
+
+    if emails and (directory_index.ensure_fresh() or directory_index.wait(30)):
+        found = directory_index.lookup("mail", emails)
+        for email in emails:
+            record = found.get(email.lower())
+            if record is not None:
+                resolved[email] = record["uid"]
+
+    for email in emails:
+        if email in resolved:
+            continue
+        try:
+            resolved[email] = resolve_username(client, email)
+        except ValueError as e:
+            errors[email] = str(e)
+        except Exception as e:
+            errors[email] = f"Ошибка поиска пользователя: {e}"
+
+    return resolved, errors
+
+
+def apply_members(client: Client, action: str, group: str,
+                  usernames: List[str]) -> Tuple[Dict[str, Tuple[str, Optional[str]]], int]:
+    """
+    Один group_add_member / group_remove_member на каждые GROUP_MEMBER_CHUNK пользователей
+
+    Возвращает (username -> (статус, ошибка), число вызовов FreeIPA). Статусы:
+    added / removed, already_member / not_member, failed.
+    """
+    command = "group_add_member" if action == "add" else "group_remove_member"
+    done_status = "added" if action == "add" else "removed"
+    noop_reason, noop_status = ALREADY_DONE[action]
+
+    outcome: Dict[str, Tuple[str, Optional[str]]] = {}
+    calls = 0
+    for start in range(0, len(usernames), GROUP_MEMBER_CHUNK):
+        chunk = usernames[start:start + GROUP_MEMBER_CHUNK]
+        calls += 1
+        try:
+            response = client._request(command, args=[group], params={"user": chunk})
+        except Exception as e:
+            for username in chunk:
+                outcome[username] = ("failed", str(e))
+            continue
+
+        # Отказы по отдельным участникам - в failed.member.user: [[имя, причина], ...]
+        refused = {
+            str(member).lower(): str(reason)
+            for member, reason in response.get('failed', {}).get('member', {}).get('user', [])
+        }
+        for username in chunk:
+            reason = refused.get(username.lower())
+            if reason is None:
+                outcome[username] = (done_status, None)
+            elif noop_reason in reason.lower():
+                outcome[username] = (noop_status, None)
+            else:
+                outcome[username] = ("failed", reason)
+    return outcome, calls
+
+
+@hold_operation()
+def change_membership(client: Client, action: str, identifiers: List[str], groups: List[str]) -> Dict[str, Any]:
+    """
+    Добавляет (action="add") или удаляет (action="remove") пользователей в / из групп
+
+    На каждую группу - group_add_member / group_remove_member со списком из
+    GROUP_MEMBER_CHUNK пользователей; отказы FreeIPA по отдельным участникам
+    разбираются из поля failed ответа. Результат - по каждой паре (пользователь, группа):
+    added / removed, already_member / not_member (изменений не было) или failed.
+    """
+    done_status = "added" if action == "add" else "removed"
+
+    identifiers = list(dict.fromkeys(identifiers))
+    groups = list(dict.fromkeys(groups))
+    resolved, errors = resolve_identifiers(client, identifiers)
+
+    # username -> исходные identifier (один пользователь мог прийти и по логину, и по email)
+    by_username: Dict[str, List[str]] = {}
+    for identifier, username in resolved.items():
+        by_username.setdefault(username, []).append(identifier)
+    usernames = list(by_username)
+
+    results: List[Dict[str, Any]] = []
+
+    def add_result(username: str, group: str, status: str, error: Optional[str] = None) -> None:
+        for identifier in by_username[username]:
+            entry = {"identifier": identifier, "username": username, "group": group, "status": status}
+            if error:
+                entry["error"] = error
+            results.append(entry)
+
+    for identifier, error in errors.items():
+        for group in groups:
+            results.append({"identifier": identifier, "username": None, "group": group, "status": "failed", "error": error})
+
+    missing_groups = set(group_catalog.missing(client, groups)) if groups else set()
+    for group in missing_groups:
+        error = f"Группа не существует: {group_catalog.describe_missing(client, [group])}"
+        for username in usernames:
+            add_result(username, group, "failed", error)
+
+    changed = set()
+    calls = 0
+    for group in groups:
+        if group in missing_groups:
+            continue
+        outcome, group_calls = apply_members(client, action, group, usernames)
+        calls += group_calls
+        for username, (status, error) in outcome.items():
+            add_result(username, group, status, error)
+            if status == done_status:
+                changed.add(username)
+
+    for username in changed:
+        invalidate_user(username)
+        record_change(username, "modified")
+    if changed:
+        directory_index.mark_stale()
+
+    summary: Dict[str, int] = {}
+    for entry in results:
+        summary[entry["status"]] = summary.get(entry["status"], 0) + 1
+
+    logger.info("GROUP_MEMBERSHIP: %s %s users x %s groups in %s calls - %s",
+                action, len(identifiers), len(groups), calls, summary)
+    return {"summary": summary, "ipa_calls": calls, "results": results}
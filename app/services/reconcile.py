@@ -0,0 +1,235 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+from python_freeipa import Client
+from app.config import logger
+from app.services.bulk import create_user_from_row
+from app.services.cache import invalidate_user
+from app.services.changes import record_change
+from app.services.checkpoints import fingerprint
+from app.services.directory import DirectoryIndex, directory_index
+from app.services.groups import group_catalog
+from app.services.inflight import hold_operation
+from app.services.membership import apply_members
+from excel_import.rows import parse_excel_row, parse_fio, parse_groups
+from app.utils.validation import is_valid_email
+
+# Колонка шаблона -> атрибут FreeIPA, который сверяем у существующих пользователей
+RECONCILED_FIELDS = (("title", "title"), ("phone", "telephonenumber"), ("email", "mail"))
+
+
+def _differs(field: str, current: Optional[str], desired: str) -> bool:
+    if field == "mail":
+        return (current or "").lower() != desired.lower()
+    return (current or "") != desired
+
+
+def build_plan(client: Client, rows: List[Tuple[int, tuple]], disable_missing: bool = False,
+               scope_group: Optional[str] = None, protected: Set[str] = frozenset()) -> Dict[str, Any]:
+    """
+    Сравнивает список из шаблона (желаемое состояние) с каталогом FreeIPA
+
+    Каталог читается один раз в собственный индекс сверки (от имени администратора,
+    общий directory_index не трогаем - он строится сервисной учёткой), дальше всё
+    сравнение - в памяти.
+    Пользователь из строки ищется по username из ФИО, затем по email. В план попадают
+    только реальные расхождения:
+    - create - пользователя нет в каталоге
+    - update - title / телефон / email отличаются (пустая ячейка - "не менять")
+    - group_add / group_remove - членство в группах, упомянутых в файле (остальные группы
+      пользователя не трогаем)
+    - disable - включённые участники scope_group, которых нет в файле (только disable_missing)
+    Строки с ошибками (нет ФИО, невалидный email, дубликаты, несуществующие группы) - в errors.
+    """
+    index = DirectoryIndex(ttl=0, stale_refresh=0)
+    index.refresh(client)
+
+    errors: List[Dict[str, Any]] = []
+    parsed = []
+    managed_groups: Set[str] = set()
+    for row_num, row in rows:
+        data = parse_excel_row(row)
+        fio_parsed = parse_fio(data["fio"])
+        if not fio_parsed:
+            errors.append({"row": row_num, "fio": data["fio"], "error": "ФИО должно содержать минимум Фамилию и Имя"})
+            continue
+        if data["email"] and not is_valid_email(data["email"]):
+            errors.append({"row": row_num, "fio": data["fio"], "error": f"Невалидный email: {data['email']}"})
+            continue
+        # Имена групп в FreeIPA - в нижнем регистре
+        groups = [group.lower() for group in parse_groups(data["groups_str"])]
+        managed_groups.update(groups)
+        parsed.append((row_num, row, data, fio_parsed[2], groups))
+
+    by_uid = index.lookup("uid", [username for _, _, _, username, _ in parsed])
+    by_mail = index.lookup("mail", [data["email"] for _, _, data, _, _ in parsed if data["email"]])
+
+    missing_groups = set(group_catalog.missing(client, sorted(managed_groups))) if managed_groups else set()
+    if missing_groups:
+        errors.append({
+            "row": None,
+            "error": f"Группы не существуют: {group_catalog.describe_missing(client, sorted(missing_groups))}"
+        })
+    managed_groups -= missing_groups
+
+    plan: Dict[str, Any] = {
+        "create": [],
+        "update": [],
+        "group_add": {},
+        "group_remove": {},
+        "disable": [],
+        "unchanged": 0,
+        "errors": errors,
+        "managed_groups": sorted(managed_groups)
+    }
+    seen: Dict[str, int] = {}
+
+    for row_num, row, data, username, groups in parsed:
+        record = by_uid.get(username)
+        matched_by = "username"
+        if record is None and data["email"]:
+            record = by_mail.get(data["email"].lower())
+            matched_by = "email"
+        key = record["uid"] if record else username
+
+        if key in seen:
+            errors.append({"row": row_num, "fio": data["fio"],
+                           "error": f"Пользователь {key} уже указан в строке {seen[key]}"})
+            continue
+        seen[key] = row_num
+
+        if record is None:
+            if not data["email"]:
+                errors.append({"row": row_num, "fio": data["fio"], "error": "Email не заполнен"})
+            elif set(groups) & missing_groups:
+                errors.append({"row": row_num, "fio": data["fio"], "username": username,
+                               "error": "Пользователь не будет создан: в строке несуществующие группы"})
+            else:
+                plan["create"].append({"row": row_num, "fio": data["fio"], "username": username,
+                                       "email": data["email"], "groups": groups, "_row": row})
+            continue
+
+        changed = False
+        changes = {}
+        for column, attr in RECONCILED_FIELDS:
+            desired = data[column]
+            if desired and _differs(attr, record[attr], desired):
+                changes[attr] = {"from": record[attr], "to": desired}
+        if changes:
+            plan["update"].append({"row": row_num, "username": key, "matched_by": matched_by, "changes": changes})
+            changed = True
+
+        current = {group.lower() for group in record["groups"]} & managed_groups
+        desired_groups = set(groups) & managed_groups
+        for group in desired_groups - current:
+            plan["group_add"].setdefault(group, []).append(key)
+            changed = True
+        for group in current - desired_groups:
+            plan["group_remove"].setdefault(group, []).append(key)
+            changed = True
+
+        if not changed:
+            plan["unchanged"] += 1
+
+    if disable_missing and scope_group:
+        listed = set(seen)
+        _, members = index.search(enabled=True, group=scope_group, limit=len(index))
+        plan["disable"] = [
+            record["uid"] for record in members
+            if record["uid"] not in listed and record["uid"] not in protected
+        ]
+
+    plan["summary"] = {
+        "rows": len(rows),
+        "create": len(plan["create"]),
+        "update": len(plan["update"]),
+        "group_add": sum(len(users) for users in plan["group_add"].values()),
+        "group_remove": sum(len(users) for users in plan["group_remove"].values()),
+        "disable": len(plan["disable"]),
+        "unchanged": plan["unchanged"],
+        "errors": len(errors)
+    }
+    return plan
+
+
+@hold_operation()
+def apply_plan(client: Client, plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Выполняет план build_plan: только операции из плана, без повторных проверок каталога
+
+    update - один user_mod с изменёнными атрибутами; членство - один вызов на группу
+    (по GROUP_MEMBER_CHUNK пользователей). Результат - по каждой операции: status + error.
+    """
+    results: Dict[str, List[Dict[str, Any]]] = {"create": [], "update": [], "group_add": [],
+                                                "group_remove": [], "disable": []}
+    touched: Dict[str, str] = {}
+    created: List[str] = []
+    calls = 0
+
+    for entry in plan["create"]:
+        status, result = create_user_from_row(client, entry["row"], entry["_row"])
+        calls += 1
+        # Пароли в ответ не отдаём - только Yopass ссылки
+        result.pop("password", None)
+        results["create"].append({**result, "status": "created" if status == "success" else "failed"})
+        if status == "success":
+            # create_user_from_row сам пишет "created" в журнал изменений
+            created.append(entry["username"])
+
+    for entry in plan["update"]:
+        params = {attr: change["to"] for attr, change in entry["changes"].items()}
+        calls += 1
+        try:
+            client._request("user_mod", args=[entry["username"]], params=params)
+            results["update"].append({"username": entry["username"], "status": "updated", "fields": sorted(params)})
+            touched.setdefault(entry["username"], "modified")
+        except Exception as e:
+            results["update"].append({"username": entry["username"], "status": "failed", "error": str(e)})
+
+    for action, key in (("add", "group_add"), ("remove", "group_remove")):
+        for group, usernames in plan[key].items():
+            outcome, group_calls = apply_members(client, action, group, usernames)
+            calls += group_calls
+            for username, (status, error) in outcome.items():
+                entry = {"username": username, "group": group, "status": status}
+                if error:
+                    entry["error"] = error
+                else:
+                    touched.setdefault(username, "modified")
+                results[key].append(entry)
+
+    for username in plan["disable"]:
+        calls += 1
+        try:
+            client._request("user_disable", args=[username], params={})
+            results["disable"].append({"username": username, "status": "disabled"})
+            touched[username] = "disabled"
+        except Exception as e:
+            results["disable"].append({"username": username, "status": "failed", "error": str(e)})
+
+    for username, change in touched.items():
+        invalidate_user(username)
+        record_change(username, change)
+    if touched or created:
+        directory_index.mark_stale()
+
+    failed = sum(1 for entries in results.values() for entry in entries if entry["status"] == "failed")
+    logger.info("RECONCILE: Applied %s calls, %s created, %s changed, %s failed", calls, len(created), len(touched), failed)
+    return {"ipa_calls": calls, "created": len(created), "changed_users": len(touched), "failed": failed,
+            "results": results}
+
+
+def public_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """План для ответа API (без исходных строк файла)"""
+    return {
+        **plan,
+        "create": [{key: value for key, value in entry.items() if key != "_row"} for entry in plan["create"]]
+    }
+
+
+def fingerprint_plan(plan: Dict[str, Any]) -> str:
+    """
+    Отпечаток плана: apply=true выполняет план, только если он совпадает с показанным
+
+    Ключи сортируются, порядок списков задаётся файлом и каталогом - одинаковые
+    файл и каталог дают одинаковый отпечаток в любом воркере.
+    """
+    return fingerprint(public_plan(plan))
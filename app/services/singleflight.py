@@ -0,0 +1,86 @@
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type
+
+
+class _Call:
+    """Один выполняющийся вызов и его результат для ожидающих"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов (single-flight)
+
+    Первый вызов с ключом выполняется (лидер), остальные с тем же ключом, пришедшие
+    до его завершения, ждут и получают тот же результат или то же исключение.
+    Исключение из `retry_errors` относится к самому лидеру (его дедлайн, отключение
+    его клиента), а не к вызову: ожидающие его не получают и повторяют вызов сами -
+    один из них становится новым лидером. Результат не кэшируется: следующий вызов после завершения - новый запрос.
+    Если вызов был объединён, каждый (и лидер) получает глубокую копию результата -
+    вызывающий код может менять ответ, не задевая остальных.
+    """
+
+    def __init__(self, retry_errors: Tuple[Type[BaseException], ...] = ()):
+        self.retry_errors = retry_errors
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.retried = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    self.calls += 1
+                    break
+                call.waiters += 1
+                self.coalesced += 1
+
+            call.done.wait()
+            if isinstance(call.error, self.retry_errors):
+                # Ошибка касается только лидера - вызываем заново
+                with self._lock:
+                    self.retried += 1
+                continue
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            call.done.set()
+
+        # Исходный ответ остаётся нетронутым, пока его копируют ожидающие
+        return copy.deepcopy(call.result) if waiters else call.result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            inflight = len(self._calls)
+            waiting = sum(call.waiters for call in self._calls.values())
+        return {
+            "calls_total": self.calls,
+            "coalesced_total": self.coalesced,
+            "errors_total": self.errors,
+            "retried_total": self.retried,
+            "inflight": inflight,
+            "waiting": waiting
+        }
@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from python_freeipa import Client
+from app.config import logger, IPA_USERNAME, SNAPSHOT_DIR, SNAPSHOT_INTERVAL, SNAPSHOT_REBUILD_DELAY
+from app.services.changes import record_scan
+from app.services.freeipa import background_client, scan_users
+from app.utils.serialization import dumps
+
+try:
+    import fcntl
+except ImportError:  # Windows - без межпроцессной блокировки
+    fcntl = None
+
+
+class ReportSnapshots:
+    """
+    Снимки каталога для отчётов на локальном диске
+
+    Снимок - файл NDJSON (полная запись пользователя на строку, scan_users) и latest.json с
+    метаданными. Отчёты читают файл построчно, поэтому повторные выгрузки не
+    нагружают FreeIPA. Снимок пересобирается по расписанию (`interval` секунд,
+    через сервисную учётку) и после массовых изменений (с задержкой `rebuild_delay`,
+    чтобы серия операций дала одну пересборку).
+
+    Каталог общий для всех воркеров: собирает один (flock), остальные видят
+    новый latest.json. Выгрузка открывает файл снимка сразу при выборе (open_latest / open)
+    и читает из этого дескриптора - удаление старого файла при следующей пересборке
+    её не прерывает.
+    """
+
+    def __init__(self, directory: str, interval: float, rebuild_delay: float):
+        self.directory = directory
+        self.interval = interval
+        self.rebuild_delay = rebuild_delay
+        self._timer: Optional[threading.Timer] = None
+        self._timer_lock = threading.Lock()
+        self._meta_cache = (None, None)  # (mtime latest.json, meta)
+
+    @property
+    def _latest_path(self) -> str:
+        return os.path.join(self.directory, "latest.json")
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Метаданные последнего снимка или None"""
+        try:
+            mtime = os.stat(self._latest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        cached_mtime, meta = self._meta_cache
+        if cached_mtime != mtime:
+            with open(self._latest_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self._meta_cache = (mtime, meta)
+        return meta
+
+    @contextmanager
+    def _build_lock(self):
+        """Межпроцессная блокировка сборки (воркеры uvicorn)"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def build(self, client: Client, max_age: float = 0) -> Dict[str, Any]:
+        """
+        Полный скан каталога и сохранение снимка
+
+        max_age > 0 - если, пока ждали блокировку, другой воркер собрал снимок
+        моложе max_age секунд, возвращаем его без повторного скана.
+        """
+        with self._build_lock():
+            previous = self.latest()
+            if max_age and previous and time.time() - previous["created"] < max_age:
+                return previous
+
+            # Записи пишутся в файл по мере чтения из FreeIPA, весь каталог в памяти не держим
+            meta = self._store(scan_users(client), previous)
+            # Каждый скан заодно пополняет ленту изменений (report/changes).
+            # Скан полный (scan_users не отдаёт обрезанный каталог) - иначе
+            # пропавшие из ответа пользователи считались бы удалёнными
+            record_scan(self.iter_records(self.open(meta)))
+            return meta
+
+    def _store(self, users: Iterable[Dict[str, Any]], previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Записывает скан каталога как новый снимок (под _build_lock)"""
+        snapshot_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(self.directory, f"users-{snapshot_id}.ndjson")
+
+        # Колонки для csv/xlsx (все встретившиеся атрибуты) считаем сразу -
+        # при выгрузке не нужен второй проход по файлу
+        columns = {}
+        count = 0
+        try:
+            with open(path + ".tmp", "wb") as f:
+                for user in users:
+                    count += 1
+                    columns.update(dict.fromkeys(user))
+                    f.write(dumps(user))
+                    f.write(b"\n")
+        except BaseException:
+            # Скан оборвался - недописанный файл не нужен, остаётся предыдущий снимок
+            os.remove(path + ".tmp")
+            raise
+        os.replace(path + ".tmp", path)
+
+        meta = {
+            "id": snapshot_id,
+            "created": time.time(),
+            "file": os.path.basename(path),
+            "count": count,
+            "truncated": False,
+            "summary": f"{count} users matched",
+            "columns": sorted(columns, key=lambda c: (c != "uid", c))
+        }
+        with open(self._latest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(self._latest_path + ".tmp", self._latest_path)
+
+        # Предыдущий файл оставляем - запрос мог уже прочитать latest.json, но ещё не открыть файл
+        self._cleanup(keep={meta["file"], previous["file"] if previous else None})
+
+        logger.info("SNAPSHOT: Stored %s (%s users)", snapshot_id, meta["count"])
+        return meta
+
+    def _cleanup(self, keep: set) -> None:
+        for name in os.listdir(self.directory):
+            if name.startswith("users-") and name.endswith(".ndjson") and name not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def open(self, meta: Dict[str, Any]) -> BinaryIO:
+        """Открывает файл снимка. Открытый файл читается до конца, даже если его уже удалил _cleanup"""
+        return open(os.path.join(self.directory, meta["file"]), "rb")
+
+    def open_latest(self) -> Optional[Tuple[Dict[str, Any], BinaryIO]]:
+        """Последний снимок и его открытый файл; None - снимка ещё нет"""
+        for _ in range(3):
+            meta = self.latest()
+            if meta is None:
+                return None
+            try:
+                return meta, self.open(meta)
+            except FileNotFoundError:
+                # Между чтением latest.json и открытием файла прошли две пересборки
+                continue
+        return None
+
+    @staticmethod
+    def iter_raw(snapshot: BinaryIO) -> Iterator[bytes]:
+        """Строки открытого снимка как есть (JSON одной записи), без декодирования. Файл закрывается в конце"""
+        with snapshot:
+            for line in snapshot:
+                yield line.rstrip(b"\n")
+
+    @classmethod
+    def iter_records(cls, snapshot: BinaryIO) -> Iterator[Dict[str, Any]]:
+        """Записи открытого снимка по одной"""
+        for line in cls.iter_raw(snapshot):
+            yield json.loads(line)
+
+    def schedule_rebuild(self) -> None:
+        """
+        Пересборка после массовых изменений (несколько вызовов подряд - одна пересборка)
+
+        Снимок общий для всех администраторов - собирает сервисная учётка;
+        без IPA_USERNAME пересборки нет, отчёты соберут снимок при следующем fresh=true.
+        """
+        if not IPA_USERNAME:
+            return
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.rebuild_delay, self._rebuild_safe)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _rebuild_safe(self) -> None:
+        try:
+            self.build(background_client())
+        except Exception as e:
+            logger.error("SNAPSHOT: Rebuild failed - %s", e)
+
+    def start_scheduler(self, client_factory: Callable[[], Client]) -> None:
+        """Фоновая пересборка раз в interval секунд (если последний снимок старше)"""
+        if self.interval <= 0:
+            return
+
+        def run():
+            while True:
+                meta = self.latest()
+                age = time.time() - meta["created"] if meta else None
+                if age is None or age >= self.interval:
+                    try:
+                        self.build(client_factory(), max_age=self.interval)
+                    except Exception as e:
+                        logger.error("SNAPSHOT: Scheduled build failed - %s", e)
+                    age = 0
+                time.sleep(max(self.interval - age, 1))
+
+        threading.Thread(target=run, name="snapshot-scheduler", daemon=True).start()
+        logger.info("SNAPSHOT: Scheduler started, interval %ss", self.interval)
+
+
+report_snapshots = ReportSnapshots(
+    directory=SNAPSHOT_DIR,
+    interval=SNAPSHOT_INTERVAL,
+    rebuild_delay=SNAPSHOT_REBUILD_DELAY
+)
@@ -0,0 +1,37 @@
+import os
+import sqlite3
+import threading
+from typing import List
+from app.config import STATE_DB_PATH
+
+# Соединения SQLite не разделяются между потоками - держим по одному на поток
+_local = threading.local()
+# DDL модулей, которые хранят состояние в общей базе
+_schemas: List[str] = []
+
+
+def register_schema(ddl: str) -> None:
+    """Регистрирует DDL (CREATE ... IF NOT EXISTS), выполняется при открытии соединения"""
+    _schemas.append(ddl)
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.executescript(ddl)
+
+
+def get_connection() -> sqlite3.Connection:
+    """Возвращает соединение с базой состояния для текущего потока"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        directory = os.path.dirname(STATE_DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # isolation_level=None - autocommit, транзакции открываем явно через BEGIN
+        conn = sqlite3.connect(STATE_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")  # читатели не блокируют писателя (несколько воркеров)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for ddl in _schemas:
+            conn.executescript(ddl)
+        _local.conn = conn
+    return conn
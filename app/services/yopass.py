@@ -1,5 +1,6 @@
 import subprocess
-from app.config import YOPASS, YOPASS_URL
+from app.config import YOPASS, YOPASS_URL, YOPASS_TIMEOUT
+from app.services.deadline import call_timeout
 
 def create_yopass_link(username: str, password: str) -> str:
     secret_data = f"{username}\n{password}"
@@ -8,7 +9,9 @@ def create_yopass_link(username: str, password: str) -> str:
         [YOPASS, "--api", YOPASS_URL, "--url", YOPASS_URL, "--expiration=1w", "--one-time=true"],
         input=secret_data,
         capture_output=True,
-        text=True
+        text=True,
+        # Не дольше YOPASS_TIMEOUT и дедлайна запроса (по таймауту процесс завершается)
+        timeout=call_timeout(YOPASS_TIMEOUT)
     )
 
     yopass_link = link.stdout.strip()
@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import tempfile
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+from fastapi.responses import StreamingResponse
+from app.utils.serialization import dumps
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# формат -> (media type, расширение файла)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "xlsx": (XLSX_MEDIA_TYPE, "xlsx"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+CHUNK_SIZE = 64 * 1024
+CSV_BATCH_ROWS = 500
+
+
+def _cell(value: Any) -> Any:
+    """Значение ячейки CSV/XLSX: списки FreeIPA склеиваем через ';'"""
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ";".join(str(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+def iter_csv(columns: Sequence[str], rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """CSV построчно, отдаётся пачками по CSV_BATCH_ROWS строк"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_cell(row.get(column)) for column in columns])
+        if count % CSV_BATCH_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(columns: Sequence[str], rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Одна JSON-запись на строку. Пустой columns - запись целиком"""
+    lines = []
+    for row in rows:
+        record = {column: row.get(column) for column in columns} if columns else row
+        lines.append(dumps(record))
+        if len(lines) == CSV_BATCH_ROWS:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def iter_xlsx(columns: Sequence[str], rows: Iterable[Dict[str, Any]], title: str = "Report") -> Iterator[bytes]:
+    """
+    XLSX через write-only режим openpyxl
+
+    Строки сразу уходят во временный файл листа, в памяти книга не собирается.
+    XLSX - это zip, поэтому отдаём его после сборки, кусками из временного файла.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    sheet.append(list(columns))
+    for row in rows:
+        sheet.append([_cell(row.get(column)) for column in columns])
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while chunk := output.read(CHUNK_SIZE):
+            yield chunk
+
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Сжимает поток кусков в gzip на лету"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 - gzip-заголовок
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_response(columns: List[str], rows: Iterable[Dict[str, Any]], export_format: str,
+                    filename: str, gzip: bool = False, title: str = "Report") -> StreamingResponse:
+    """
+    Потоковый ответ с выгрузкой в csv / xlsx / ndjson
+
+    filename - без расширения. gzip=True отдаёт файл .gz (application/gzip).
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат {export_format}. Доступны: {', '.join(EXPORT_FORMATS)}")
+
+    media_type, extension = EXPORT_FORMATS[export_format]
+    if export_format == "csv":
+        chunks = iter_csv(columns, rows)
+    elif export_format == "xlsx":
+        chunks = iter_xlsx(columns, rows, title=title)
+    else:
+        chunks = iter_ndjson(columns, rows)
+
+    filename = f"{filename}.{extension}"
+    if gzip:
+        chunks = iter_gzip(chunks)
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
@@ -0,0 +1,199 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Optional
+
+# Поля контекста запроса (заполняются middleware и эндпоинтами)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+admin_var: ContextVar[str] = ContextVar("admin", default="-")
+operation_var: ContextVar[str] = ContextVar("operation", default="-")
+
+
+def bind_log_context(request_id: Optional[str] = None,
+                     admin: Optional[str] = None,
+                     operation: Optional[str] = None) -> None:
+    """Привязывает поля контекста к текущему запросу (попадают в каждую запись лога)"""
+    if request_id is not None:
+        request_id_var.set(request_id)
+    if admin is not None:
+        admin_var.set(admin)
+    if operation is not None:
+        operation_var.set(operation)
+
+
+class ContextFilter(logging.Filter):
+    """Копирует поля контекста в запись, пока мы ещё в потоке запроса"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.admin = admin_var.get()
+        record.operation = operation_var.get()
+        return True
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Ограничивает частоту одинаковых сообщений.
+
+    Ключ - шаблон сообщения (record.msg до подстановки аргументов) + request_id,
+    поэтому построчные сообщения массовых операций схлопываются: в окне `window`
+    секунд пропускается не больше `burst` записей, остальные отбрасываются.
+    Когда окно закрывается, последняя отброшенная запись передаётся в `sink`
+    с полем `suppressed` (сколько отброшено) - иначе счётчик завершившегося
+    запроса потерялся бы: следующей записи с тем же request_id уже не будет.
+    ERROR и выше не ограничиваются.
+    """
+
+    def __init__(self, burst: int = 20, window: float = 10.0,
+                 sink: Optional[Callable[[logging.LogRecord], None]] = None):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._counters = {}  # key -> [начало окна, пропущено, отброшено, последняя отброшенная запись]
+        self._next_sweep = 0.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR or self.burst <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.msg, getattr(record, "request_id", "-"))
+        now = time.monotonic()
+        expired = []
+
+        with self._lock:
+            if now >= self._next_sweep:
+                expired = self._sweep(now)
+                self._next_sweep = now + self.window
+
+            state = self._counters.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state and state[2]:
+                    record.suppressed = state[2]
+                self._counters[key] = [now, 1, 0, None]
+                allowed = True
+            elif state[1] < self.burst:
+                state[1] += 1
+                allowed = True
+            else:
+                state[2] += 1
+                state[3] = record
+                allowed = False
+
+        self._emit(expired)
+        return allowed
+
+    def flush(self) -> None:
+        """Отдаёт счётчики всех открытых окон (при остановке процесса)"""
+        with self._lock:
+            expired = self._sweep(float("inf"))
+        self._emit(expired)
+
+    def _sweep(self, now: float) -> list:
+        """Закрывает истёкшие окна, возвращает записи с числом отброшенных"""
+        expired = []
+        for key in [k for k, s in self._counters.items() if now - s[0] >= self.window]:
+            _, _, dropped, last = self._counters.pop(key)
+            if dropped:
+                last.suppressed = dropped
+                expired.append(last)
+        return expired
+
+    def _emit(self, records: list) -> None:
+        if self.sink is None:
+            return
+        for record in records:
+            self.sink(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Структурированный JSON - одна запись на строку"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "admin": getattr(record, "admin", "-"),
+            "operation": getattr(record, "operation", "-"),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Передаёт запись в фоновый поток без форматирования.
+
+    Стандартный QueueHandler.prepare() форматирует сообщение в потоке запроса -
+    здесь форматирование целиком перенесено в поток QueueListener.
+    Если очередь переполнена, запись отбрасывается: лог не должен тормозить запрос.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str = "INFO",
+                  fmt: str = "json",
+                  queue_size: int = 10000,
+                  repeat_burst: int = 20,
+                  repeat_window: float = 10.0) -> QueueListener:
+    """
+    Настраивает асинхронный логгинг: root -> очередь -> фоновый поток -> stdout
+
+    fmt: "json" (структурированный) или "text" (для локальной разработки)
+    """
+    if fmt == "text":
+        formatter = logging.Formatter(
+            "%(asctime)s - %(levelname)s - [%(request_id)s %(admin)s %(operation)s] %(message)s"
+        )
+    else:
+        formatter = JsonFormatter()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    # Итоги закрытых окон идут прямо в очередь, минуя фильтры
+    repeat_filter = RepeatFilter(burst=repeat_burst, window=repeat_window, sink=queue_handler.enqueue)
+    queue_handler.addFilter(repeat_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Дописываем очередь при остановке процесса (atexit вызывает в обратном порядке:
+    # сначала счётчики открытых окон, потом остановка listener)
+    atexit.register(listener.stop)
+    atexit.register(repeat_filter.flush)
+
+    return listener
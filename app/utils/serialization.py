@@ -0,0 +1,42 @@
+import json
+from typing import Any
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson опционален: uv sync --extra orjson
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """Типы вне JSON: даты и время - isoformat(), остальное - str()"""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    """
+    JSON в байтах (UTF-8, без экранирования кириллицы): orjson, если установлен
+
+    Даты orjson тоже отдаёт в _default (OPT_PASSTHROUGH_DATETIME) - ответ одинаковый
+    с orjson и без него.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON-ответ через orjson (если установлен, иначе стандартный json)
+
+    Ответ по умолчанию для всех ручек. Ручки с большими ответами (массовые операции,
+    проверка Excel, сверка) возвращают его сами - готовые dict сериализуются сразу,
+    без jsonable_encoder и валидации. Поэтому у них нет response_model (FastAPI
+    его бы не применил): модель указана в responses и описывает ответ только в OpenAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
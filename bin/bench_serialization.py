@@ -0,0 +1,179 @@
+"""
+Замеры сериализации JSON: путь ответа FastAPI для массовых операций и снимки каталога
+
+Запуск из корня репозитория:
+    uv run --extra orjson python bin/bench_serialization.py [--entries 10000] [--users 20000] [--repeat 5]
+
+Каждая строка - лучшее время из --repeat прогонов. Ответы идут через настоящий
+FastAPI (установленной версии) прямым вызовом ASGI-приложения, без сети и middleware.
+Без orjson строки с orjson пропускаются.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.models.bulk import BulkResult  # noqa: E402
+from app.utils import serialization  # noqa: E402
+from app.utils.serialization import FastJSONResponse, dumps  # noqa: E402
+
+
+def bulk_result(entries: int) -> Dict[str, Any]:
+    """Ответ bulk-reset-password на entries пользователей (10% ошибок)"""
+    success, failed = [], []
+    for n in range(entries):
+        if n % 10 == 9:
+            failed.append({"identifier": f"user{n}@example.com", "error": "Пользователь с email не найден"})
+        else:
+            success.append({"identifier": f"user{n}", "username": f"user{n}",
+                            "yopass_link": f"https://yopass.example.com/#/s/{n:032x}/key{n}"})
+    return {"success": success, "failed": failed, "operation_id": "0" * 32, "replayed": 0}
+
+
+def ipa_user(n: int) -> Dict[str, Any]:
+    """Запись как user_show all=True: атрибуты - списки"""
+    return {
+        "dn": f"uid=user{n},cn=users,cn=accounts,dc=example,dc=com",
+        "uid": [f"user{n}"], "givenname": ["Иван"], "sn": [f"Иванов{n}"], "cn": [f"Иван Иванов{n}"],
+        "displayname": [f"Иван Иванов{n}"], "initials": ["ИИ"], "gecos": [f"Ivan Ivanov{n}"],
+        "mail": [f"user{n}@example.com"], "title": ["Инженер"], "telephonenumber": ["+7 900 000-00-00"],
+        "uidnumber": [str(100000 + n)], "gidnumber": [str(100000 + n)], "loginshell": ["/bin/bash"],
+        "homedirectory": [f"/home/user{n}"], "krbprincipalname": [f"user{n}@EXAMPLE.COM"],
+        "krbcanonicalname": [f"user{n}@EXAMPLE.COM"], "nsaccountlock": False, "has_password": True,
+        "has_keytab": True, "memberof_group": ["ipausers", "developers", "vpn"],
+        "krbpasswordexpiration": ["20270101000000Z"], "krblastpwdchange": ["20260101000000Z"],
+        "ipauniqueid": [f"{n:08x}-0000-0000-0000-000000000000"],
+        "objectclass": ["top", "person", "organizationalperson", "inetorgperson", "inetuser",
+                        "posixaccount", "krbprincipalaux", "krbticketpolicyaux", "ipaobject",
+                        "ipasshuser", "ipaSshGroupOfPubKeys", "mepOriginEntry"]
+    }
+
+
+def best(fn: Callable[[], Any], repeat: int) -> float:
+    """Лучшее время вызова, мс"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000
+
+
+def endpoint_app(payload: Dict[str, Any]) -> FastAPI:
+    """Одна и та же ручка в вариантах ответа, которые сравниваем"""
+    app = FastAPI()
+
+    @app.get("/no-annotation")
+    def no_annotation():
+        return payload
+
+    @app.get("/dict", response_model=Dict[str, Any], response_class=JSONResponse)
+    def dict_json():
+        return payload
+
+    @app.get("/typed", response_model=BulkResult, response_class=JSONResponse)
+    def typed_json():
+        return payload
+
+    @app.get("/dict-fast", response_model=Dict[str, Any], response_class=FastJSONResponse)
+    def dict_fast():
+        return payload
+
+    @app.get("/typed-fast", response_model=BulkResult, response_class=FastJSONResponse)
+    def typed_fast():
+        return payload
+
+    @app.get("/direct", responses={200: {"model": BulkResult}})
+    def direct() -> FastJSONResponse:
+        return FastJSONResponse(payload)
+
+    return app
+
+
+def asgi_get(app: FastAPI, path: str) -> bytes:
+    """GET через ASGI-интерфейс приложения, тело ответа"""
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+             "query_string": b"", "headers": [], "server": ("bench", 80), "client": ("bench", 1)}
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    asyncio.run(app(scope, receive, send))
+    return b"".join(body)
+
+
+def with_orjson(enabled: bool, fn: Callable[[], Any]) -> Callable[[], Any]:
+    """fn с orjson или со стандартным json в dumps()"""
+    module = serialization.orjson
+
+    def run():
+        serialization.orjson = module if enabled else None
+        try:
+            return fn()
+        finally:
+            serialization.orjson = module
+    return run
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10000, help="элементов в ответе массовой операции")
+    parser.add_argument("--users", type=int, default=20000, help="пользователей в снимке")
+    parser.add_argument("--repeat", type=int, default=5, help="прогонов на строку")
+    args = parser.parse_args()
+    has_orjson = serialization.orjson is not None
+
+    import fastapi
+    import pydantic
+    print(f"FastAPI {fastapi.__version__}, pydantic {pydantic.VERSION}, "
+          f"orjson {'есть' if has_orjson else 'не установлен'}")
+
+    app = endpoint_app(bulk_result(args.entries))
+    rows = [
+        ("no annotation (jsonable_encoder + json)", "/no-annotation", False),
+        ("Dict[str, Any] (previous path)", "/dict", False),
+        ("typed model + json", "/typed", False),
+        ("Dict + orjson", "/dict-fast", True),
+        ("typed model + orjson", "/typed-fast", True),
+        ("FastJSONResponse direct (orjson)", "/direct", True),
+        ("FastJSONResponse direct (json)", "/direct", False),
+    ]
+    print(f"  {args.entries // 1000}k bulk result entries:")
+    for label, path, needs_orjson in rows:
+        if needs_orjson and not has_orjson:
+            continue
+        elapsed = best(with_orjson(needs_orjson, lambda: asgi_get(app, path)), args.repeat)
+        print(f"    {label:<42}{elapsed:>8.1f} ms")
+
+    users = [ipa_user(n) for n in range(args.users)]
+    lines = [json.dumps(user, ensure_ascii=False).encode("utf-8") + b"\n" for user in users]
+    rows = [
+        ("ndjson decode + dumps (before)", lambda: b"".join(dumps(json.loads(line)) + b"\n" for line in lines), True),
+        ("ndjson raw passthrough (after)", lambda: b"".join(line for line in lines), False),
+        ("snapshot write, json.dumps", lambda: [dumps(user) for user in users], False),
+        ("snapshot write, orjson", lambda: [dumps(user) for user in users], True),
+    ]
+    print(f"  {args.users // 1000}k users, full-info:")
+    for label, fn, needs_orjson in rows:
+        if needs_orjson and not has_orjson:
+            continue
+        elapsed = best(with_orjson(needs_orjson, fn), args.repeat)
+        print(f"    {label:<42}{elapsed:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from typing import Dict, Any, List, Tuple, Optional
+import csv
+from io import BytesIO, StringIO
+from excel_import.transliteration import transliterate
+
+def load_workbook(contents: bytes):
+    """Открывает Excel из байтов. openpyxl импортируется только при первом вызове (тяжёлый импорт)"""
+    import openpyxl
+
+    return openpyxl.load_workbook(BytesIO(contents))
+
+def parse_excel_row(row) -> Dict[str, Any]:
+    """Парсит строку Excel"""
+    return {
+        "fio": str(row[0]).strip() if row[0] else "",
+        "email": str(row[1]).strip() if len(row) > 1 and row[1] else "",
+        "phone": str(row[2]).strip() if len(row) > 2 and row[2] else None,
+        "title": str(row[3]).strip() if len(row) > 3 and row[3] else None,
+        "groups_str": str(row[4]).strip() if len(row) > 4 and row[4] else ""
+    }
+
+def parse_fio(fio: str) -> Optional[Tuple[str, str, str]]:
+    """Парсит ФИО и генерирует username. Возвращает (last_name, first_name, username) или None"""
+    fio_parts = fio.split()
+    if len(fio_parts) < 2:
+        return None
+
+    last_name = fio_parts[0]
+    first_name = fio_parts[1]
+    last_name_en = transliterate(last_name).lower()
+    first_name_en = transliterate(first_name).lower()
+    username = f"{first_name_en}.{last_name_en}"
+
+    return last_name, first_name, username
+
+def parse_groups(groups_str: str) -> List[str]:
+    """Парсит строку групп через запятую"""
+    if not groups_str:
+        return []
+    return [g.strip() for g in groups_str.split(',') if g.strip()]
+
+def read_rows(filename: str, contents: bytes) -> List[Tuple[int, tuple]]:
+    """
+    Строки шаблона из XLSX или CSV (по расширению файла): [(номер строки, значения), ...]
+
+    Заголовок и строки без ФИО пропускаются. CSV - UTF-8 (с BOM или без),
+    разделитель ";" или "," определяется по первой строке.
+    """
+    if (filename or "").lower().endswith(".csv"):
+        text = contents.decode("utf-8-sig")
+        delimiter = ";" if text.split("\n", 1)[0].count(";") > text.split("\n", 1)[0].count(",") else ","
+        rows = enumerate(csv.reader(StringIO(text), delimiter=delimiter), start=1)
+        rows = [(row_num, tuple(v.strip() or None for v in row)) for row_num, row in rows if row_num > 1]
+    else:
+        sheet = load_workbook(contents).active
+        rows = list(enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2))
+    return [(row_num, row) for row_num, row in rows if row and row[0]]
+
+def parse_upload(filename: str, contents: bytes) -> List[Tuple[int, tuple, Optional[str]]]:
+    """
+    Разбор загруженного файла целиком: [(номер строки, (fio, email, phone, title, groups), username), ...]
+
+    Выполняется в пуле процессов (app/services/excel_parser.py), поэтому возвращает
+    только строки - их дёшево передать обратно. Значения уже нормализованы
+    parse_excel_row, кортеж подходит везде, где ожидается строка Excel.
+    username - из ФИО (parse_fio), None если в ФИО меньше двух слов.
+    """
+    parsed = []
+    for row_num, row in read_rows(filename, contents):
+        data = parse_excel_row(row)
+        fio_parsed = parse_fio(data["fio"])
+        values = (data["fio"], data["email"], data["phone"], data["title"], data["groups_str"])
+        parsed.append((row_num, values, fio_parsed[2] if fio_parsed else None))
+    return parsed
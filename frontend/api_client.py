@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Таймауты (секунды): подключение / ответ
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "30"))
+# TTL кэша отчётов и шаблона (секунды, 0 - без кэша)
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "60"))
+API_TEMPLATE_TTL = int(os.getenv("API_TEMPLATE_TTL", "3600"))
+# Соединений к API на одну сессию Streamlit
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "4"))
+
+# Префиксы путей, ответы которых устаревают после изменений пользователей
+_USER_DATA_PREFIXES = ("/api/v1/report/",)
+
+
+class ApiError(Exception):
+    """Ошибка API: status_code 0 - сервер недоступен"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ApiClient:
+    """
+    Клиент API FastAPI для одной сессии Streamlit
+
+    - один requests.Session с пулом keep-alive соединений (без нового TCP/TLS на каждый вызов)
+    - таймауты на все запросы; GET повторяется при ошибке подключения
+    - кэш отчётов и шаблона с TTL, сбрасывается после изменений пользователей
+    - массовые операции выполняются на сервере в фоне, прогресс - опросом (bulk_job_progress)
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = (base_url or "").rstrip("/")
+
+        self.session = requests.Session()
+        retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3, allowed_methods=frozenset({"GET"}))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cache: Dict[Tuple[str, Tuple], Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    # --- транспорт ---
+
+    def request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """Запрос к API; при ответе не 2xx - ApiError с detail из ответа"""
+        try:
+            response = self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                timeout=(API_CONNECT_TIMEOUT, timeout or API_TIMEOUT),
+                **kwargs
+            )
+        except requests.Timeout:
+            raise ApiError(0, "Сервер не ответил вовремя")
+        except requests.RequestException as e:
+            raise ApiError(0, f"Ошибка подключения: {e}")
+
+        if not response.ok:
+            try:
+                detail = response.json().get("detail", "Неизвестная ошибка")
+            except ValueError:
+                detail = f"HTTP {response.status_code}"
+            raise ApiError(response.status_code, str(detail))
+        return response
+
+    def cached_get(self, path: str, params: Optional[Dict[str, Any]] = None,
+                   ttl: int = API_CACHE_TTL, raw: bool = False) -> Any:
+        """GET с кэшем на ttl секунд (raw - байты ответа вместо JSON)"""
+        key = (path, tuple(sorted((params or {}).items())), raw)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        response = self.request("GET", path, params=params)
+        value = response.content if raw else response.json()
+        if ttl > 0:
+            with self._lock:
+                self._cache[key] = (now + ttl, value)
+        return value
+
+    def invalidate(self, *prefixes: str) -> None:
+        """Сбрасывает кэш путей с указанными префиксами (без аргументов - весь)"""
+        with self._lock:
+            for key in list(self._cache):
+                if not prefixes or key[0].startswith(prefixes):
+                    del self._cache[key]
+
+    # --- сессия ---
+
+    def login(self, username: str, password: str) -> None:
+        response = self.request("POST", "/api/v1/session/login", data={"username": username, "password": password})
+        cookie = response.cookies.get("ipa_session")
+        # Cookie без привязки к домену/secure - API может быть за http внутри сети
+        self.session.cookies.clear()
+        self.session.cookies.set("ipa_session", cookie)
+        self.invalidate()
+
+    def logout(self) -> None:
+        try:
+            if self.session.cookies.get("ipa_session"):
+                self.request("POST", "/api/v1/session/logout")
+        finally:
+            self.session.cookies.clear()
+            self.invalidate()
+
+    def close(self) -> None:
+        self.session.close()
+
+    # --- пользователи ---
+
+    def reset_password(self, identifier: str) -> Dict[str, Any]:
+        return self.request("POST", f"/api/v1/users/{identifier}/reset-password").json()
+
+    def search_users(self, query: str, limit: int = 10) -> Dict[str, Any]:
+        return self.request("GET", "/api/v1/users/search", params={"q": query, "limit": limit}).json()
+
+    def create_user(self, form: Dict[str, str]) -> Dict[str, Any]:
+        result = self.request("POST", "/api/v1/users/create-form", data=form).json()
+        self.invalidate(*_USER_DATA_PREFIXES)
+        return result
+
+    # --- фоновые массовые операции на сервере (прогресс опросом) ---
+
+    def start_bulk_job(self, action: str, identifiers: list, idempotency_key: str,
+                       send_email: bool = False) -> Dict[str, Any]:
+        """delete / disable / enable / reset-password; ответ - operation_id и total"""
+        result = self.request(
+            "POST",
+            "/api/v1/users/bulk-jobs",
+            json={"action": action, "identifiers": identifiers, "send_email": send_email},
+            headers={"Idempotency-Key": idempotency_key}
+        ).json()
+        self.invalidate(*_USER_DATA_PREFIXES)
+        return result
+
+    def start_bulk_create_job(self, filename: str, content: bytes, idempotency_key: str,
+                              send_email: bool = False) -> Dict[str, Any]:
+        result = self.request(
+            "POST",
+            "/api/v1/users/bulk-jobs/create-from-excel",
+            params={"send_email": "true"} if send_email else None,
+            files={"file": (filename, content)},
+            headers={"Idempotency-Key": idempotency_key}
+        ).json()
+        self.invalidate(*_USER_DATA_PREFIXES)
+        return result
+
+    def bulk_job_progress(self, operation_id: str, since: int = 0) -> Dict[str, Any]:
+        """Счётчики и результаты, завершённые после курсора since"""
+        return self.request("GET", f"/api/v1/bulk-operations/{operation_id}/progress", params={"since": since}).json()
+
+    def cancel_bulk_job(self, operation_id: str) -> Dict[str, Any]:
+        return self.request("POST", f"/api/v1/bulk-operations/{operation_id}/cancel").json()
+
+    # --- отчёты и шаблоны (кэшируются) ---
+
+    def users_table(self, **params) -> Dict[str, Any]:
+        """Страница таблицы пользователей (фильтры, сортировка и пагинация на сервере)"""
+        params = {key: value for key, value in params.items() if value not in (None, "")}
+        return self.cached_get("/api/v1/report/users", params=params)
+
+    def users_groups_report(self) -> bytes:
+        """CSV: username, email, группы"""
+        return self.cached_get("/api/v1/report/full-usersgroups-info", raw=True)
+
+    def excel_template(self) -> bytes:
+        return self.cached_get("/api/v1/templates/templates-excel", ttl=API_TEMPLATE_TTL, raw=True)
+
+
+def get_client(base_url: str) -> ApiClient:
+    """Клиент текущей сессии Streamlit (создаётся один раз и живёт между rerun)"""
+    client = st.session_state.get("api_client")
+    if client is None or client.base_url != (base_url or "").rstrip("/"):
+        if client is not None:
+            client.close()
+        client = ApiClient(base_url)
+        st.session_state.api_client = client
+    return client
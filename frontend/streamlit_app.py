@@ -1,78 +1,67 @@
 import streamlit as st
-import requests
 from typing import Optional
 from dotenv import load_dotenv
 import os
+import uuid
 
 load_dotenv()
 YOPASS_URL = os.getenv("YOPASS_URL")
 API_URL = os.getenv("API_URL")
 
+from api_client import ApiError, get_client
+
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
-if 'session_cookie' not in st.session_state:
-    st.session_state.session_cookie = None
 if 'username' not in st.session_state:
     st.session_state.username = None
 
+# Клиент API этой сессии (пул соединений, таймауты, кэш отчётов)
+api = get_client(API_URL)
+
 
 # Func work api FastAPI
 
 def login(username: str, password: str) -> bool:
     try:
-        response = requests.post(
-            f"{API_URL}/api/v1/session/login",
-            data={"username": username, "password": password}
-        )
-
-        if response.ok:
-            # Сохраняем cookie из ответа
-            st.session_state.session_cookie = response.cookies.get('ipa_session')
-            st.session_state.logged_in = True
-            st.session_state.username = username
-            return True
+        api.login(username, password)
+        st.session_state.logged_in = True
+        st.session_state.username = username
+        return True
+    except ApiError as e:
+        if e.status_code:
+            st.error(f"❌ Ошибка входа: {e.detail}")
         else:
-            st.error(f"❌ Ошибка входа: {response.json().get('detail', 'Неизвестная ошибка')}")
-            return False
-    except Exception as e:
-        st.error(f"❌ Ошибка подключения: {e}")
+            st.error(f"❌ {e.detail}")
         return False
 
 
 def logout():
     """Выход из системы"""
     try:
-        if st.session_state.session_cookie:
-            requests.post(
-                f"{API_URL}/api/v1/session/logout",
-                cookies={'ipa_session': st.session_state.session_cookie}
-            )
+        api.logout()
+    except ApiError:
+        pass
     finally:
         st.session_state.logged_in = False
-        st.session_state.session_cookie = None
         st.session_state.username = None
-
-
-def get_cookies() -> dict:
-    """Возвращает cookies для запросов"""
-    return {'ipa_session': st.session_state.session_cookie}
+        st.session_state.pop('csv_data', None)
 
 
 def reset_password(identifier: str) -> Optional[dict]:
     """Сброс пароля пользователя"""
     try:
-        response = requests.post(
-            f"{API_URL}/api/v1/users/{identifier}/reset-password",
-            cookies=get_cookies()
-        )
+        return api.reset_password(identifier)
+    except ApiError as e:
+        st.error(f"❌ Ошибка: {e.detail}")
+        return None
 
-        if response.ok:
-            return response.json()
-        else:
-            st.error(f"❌ Ошибка: {response.json().get('detail', 'Неизвестная ошибка')}")
-            return None
-    except Exception as e:
-        st.error(f"❌ Ошибка: {e}")
+
+def search_users(query: str) -> Optional[dict]:
+    """Поиск пользователей (uid, email, ФИО, должность)"""
+    try:
+        return api.search_users(query)
+    except ApiError as e:
+        st.error(f"❌ Ошибка: {e.detail}")
         return None
 
 
@@ -80,46 +69,157 @@ def create_user(first_name: str, last_name: str, email: str,
                 phone: str = "", title: str = "", groups: str = "") -> Optional[dict]:
     """Создание пользователя"""
     try:
-        response = requests.post(
-            f"{API_URL}/api/v1/users/create-form",
-            data={
-                "first_name": first_name,
-                "last_name": last_name,
-                "email": email,
-                "phone": phone,
-                "title": title,
-                "groups": groups
-            },
-            cookies=get_cookies()
-        )
-
-        if response.ok:
-            return response.json()
-        else:
-            st.error(f"❌ Ошибка: {response.json().get('detail', 'Неизвестная ошибка')}")
-            return None
-    except Exception as e:
-        st.error(f"❌ Ошибка: {e}")
+        return api.create_user({
+            "first_name": first_name,
+            "last_name": last_name,
+            "email": email,
+            "phone": phone,
+            "title": title,
+            "groups": groups
+        })
+    except ApiError as e:
+        st.error(f"❌ Ошибка: {e.detail}")
         return None
 
 
-def bulk_create_from_excel(file) -> Optional[dict]:
-    """Массовое создание из Excel"""
+def read_identifiers(file) -> list:
+    """Username / email из первой колонки Excel (первая строка - заголовок)"""
+    from openpyxl import load_workbook
+
+    sheet = load_workbook(file, read_only=True).active
+    return [
+        str(row[0]).strip()
+        for row in sheet.iter_rows(min_row=2, values_only=True)
+        if row and row[0] and str(row[0]).strip()
+    ]
+
+
+def start_bulk_job(key: str, start) -> None:
+    """
+    Запускает фоновую операцию на сервере; start(idempotency_key) -> ответ API
+
+    Ключ сохраняется вместе с операцией - "Продолжить" после отмены повторяет
+    запрос с тем же Idempotency-Key, и сервер пропускает уже выполненные элементы.
+    """
+    job = st.session_state.get(f"{key}_job")
+    idempotency_key = job["idempotency_key"] if job else uuid.uuid4().hex
     try:
-        response = requests.post(
-            f"{API_URL}/api/v1/users/bulk-create-from-excel",
-            files={"file": file},
-            cookies=get_cookies()
+        started = start(idempotency_key)
+    except ApiError as e:
+        st.error(f"❌ Ошибка: {e.detail}")
+        return
+
+    st.session_state[f"{key}_job"] = {
+        "operation_id": started["operation_id"],
+        "idempotency_key": idempotency_key,
+        "start": start,
+        "total": started["total"],
+        "status": started["status"],
+        "success": 0,
+        "failed": 0,
+        "cursor": 0,
+        "rows": {}
+    }
+
+
+def poll_bulk_job(job: dict) -> None:
+    """Дочитывает результаты после курсора (не больше нескольких страниц за раз)"""
+    for _ in range(5):
+        progress = api.bulk_job_progress(job["operation_id"], job["cursor"])
+        # Элемент может прийти повторно с дополненными полями (статус письма) - заменяем по item
+        for item in progress["items"]:
+            job["rows"][item["item"]] = item
+        job["cursor"] = progress["cursor"]
+        job["status"] = progress["status"]
+        job["success"] = progress["success"]
+        job["failed"] = progress["failed"]
+        if not progress["items"]:
+            break
+
+
+DELIVERY_LABELS = {"queued": "⏳ в очереди", "sent": "📧 отправлено", "failed": "❌ не отправлено", "skipped": "— нет пароля"}
+
+
+def cell(row: dict, column: str):
+    """Значение колонки таблицы результатов (delivery - статус письма)"""
+    if column == "delivery":
+        delivery = row.get("delivery")
+        if not delivery:
+            return None
+        label = DELIVERY_LABELS.get(delivery["status"], delivery["status"])
+        return f"{label}: {delivery['error']}" if delivery.get("error") else label
+    return row.get(column)
+
+
+def bulk_job_view(key: str, columns: list) -> None:
+    """Прогресс, отмена и таблица результатов фоновой операции"""
+    job = st.session_state[f"{key}_job"]
+    active = job["status"] in ("running", "cancelling")
+
+    if active:
+        try:
+            poll_bulk_job(job)
+        except ApiError as e:
+            st.error(f"❌ Ошибка опроса: {e.detail}")
+            return
+        if job["status"] not in ("running", "cancelling"):
+            # Операция завершилась - перерисовываем страницу целиком без автообновления
+            st.rerun()
+
+    processed = job["success"] + job["failed"]
+    total = job["total"] or processed or 1
+    st.progress(min(processed / total, 1.0), text=f"Обработано {processed} из {job['total']}")
+
+    col1, col2, col3 = st.columns([1, 1, 1])
+    col1.metric("✅ Успешно", job["success"])
+    col2.metric("❌ Ошибок", job["failed"])
+    with col3:
+        if job["status"] == "running":
+            if st.button("⏹ Остановить", key=f"{key}_cancel", use_container_width=True):
+                try:
+                    api.cancel_bulk_job(job["operation_id"])
+                    job["status"] = "cancelling"
+                except ApiError as e:
+                    st.error(f"❌ Ошибка: {e.detail}")
+        elif job["status"] == "cancelling":
+            st.caption("Останавливаем после текущего элемента...")
+        elif job["status"] in ("cancelled", "interrupted"):
+            if st.button("▶️ Продолжить", key=f"{key}_resume", use_container_width=True):
+                start_bulk_job(key, job["start"])
+                st.rerun()
+
+    if job["status"] == "completed":
+        st.success("✅ Операция завершена")
+    elif job["status"] == "cancelled":
+        st.warning("⏹ Операция остановлена - обработанные элементы не откатываются")
+    elif job["status"] == "interrupted":
+        st.error("⚠️ Операция прервана на сервере - её можно продолжить")
+
+    if job["rows"]:
+        st.dataframe(
+            [
+                {"": "✅" if row["status"] == "success" else "❌", **{column: cell(row, column) for column in columns}}
+                for row in job["rows"].values()
+            ],
+            hide_index=True,
+            width="stretch"
         )
+        if any(row.get("yopass_link") for row in job["rows"].values()):
+            st.info("💡 Yopass ссылки одноразовые - не открывайте их сами, отправьте пользователям")
+        unavailable = [row.get("username") or row.get("identifier") for row in job["rows"].values()
+                       if row.get("credentials_unavailable")]
+        if unavailable:
+            st.warning(f"⚠️ Ссылки не сохранились (операция продолжена после перезапуска): "
+                       f"{', '.join(map(str, unavailable))} - сбросьте им пароль повторно")
 
-        if response.ok:
-            return response.json()
-        else:
-            st.error(f"❌ Ошибка: {response.json().get('detail', 'Неизвестная ошибка')}")
-            return None
-    except Exception as e:
-        st.error(f"❌ Ошибка: {e}")
-        return None
+
+def bulk_job_panel(key: str, columns: list) -> None:
+    """Пока операция идёт, панель обновляется раз в секунду отдельно от остальной страницы"""
+    job = st.session_state.get(f"{key}_job")
+    if job is None:
+        return
+    active = job["status"] in ("running", "cancelling")
+    st.fragment(bulk_job_view, run_every=1 if active else None)(key, columns)
 
 
 # Настройка страницы
@@ -171,6 +271,32 @@ else:
     # === ВКЛАДКА 1: СБРОС ПАРОЛЯ ===
     with tab1:
         st.header("🔑 Сброс пароля")
+
+        # Быстрый поиск по индексу каталога на сервере
+        lookup = st.text_input("🔍 Найти пользователя", placeholder="начало логина, email, ФИО или должности", key="user_lookup")
+        if lookup:
+            found = search_users(lookup)
+            if found:
+                if found['users']:
+                    st.dataframe(
+                        [
+                            {
+                                "username": u['uid'],
+                                "email": u['mail'],
+                                "ФИО": u['cn'],
+                                "должность": u['title'],
+                                "активен": u['enabled']
+                            }
+                            for u in found['users']
+                        ],
+                        hide_index=True,
+                        width="stretch"
+                    )
+                    if found['total'] > len(found['users']):
+                        st.caption(f"Показано {len(found['users'])} из {found['total']}")
+                else:
+                    st.caption("Ничего не найдено")
+
         st.markdown("Введите username или email пользователя")
 
         with st.form("reset_password_form"):
@@ -203,11 +329,11 @@ else:
         send_to_smtp = st.checkbox(
             "📧 Отправить пароли на email (SMTP)",
             value=False,
-            help="Если включено, пароли будут отправлены пользователям на email автоматически"
+            help="Если включено, Yopass ссылки будут отправлены пользователям на email автоматически"
         )
 
         if send_to_smtp:
-            st.info("📧 Пароли будут отправлены на email пользователей через SMTP")
+            st.info("📧 Ссылки на пароли будут отправлены на email пользователей через SMTP, статус отправки - в таблице")
         else:
             st.info("📋 Yopass ссылки будут показаны здесь для ручной отправки")
 
@@ -228,50 +354,21 @@ else:
             | maria.sidorova     |
             """)
 
-            if st.button("🔄 Сбросить пароли", use_container_width=True, key="bulk_reset_btn"):
-                with st.spinner("Сбрасываем пароли..."):
-                    # TODO: Реализовать вызов API
-                    # Пока заглушка
-                    st.warning("⚠️ Функция в разработке")
-
-                    # Заглушка результата
-                    st.success("✅ Обработано: 3 пользователя")
-
-                    if send_to_smtp:
-                        st.success("📧 Email отправлены: 2")
-                        st.error("❌ Email не отправлены: 1")
-
-                    with st.expander("📋 Результаты (кликните для раскрытия)"):
-                        st.markdown("**ivan.ivanov**")
-                        if send_to_smtp:
-                            st.success("✅ Пароль сброшен, email отправлен на ivan@company.com")
-                        else:
-                            st.success("✅ Пароль сброшен")
-                            st.text_input(
-                                "Yopass ссылка:",
-                                value="https://pass.soc.rt.ru/s/example123",
-                                disabled=True,
-                                label_visibility="collapsed",
-                                key="bulk_reset_demo_1"
-                            )
-                        st.markdown("---")
-
-                        st.markdown("**petr@company.com**")
-                        if send_to_smtp:
-                            st.success("✅ Пароль сброшен, email отправлен")
-                        else:
-                            st.success("✅ Пароль сброшен")
-                            st.text_input(
-                                "Yopass ссылка:",
-                                value="https://pass.soc.rt.ru/s/example456",
-                                disabled=True,
-                                label_visibility="collapsed",
-                                key="bulk_reset_demo_2"
-                            )
-                        st.markdown("---")
+            running = st.session_state.get("bulk_reset_job", {}).get("status") in ("running", "cancelling")
+            if st.button("🔄 Сбросить пароли", use_container_width=True, key="bulk_reset_btn", disabled=running):
+                identifiers = read_identifiers(uploaded_file)
+                if not identifiers:
+                    st.error("❌ В файле нет пользователей")
+                else:
+                    st.session_state.pop("bulk_reset_job", None)
+                    start_bulk_job(
+                        "bulk_reset",
+                        lambda key, identifiers=identifiers, send_email=send_to_smtp: api.start_bulk_job(
+                            "reset-password", identifiers, key, send_email=send_email
+                        )
+                    )
 
-                        st.markdown("**maria.sidorova**")
-                        st.error("❌ Пользователь не найден")
+        bulk_job_panel("bulk_reset", ["identifier", "username", "yopass_link", "delivery", "error"])
 
     # === ВКЛАДКА 3: СОЗДАТЬ ПОЛЬЗОВАТЕЛЯ ===
     with tab3:
@@ -322,71 +419,132 @@ else:
         st.header("📊 Массовое создание из Excel")
 
         st.markdown("### Шаг 1: Скачайте шаблон Excel")
-        st.markdown(f"[📥 Скачать шаблон]({API_URL}/api/v1/templates/templates-excel)")
+        try:
+            st.download_button(
+                label="📥 Скачать шаблон",
+                data=api.excel_template(),
+                file_name="freeipa_users_template.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+        except ApiError as e:
+            st.error(f"❌ Шаблон недоступен: {e.detail}")
 
         st.markdown("### Шаг 2: Загрузите заполненный файл")
 
         uploaded_file = st.file_uploader("Выберите Excel файл", type=['xlsx'])
 
+        create_send_email = st.checkbox(
+            "📧 Отправить данные для входа на email из файла (SMTP)",
+            value=False,
+            key="bulk_create_smtp"
+        )
+
         if uploaded_file is not None:
             col1, col2 = st.columns([1, 1])
 
             with col1:
-                if st.button("🚀 Создать пользователей", use_container_width=True):
-                    with st.spinner("Создаём пользователей..."):
-                        result = bulk_create_from_excel(uploaded_file)
+                running = st.session_state.get("bulk_create_job", {}).get("status") in ("running", "cancelling")
+                if st.button("🚀 Создать пользователей", use_container_width=True, disabled=running):
+                    filename, content = uploaded_file.name, uploaded_file.getvalue()
+                    st.session_state.pop("bulk_create_job", None)
+                    start_bulk_job(
+                        "bulk_create",
+                        lambda key, filename=filename, content=content, send_email=create_send_email: api.start_bulk_create_job(
+                            filename, content, key, send_email=send_email
+                        )
+                    )
 
-                    if result:
-                        st.success(f"✅ Создано: **{len(result['success'])}**")
-
-                        if result['failed']:
-                            st.error(f"❌ Ошибок: **{len(result['failed'])}**")
-
-                        # Показываем созданных пользователей
-                        if result['success']:
-                            with st.expander("📋 Созданные пользователи (кликните для раскрытия)"):
-                                for idx, user in enumerate(result['success']):
-                                    st.markdown(f"**{user['username']}** - {user['email']}")
-                                    st.text_input(
-                                        "Yopass ссылка:",
-                                        value=user['yopass_link'],
-                                        disabled=True,
-                                        label_visibility="collapsed",
-                                        key=f"bulk_yopass_{idx}"
-                                    )
-                                    st.markdown("---")
-
-                        # Показываем ошибки
-                        if result['failed']:
-                            with st.expander("❌ Ошибки (кликните для раскрытия)"):
-                                for fail in result['failed']:
-                                    st.error(f"Строка {fail['row']}: {fail['error']}")
+        bulk_job_panel("bulk_create", ["row", "fio", "username", "email", "yopass_link", "delivery", "message", "error"])
 
 
     with tab5:
         st.header("Аналитика и отчёты")
-        
-        st.markdown("### 1. Экспорт данных о пользователях и группах в CSV")
+
+        st.markdown("### 1. Пользователи и группы")
+
+        # Фильтры, сортировка и страницы считаются на сервере - загружается только видимая страница
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            table_query = st.text_input("Поиск", placeholder="логин, email, ФИО", key="table_q")
+        with col2:
+            table_group = st.text_input("Группа", placeholder="developers", key="table_group")
+        with col3:
+            table_domain = st.text_input("Домен email", placeholder="company.com", key="table_domain")
+        with col4:
+            table_state = st.selectbox("Статус", ["Все", "Активные", "Отключённые"], key="table_state")
+
+        col1, col2, col3 = st.columns(3)
+        sort_labels = {"uid": "Логин", "mail": "Email", "cn": "ФИО", "title": "Должность", "enabled": "Статус"}
+        with col1:
+            table_sort = st.selectbox("Сортировка", list(sort_labels), format_func=sort_labels.get, key="table_sort")
+        with col2:
+            table_order = st.selectbox("Порядок", ["asc", "desc"], format_func={"asc": "По возрастанию", "desc": "По убыванию"}.get, key="table_order")
+        with col3:
+            table_page_size = st.selectbox("Строк на странице", [25, 50, 100, 200], index=1, key="table_page_size")
+
+        # Новые фильтры - снова с первой страницы
+        table_filters = (table_query, table_group, table_domain, table_state, table_sort, table_order, table_page_size)
+        if st.session_state.get("table_filters") != table_filters:
+            st.session_state.table_filters = table_filters
+            st.session_state.table_page = 1
+
+        try:
+            table = api.users_table(
+                q=table_query.strip(),
+                group=table_group.strip(),
+                email_domain=table_domain.strip(),
+                enabled={"Активные": True, "Отключённые": False}.get(table_state),
+                sort=table_sort,
+                order=table_order,
+                page=st.session_state.table_page,
+                page_size=table_page_size
+            )
+        except ApiError as e:
+            table = None
+            st.error(f"❌ Ошибка: {e.detail}")
+
+        if table:
+            st.dataframe(
+                [
+                    {
+                        "username": u['uid'],
+                        "email": u['mail'],
+                        "ФИО": u['cn'],
+                        "должность": u['title'],
+                        "активен": u['enabled'],
+                        "группы": ", ".join(u['groups'])
+                    }
+                    for u in table['users']
+                ],
+                hide_index=True,
+                width="stretch"
+            )
+
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if st.button("◀ Назад", disabled=table['page'] <= 1, use_container_width=True, key="table_prev"):
+                    st.session_state.table_page -= 1
+                    st.rerun()
+            with col2:
+                st.caption(f"Страница {table['page']} из {table['pages']} · найдено {table['total']} · данные каталога {int(table['index_age'])} с назад")
+            with col3:
+                if st.button("Вперёд ▶", disabled=table['page'] >= table['pages'], use_container_width=True, key="table_next"):
+                    st.session_state.table_page += 1
+                    st.rerun()
+
+        st.markdown("---")
+
+        st.markdown("### 2. Экспорт данных о пользователях и группах в CSV")
         
         if st.button("Получить CSV отчёт", width="stretch"):
             with st.spinner("Генерируем отчёт..."):
                 try:
-                    response = requests.get(
-                        f"{API_URL}/api/v1/report/full-usersgroups-info",
-                        cookies=get_cookies(),
-                        timeout=30
-                    )
-                    
-                    if response.ok:
-                        # Сохраняем CSV в session_state
-                        st.session_state.csv_data = response.content
-                        st.success("✅ Отчёт готов к скачиванию!")
-                    else:
-                        st.error(f"❌ Ошибка: {response.status_code}")
-                        
-                except Exception as e:
-                    st.error(f"❌ Ошибка: {e}")
-        
+                    # Повторное нажатие в пределах API_CACHE_TTL не нагружает сервер
+                    st.session_state.csv_data = api.users_groups_report()
+                    st.success("✅ Отчёт готов к скачиванию!")
+                except ApiError as e:
+                    st.error(f"❌ Ошибка: {e.detail}")
+
         # Показываем кнопку скачивания если данные есть
         if 'csv_data' in st.session_state:
             st.download_button(
@@ -398,8 +556,5 @@ else:
             )
             st.caption("📊 Файл содержит: username, email, список групп")
         
-        st.markdown("---")
-        
-        st.info("💡 Дополнительная аналитика и статистика будут добавлены позже")
 st.markdown("---")
 st.markdown("*FreeIPA Portal - Управление пользователями*")
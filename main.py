@@ -1,14 +1,35 @@
-from app import app
-from app.routes import setup_routes
+# Дочерние процессы multiprocessing (spawn: разбор Excel, воркеры uvicorn) выполняют
+# этот файл как __mp_main__ - приложение им не нужно, воркеры uvicorn импортируют main:app сами
+if __name__ != "__mp_main__":
+    from app import app
+    from app.routes import setup_routes
 
-setup_routes(app)
+    setup_routes(app)
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
-    
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8080,
-        reload=True
-    )
\ No newline at end of file
+    from app.config import APP_ENV, API_HOST, API_PORT, API_WORKERS, GRACEFUL_SHUTDOWN_TIMEOUT
+
+    if APP_ENV == "production":
+        # Несколько воркеров, uvloop + httptools (если установлены), без reload.
+        # log_config=None - логи uvicorn идут через нашу очередь (app/utils/log.py)
+        uvicorn.run(
+            "main:app",
+            host=API_HOST,
+            port=API_PORT,
+            workers=API_WORKERS,
+            loop="uvloop" if importlib.util.find_spec("uvloop") else "auto",
+            http="httptools" if importlib.util.find_spec("httptools") else "auto",
+            timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+            proxy_headers=True,
+            log_config=None
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host=API_HOST,
+            port=API_PORT,
+            reload=True,
+            log_config=None
+        )
\ No newline at end of file
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Состояние тестов (SQLite, снимки) - во временном каталоге, до импорта app.config
+_state_dir = tempfile.mkdtemp(prefix="ipa-api-tests-")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(_state_dir, "state.db"))
+os.environ.setdefault("SNAPSHOT_DIR", os.path.join(_state_dir, "snapshots"))
+os.environ.setdefault("LOG_FORMAT", "text")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
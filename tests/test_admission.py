@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected
+
+
+def controller(**kwargs):
+    options = dict(global_limit=1, session_limit=1, queue_size=10, session_queue_size=10,
+                   queue_timeout=5, retry_after=7)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+async def queue_up(admission, session, order):
+    await admission.acquire(session)
+    order.append(session)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_sessions_take_turns():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("holder")
+        order = []
+        # Импорт прислал три запроса раньше, чем другой администратор - один
+        tasks = [asyncio.create_task(queue_up(admission, "import", order)) for _ in range(3)]
+        await settle()
+        tasks.append(asyncio.create_task(queue_up(admission, "export", order)))
+        await settle()
+        assert admission.metrics()["queued"] == 4
+
+        admission.release("holder")
+        for _ in range(4):
+            await settle()
+            admission.release(order[-1])
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["import", "export", "import", "import"]
+
+
+def test_full_queue_is_rejected():
+    async def scenario():
+        admission = controller(queue_size=2, session_queue_size=1)
+        await admission.acquire("a")
+        waiting = [asyncio.create_task(admission.acquire("b")), asyncio.create_task(admission.acquire("c"))]
+        await settle()
+
+        # Общая очередь занята
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("d")
+        assert rejected.value.retry_after == 7
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+
+        # Очередь сессии занята, хотя общая свободна
+        waiting = asyncio.create_task(admission.acquire("b"))
+        await settle()
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("b")
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return admission.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["rejected_total"] == 2
+    assert metrics["queued"] == 0 and metrics["running"] == 1
+
+
+def test_queue_timeout_is_rejected():
+    async def scenario():
+        admission = controller(queue_timeout=0.05)
+        await admission.acquire("a")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("b")
+        return admission.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["timeouts_total"] == 1 and metrics["queued"] == 0
+
+
+def test_cancelled_waiter_frees_its_place():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("a")
+        gone = asyncio.create_task(admission.acquire("b"))
+        order = []
+        next_one = asyncio.create_task(queue_up(admission, "c", order))
+        await settle()
+
+        # Клиент ушёл из очереди - слот достаётся следующему
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        assert admission.metrics()["queued"] == 1
+        admission.release("a")
+        await next_one
+        assert order == ["c"]
+        admission.release("c")
+        return admission.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["running"] == 0 and metrics["queued"] == 0
+
+
+def test_cancel_after_slot_was_granted_releases_it():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("a")
+        granted = asyncio.create_task(admission.acquire("b"))
+        order = []
+        next_one = asyncio.create_task(queue_up(admission, "c", order))
+        await settle()
+
+        # Слот выдан, но ожидающий отменён раньше, чем проснулся - слот не теряется
+        admission.release("a")
+        granted.cancel()
+        await asyncio.gather(granted, return_exceptions=True)
+        await next_one
+        assert order == ["c"]
+        admission.release("c")
+        return admission.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["running"] == 0 and metrics["queued"] == 0
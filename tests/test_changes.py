@@ -0,0 +1,62 @@
+import pytest
+
+import app.services.changes as changes
+from app.services.changes import WatermarkExpired, list_changes, record_change, record_scan
+from app.services.storage import get_connection
+
+DAY = 86400
+
+
+@pytest.fixture(autouse=True)
+def clean_journal(monkeypatch):
+    conn = get_connection()
+    for table in ("directory_changes", "directory_digests", "directory_changes_pruned"):
+        conn.execute(f"DELETE FROM {table}")
+    clock = [1_000_000_000.0]
+    monkeypatch.setattr(changes.time, "time", lambda: clock[0])
+    monkeypatch.setattr(changes, "CHANGES_RETENTION_DAYS", 1)
+    return clock
+
+
+def user(uid, title="Engineer", locked=False):
+    return {"uid": [uid], "mail": [f"{uid}@example.com"], "title": [title], "nsaccountlock": locked}
+
+
+def test_scan_diff_and_paging():
+    assert record_scan([user("ivanov"), user("petrov")]) == 2
+    assert record_scan([user("ivanov", title="Lead"), user("petrov", locked=True), user("sidorov")]) == 3
+    assert record_scan([user("petrov", locked=True), user("sidorov")]) == 1
+
+    page, watermark, has_more = list_changes(limit=4)
+    assert has_more
+    rest, watermark, has_more = list_changes(watermark, limit=10)
+    assert not has_more
+    kinds = {(c["uid"], c["change"]) for c in page + rest}
+    assert kinds == {("ivanov", "created"), ("petrov", "created"), ("ivanov", "modified"),
+                     ("petrov", "disabled"), ("sidorov", "created"), ("ivanov", "deleted")}
+
+    # Нет новых событий - тот же watermark, пустая страница
+    assert list_changes(watermark) == ([], watermark, False)
+
+
+def test_watermark_expired_after_journal_pruned_to_empty(clean_journal):
+    record_change("ivanov", "disabled")
+    record_change("petrov", "disabled")
+    _, watermark, _ = list_changes(limit=1)
+
+    # Через двое суток скан без изменений очищает журнал целиком
+    clean_journal[0] += 2 * DAY
+    record_scan([])
+    assert get_connection().execute("SELECT COUNT(*) AS n FROM directory_changes").fetchone()["n"] == 0
+
+    with pytest.raises(WatermarkExpired):
+        list_changes(watermark)
+
+
+def test_caught_up_watermark_survives_pruning(clean_journal):
+    record_change("ivanov", "disabled")
+    _, watermark, _ = list_changes()
+
+    clean_journal[0] += 2 * DAY
+    record_scan([])
+    assert list_changes(watermark) == ([], watermark, False)
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import app.services.checkpoints as checkpoints
+from app.services.bulk import delete_user
+from app.services.checkpoints import BulkOperation, fingerprint, get_operation, get_progress
+from app.services.storage import get_connection
+
+
+@pytest.fixture(autouse=True)
+def clean_journal(monkeypatch):
+    conn = get_connection()
+    for table in ("bulk_operations", "bulk_operation_items"):
+        conn.execute(f"DELETE FROM {table}")
+    monkeypatch.setattr(checkpoints, "_secrets", {})
+    monkeypatch.setattr(checkpoints, "_secrets_updated", {})
+
+
+def reset(operation, item, link):
+    operation.start(item)
+    operation.finish(item, "success", {"identifier": item, "username": item, "password": "s3cret", "yopass_link": link})
+
+
+def stored_result(operation_id, item):
+    row = get_connection().execute(
+        "SELECT result FROM bulk_operation_items WHERE operation_id = ? AND item = ?", (operation_id, item)
+    ).fetchone()
+    return json.loads(row["result"])
+
+
+def test_credentials_stay_off_disk():
+    operation = BulkOperation.open("bulk-reset-password-link", "admin", fingerprint(["ivanov"]), "key")
+    reset(operation, "ivanov", "https://yopass/1")
+
+    assert stored_result(operation.id, "ivanov") == {
+        "identifier": "ivanov", "username": "ivanov", "credentials_unavailable": True
+    }
+    # В этом процессе ссылка ещё есть - статус и прогресс её возвращают
+    assert get_operation(operation.id)["success"][0]["yopass_link"] == "https://yopass/1"
+    item = get_progress(operation.id)["items"][0]
+    assert item["yopass_link"] == "https://yopass/1"
+    assert "credentials_unavailable" not in item and "password" not in item
+
+
+def test_replay_without_link_is_marked():
+    operation = BulkOperation.open("bulk-reset-password", "admin", fingerprint(["ivanov"]), "key")
+    reset(operation, "ivanov", None)
+    operation.set_status("completed")
+
+    replay = BulkOperation.open("bulk-reset-password", "admin", fingerprint(["ivanov"]), "key")
+    assert replay.id == operation.id
+    assert replay.done("ivanov") == {"identifier": "ivanov", "username": "ivanov", "credentials_unavailable": True}
+
+
+def test_replay_in_another_process_is_marked(monkeypatch):
+    operation = BulkOperation.open("bulk-reset-password-link", "admin", fingerprint(["ivanov"]), "key")
+    reset(operation, "ivanov", "https://yopass/1")
+    operation.set_status("completed")
+
+    # Другой процесс: памяти со ссылками нет
+    monkeypatch.setattr(checkpoints, "_secrets", {})
+    replay = BulkOperation.open("bulk-reset-password-link", "admin", fingerprint(["ivanov"]), "key")
+    result = replay.done("ivanov")
+    assert result["credentials_unavailable"] is True
+    assert "yopass_link" not in result
+
+
+class GoneClient:
+    """Пользователя с этим email уже нет - удаление успело выполниться"""
+
+    def _request(self, command, args, params):
+        assert command == "user_find"
+        return {"result": [], "count": 0}
+
+
+def test_resumed_delete_by_email_counts_as_done():
+    status, result = delete_user(GoneClient(), "ivanov@example.com", resuming=True)
+    assert status == "success"
+    assert result == {"identifier": "ivanov@example.com", "username": None}
+
+    status, result = delete_user(GoneClient(), "ivanov@example.com")
+    assert status == "failed"
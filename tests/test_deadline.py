@@ -0,0 +1,96 @@
+import asyncio
+
+from app.middleware.deadline import DeadlineMiddleware
+from app.services.deadline import stop_reason
+
+
+def scope(method):
+    return {"type": "http", "method": method, "path": "/api/v1/report/users", "headers": []}
+
+
+class Client:
+    """Сервер uvicorn со стороны приложения: тело частями, затем (по команде) disconnect"""
+
+    def __init__(self, chunks):
+        self.messages = asyncio.Queue()
+        for n, chunk in enumerate(chunks):
+            self.messages.put_nowait({"type": "http.request", "body": chunk, "more_body": n < len(chunks) - 1})
+        self.sent = []
+
+    def disconnect(self):
+        self.messages.put_nowait({"type": "http.disconnect"})
+
+    async def receive(self):
+        return await self.messages.get()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+
+async def wait_for_stop():
+    for _ in range(200):
+        if stop_reason():
+            return stop_reason()
+        await asyncio.sleep(0.005)
+    return None
+
+
+def test_get_without_body_sees_disconnect():
+    async def scenario():
+        client = Client([b""])
+        reasons = []
+
+        async def app(scope, receive, send):
+            # GET: приложение receive не вызывает
+            client.disconnect()
+            reasons.append(await wait_for_stop())
+
+        await DeadlineMiddleware(app)(scope("GET"), client.receive, client.send)
+        return reasons
+
+    assert asyncio.run(scenario()) == ["disconnected"]
+
+
+def test_body_is_passed_through_then_disconnect_is_seen():
+    async def scenario():
+        client = Client([b"part1,", b"part2"])
+        seen = {}
+
+        async def app(scope, receive, send):
+            body = b""
+            while True:
+                message = await receive()
+                body += message["body"]
+                if not message["more_body"]:
+                    break
+            seen["body"] = body
+            assert stop_reason() is None
+            client.disconnect()
+            seen["reason"] = await wait_for_stop()
+            # Приложение, слушающее disconnect само, тоже его получает
+            seen["message"] = (await receive())["type"]
+            seen["again"] = (await receive())["type"]
+
+        await DeadlineMiddleware(app)(scope("POST"), client.receive, client.send)
+        return seen
+
+    assert asyncio.run(scenario()) == {"body": b"part1,part2", "reason": "disconnected",
+                                       "message": "http.disconnect", "again": "http.disconnect"}
+
+
+def test_disconnect_after_response_is_ignored():
+    async def scenario():
+        client = Client([b""])
+        reasons = []
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"{}"})
+            client.disconnect()
+            await asyncio.sleep(0.02)
+            reasons.append(stop_reason())
+
+        await DeadlineMiddleware(app)(scope("GET"), client.receive, client.send)
+        return reasons
+
+    assert asyncio.run(scenario()) == [None]
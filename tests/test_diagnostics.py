@@ -0,0 +1,62 @@
+import threading
+import tracemalloc
+
+import pytest
+
+from app.services.diagnostics import MemoryTracer
+
+
+def test_concurrent_snapshots_and_stop():
+    tracer = MemoryTracer(max_snapshots=1)
+    tracer.start(frames=1)
+    errors = []
+
+    def take():
+        for _ in range(5):
+            try:
+                tracer.snapshot()
+            except ValueError:
+                # Трассировку уже выключили - ожидаемый отказ
+                pass
+            except Exception as e:
+                errors.append(e)
+
+    try:
+        threads = [threading.Thread(target=take) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        tracer.stop()
+        for thread in threads:
+            thread.join()
+    finally:
+        tracer.stop()
+    assert errors == []
+
+
+def test_stop_waits_for_snapshot_in_progress(monkeypatch):
+    tracer = MemoryTracer(max_snapshots=2)
+    tracer.start(frames=1)
+    take_snapshot = tracemalloc.take_snapshot
+    stoppers = []
+
+    def take_snapshot_with_stop():
+        # Администратор выключает трассировку, пока снимок ещё снимается
+        stopper = threading.Thread(target=tracer.stop)
+        stopper.start()
+        stopper.join(0.05)
+        stoppers.append(stopper)
+        return take_snapshot()
+
+    monkeypatch.setattr(tracemalloc, "take_snapshot", take_snapshot_with_stop)
+    try:
+        assert tracer.snapshot()["id"] == "1"
+        stoppers[-1].join()
+        with pytest.raises(ValueError):
+            tracer.snapshot()
+
+        tracer.start(frames=1)
+        assert tracer.top(None, "lineno", 1)["snapshot"] == "now"
+        stoppers[-1].join()
+        assert not tracemalloc.is_tracing()
+    finally:
+        tracer.stop()
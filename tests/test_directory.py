@@ -0,0 +1,67 @@
+import app.services.directory as directory
+from app.services.directory import DirectoryIndex
+
+
+def user(uid, mail=None, groups=()):
+    return {"uid": [uid], "mail": [mail or f"{uid}@example.com"], "cn": [uid.title()],
+            "memberof_group": list(groups)}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_writes_are_debounced(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(directory.time, "monotonic", clock)
+    scans = []
+    monkeypatch.setattr(directory, "scan_users", lambda client: scans.append(client) or [user("ivanov")])
+    service = object()
+    monkeypatch.setattr(directory, "background_client", lambda: service)
+
+    index = DirectoryIndex(ttl=300, stale_refresh=30)
+    # Фоновый поток не нужен - обновляем синхронно
+    monkeypatch.setattr(index, "refresh_in_background", lambda: index.refresh(directory.background_client()))
+
+    assert index.ensure_fresh()
+    assert scans == [service]
+
+    # Массовая операция: запись за записью, поиск между ними
+    for _ in range(50):
+        index.mark_stale()
+        clock.now += 0.5
+        index.ensure_fresh()
+    # 25 секунд изменений - одна пересборка после stale_refresh, а не 50
+    assert len(scans) == 1
+
+    clock.now += 10
+    index.ensure_fresh()
+    assert len(scans) == 2
+    index.ensure_fresh()
+    assert len(scans) == 2
+
+
+def test_no_service_account_no_background_refresh(monkeypatch):
+    monkeypatch.setattr(directory, "background_client", lambda: None)
+    monkeypatch.setattr(directory, "scan_users", lambda client: [user("ivanov")])
+    index = DirectoryIndex(ttl=300, stale_refresh=30)
+    assert not index.ensure_fresh()
+    # Загружать некому - не ждём
+    assert not index.wait(5)
+
+
+def test_search_filters_and_paging(monkeypatch):
+    records = [user("ivanov", groups=["staff"]), user("ivanova"), user("petrov", groups=["staff"])]
+    monkeypatch.setattr(directory, "scan_users", lambda client: records)
+    index = DirectoryIndex(ttl=300, stale_refresh=30)
+    index.refresh(client=None)
+
+    total, page = index.search("ivan")
+    assert total == 2 and [r["uid"] for r in page] == ["ivanov", "ivanova"]
+    total, page = index.search(group="staff", limit=1)
+    assert total == 2 and [r["uid"] for r in page] == ["ivanov"]
+    assert set(index.lookup("mail", ["PETROV@example.com"])) == {"petrov@example.com"}
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from app.services.excel_parser import ExcelParser
+from excel_import.rows import parse_fio
+
+CSV = "ФИО;Email;Телефон;Должность;Группы\nИванов Иван;ivanov@example.com;;Инженер;dev, qa\nПетров;;;;\n".encode("utf-8")
+
+
+@pytest.fixture
+def parser():
+    parser = ExcelParser(workers=1)
+    yield parser
+    parser.shutdown()
+
+
+def test_parse_in_worker_process(parser):
+    async def scenario():
+        rows = await parser.parse("users.csv", CSV)
+        # Процесс разбора не импортирует приложение (FastAPI, конфигурацию, логирование)
+        loop = asyncio.get_running_loop()
+        app_loaded = await loop.run_in_executor(parser._get_pool(), eval, "'app' in __import__('sys').modules")
+        return rows, app_loaded
+
+    rows, app_loaded = asyncio.run(scenario())
+    assert rows == [
+        (2, ("Иванов Иван", "ivanov@example.com", None, "Инженер", "dev, qa"), parse_fio("Иванов Иван")[2]),
+        (3, ("Петров", "", None, None, ""), None)
+    ]
+    assert app_loaded is False
+    assert parser.metrics()["parsed_total"] == 1
+
+
+def test_parse_errors_are_raised(parser):
+    with pytest.raises(UnicodeDecodeError):
+        asyncio.run(parser.parse("users.csv", b"\xff\xfe\x00broken"))
+    assert parser.metrics()["failed_total"] == 1
+
+
+def test_dead_worker_restarts_pool(parser):
+    async def scenario():
+        await parser.parse("users.csv", CSV)
+        pool = parser._get_pool()
+        # Процесс разбора убит (например, OOM killer)
+        for process in list(pool._processes.values()):
+            process.kill()
+            process.join()
+        with pytest.raises(RuntimeError):
+            await parser.parse("users.csv", CSV)
+        assert parser._get_pool() is not pool
+        return await parser.parse("users.csv", CSV)
+
+    rows = asyncio.run(scenario())
+    assert len(rows) == 2
+    metrics = parser.metrics()
+    assert metrics["restarts_total"] == 1 and metrics["parsed_total"] == 2
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+from starlette.concurrency import run_in_threadpool
+
+from app.middleware.context import RequestContextMiddleware
+from app.middleware.deadline import DeadlineMiddleware
+from app.services.deadline import stop_reason
+from app.services.inflight import hold_operation, list_operations, wait_for_drain
+
+
+def test_cancelled_request_stays_registered_until_thread_exits():
+    release = threading.Event()
+    stopped = []
+
+    @hold_operation()
+    def bulk_items():
+        # Элемент в работе; следующий не начинается, если запрос остановлен
+        release.wait(5)
+        stopped.append(stop_reason())
+
+    async def endpoint(scope, receive, send):
+        await run_in_threadpool(bulk_items)
+
+    app = RequestContextMiddleware(DeadlineMiddleware(endpoint))
+    scope = {"type": "http", "method": "POST", "path": "/api/v1/users/bulk-delete",
+             "headers": [], "query_string": b""}
+
+    async def receive():
+        await asyncio.sleep(10)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    async def main():
+        task = asyncio.create_task(app(scope, receive, send))
+        await asyncio.sleep(0.2)
+        assert len(list_operations()) == 1
+
+        # Так uvicorn отменяет запросы по истечении timeout_graceful_shutdown
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+        # Задачи запроса уже нет, а поток ещё выполняет элемент
+        assert [op["operation"] for op in list_operations()] == ["POST /api/v1/users/bulk-delete"]
+        assert not wait_for_drain(0.1)
+
+        release.set()
+        assert await run_in_threadpool(wait_for_drain, 5)
+
+    asyncio.run(main())
+    assert stopped == ["shutdown"]
+
+
+def test_hold_outside_operation_is_noop():
+    with hold_operation():
+        assert list_operations() == []
+    assert wait_for_drain(0)
@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app.services.jobs as jobs
+from app.services.checkpoints import BulkOperation, BulkOperationConflict, fingerprint
+from app.services.jobs import job_progress, request_cancel, start_job
+from app.services.storage import get_connection
+
+
+@pytest.fixture(autouse=True)
+def one_worker(monkeypatch):
+    conn = get_connection()
+    for table in ("bulk_operations", "bulk_operation_items", "bulk_jobs"):
+        conn.execute(f"DELETE FROM {table}")
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(jobs, "_executor", executor)
+    yield
+    executor.shutdown(wait=True)
+
+
+def open_job(key, identifiers):
+    return BulkOperation.open("bulk-disable", "admin", fingerprint(identifiers), key)
+
+
+def gated_action(gate):
+    def action(client, identifier, resuming=False):
+        gate.wait(5)
+        return "success", {"identifier": identifier, "username": identifier}
+    return action
+
+
+def wait_for_status(operation_id, *statuses):
+    for _ in range(500):
+        progress = job_progress(operation_id)
+        if progress["status"] in statuses:
+            return progress
+        time.sleep(0.01)
+    raise AssertionError(job_progress(operation_id))
+
+
+def test_progress_until_completed():
+    gate = threading.Event()
+    identifiers = ["ivanov", "petrov", "sidorov"]
+    operation = open_job("key", identifiers)
+    started = start_job(None, operation, "BULK_DISABLE", "admin", [(i, i) for i in identifiers], gated_action(gate))
+    assert started == {"operation_id": operation.id, "status": "running", "total": 3}
+    assert jobs.active_jobs() == 1
+
+    progress = job_progress(operation.id)
+    assert progress["status"] == "running" and progress["total"] == 3 and progress["processed"] == 0
+
+    gate.set()
+    progress = wait_for_status(operation.id, "completed")
+    assert progress["processed"] == 3
+    assert [item["item"] for item in progress["items"]] == identifiers
+    # Следующий опрос с курсором - только новые элементы
+    assert job_progress(operation.id, since=progress["cursor"])["items"] == []
+
+
+def test_cancel_stops_before_next_item():
+    gate = threading.Event()
+    operation = open_job("key", ["ivanov", "petrov"])
+    start_job(None, operation, "BULK_DISABLE", "admin", [("ivanov", "ivanov"), ("petrov", "petrov")],
+              gated_action(gate))
+
+    assert request_cancel(operation.id)
+    assert job_progress(operation.id)["status"] == "cancelling"
+    gate.set()
+    progress = wait_for_status(operation.id, "cancelled")
+    assert progress["processed"] <= 1
+    assert not request_cancel("missing")
+
+
+def test_queued_job_is_not_reported_interrupted(monkeypatch):
+    gate = threading.Event()
+    first = open_job("first", ["ivanov"])
+    start_job(None, first, "BULK_DISABLE", "admin", [("ivanov", "ivanov")], gated_action(gate))
+    # Единственный поток пула занят - вторая операция ждёт в очереди
+    queued = open_job("second", ["petrov"])
+    start_job(None, queued, "BULK_DISABLE", "admin", [("petrov", "petrov")], gated_action(gate))
+
+    # Очередь дольше BULK_OPERATION_LEASE: без пульса операция выглядит брошенной
+    get_connection().execute("UPDATE bulk_operations SET updated = updated - 1000 WHERE id = ?", (queued.id,))
+    assert job_progress(queued.id)["status"] == "interrupted"
+
+    jobs._beat()
+    assert job_progress(queued.id)["status"] == "running"
+    # Повтор с тем же ключом не запускает вторую копию
+    with pytest.raises(BulkOperationConflict):
+        open_job("second", ["petrov"])
+
+    gate.set()
+    assert wait_for_status(queued.id, "completed")["processed"] == 1
+
+
+def test_abandoned_job_is_interrupted():
+    operation = open_job("key", ["ivanov"])
+    get_connection().execute("INSERT INTO bulk_jobs (operation_id, total) VALUES (?, 1)", (operation.id,))
+    # Операцию принял процесс, которого больше нет: пульса нет
+    get_connection().execute("UPDATE bulk_operations SET updated = updated - 1000 WHERE id = ?", (operation.id,))
+    jobs._beat()
+    assert job_progress(operation.id)["status"] == "interrupted"
+    assert open_job("key", ["ivanov"]).id == operation.id
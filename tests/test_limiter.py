@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from app.services.admission import request_class_var
+from app.services.limiter import AdaptiveLimiter, BackendOverloaded
+
+
+def limiter(**kwargs):
+    options = dict(min_limit=1, max_limit=8, initial=2, queue_timeout=1,
+                   latency_tolerance=100, backoff_base=0.05, backoff_max=0.05)
+    options.update(kwargs)
+    return AdaptiveLimiter(**options)
+
+
+def test_grows_when_saturated_and_halves_on_overload():
+    ipa = limiter()
+    for _ in range(4):
+        with ipa.slot("user_show"), ipa.slot("user_show"):
+            pass
+    assert ipa.limit == 3
+
+    with ipa.slot("user_show") as slot:
+        slot.mark_overloaded()
+    assert ipa.limit == 1
+    assert ipa.metrics()["backoff_remaining"] > 0
+
+
+def test_no_slot_is_rejected():
+    ipa = limiter(initial=1, queue_timeout=0.05)
+    with ipa.slot("user_show"):
+        with pytest.raises(BackendOverloaded):
+            with ipa.slot("user_show"):
+                pass
+    assert ipa.metrics()["rejected_total"] == 1
+
+
+def test_interactive_goes_first():
+    ipa = limiter(initial=1)
+    order = []
+
+    def call(request_class):
+        request_class_var.set(request_class)
+        with ipa.slot("user_show"):
+            order.append(request_class)
+
+    with ipa.slot("user_show"):
+        heavy = threading.Thread(target=call, args=("heavy",))
+        heavy.start()
+        while ipa.metrics()["waiting"] < 1:
+            time.sleep(0.001)
+        interactive = threading.Thread(target=call, args=("interactive",))
+        interactive.start()
+        while ipa.metrics()["waiting_interactive"] < 1:
+            time.sleep(0.001)
+    heavy.join()
+    interactive.join()
+    assert order == ["interactive", "heavy"]
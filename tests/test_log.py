@@ -0,0 +1,52 @@
+import logging
+
+from app.utils.log import RepeatFilter
+
+
+def make_record(msg="Пользователь %s удалён", request_id="r1"):
+    record = logging.LogRecord("app.bulk", logging.INFO, __file__, 1, msg, ("ivanov",), None)
+    record.request_id = request_id
+    return record
+
+
+def test_burst_then_drop():
+    f = RepeatFilter(burst=3, window=60)
+    passed = [f.filter(make_record()) for _ in range(10)]
+    assert passed == [True] * 3 + [False] * 7
+
+
+def test_window_end_flushes_suppressed_count(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.utils.log.time.monotonic", lambda: now[0])
+    flushed = []
+    f = RepeatFilter(burst=2, window=10, sink=flushed.append)
+
+    for _ in range(5):
+        f.filter(make_record(request_id="finished"))
+    assert flushed == []
+
+    # Запрос "finished" закончился, следующая запись - из другого запроса
+    now[0] += 11
+    assert f.filter(make_record(request_id="other"))
+    assert len(flushed) == 1
+    assert flushed[0].request_id == "finished"
+    assert flushed[0].suppressed == 3
+
+
+def test_flush_reports_open_windows():
+    flushed = []
+    f = RepeatFilter(burst=1, window=60, sink=flushed.append)
+    for _ in range(4):
+        f.filter(make_record())
+    f.flush()
+    assert [r.suppressed for r in flushed] == [3]
+    # Счётчик выдан один раз
+    f.flush()
+    assert len(flushed) == 1
+
+
+def test_errors_not_limited():
+    f = RepeatFilter(burst=1, window=60)
+    record = make_record()
+    record.levelno = logging.ERROR
+    assert all(f.filter(record) for _ in range(5))
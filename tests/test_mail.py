@@ -0,0 +1,155 @@
+import smtplib
+import threading
+import time
+
+import pytest
+
+import app.services.bulk as bulk
+from app.services.bulk import CredentialMailer, run_bulk
+from app.services.checkpoints import BulkOperation, fingerprint, get_progress
+from app.services.mail import MailSender
+from app.services.storage import get_connection
+
+
+class FakeSMTP:
+    """SMTP-сервер в памяти: outcomes - ответы на письма по порядку (None - принято)"""
+
+    instances = []
+    outcomes = []
+    gate = None
+
+    def __init__(self, host, port, timeout=None):
+        self.calls = []
+        self.delivered = []
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        self.calls.append("starttls")
+
+    def login(self, username, password):
+        self.calls.append("login")
+
+    def send_message(self, message):
+        if FakeSMTP.gate is not None:
+            FakeSMTP.gate.wait(5)
+        outcome = FakeSMTP.outcomes.pop(0) if FakeSMTP.outcomes else None
+        if outcome is not None:
+            raise outcome
+        self.delivered.append(message["To"])
+
+    def quit(self):
+        self.calls.append("quit")
+
+
+@pytest.fixture
+def sender(monkeypatch):
+    monkeypatch.setattr(smtplib, "SMTP", FakeSMTP)
+    monkeypatch.setattr(FakeSMTP, "instances", [])
+    monkeypatch.setattr(FakeSMTP, "outcomes", [])
+    monkeypatch.setattr(FakeSMTP, "gate", None)
+    sender = MailSender(host="smtp.example.com", port=587, username="robot", password="secret",
+                        security="starttls", sender="robot@example.com", timeout=5, queue_size=10,
+                        queue_timeout=1, retries=2, retry_delay=0, idle_timeout=60)
+    yield sender
+    if FakeSMTP.gate is not None:
+        FakeSMTP.gate.set()
+    sender.shutdown(5)
+
+
+def send(sender, to):
+    ticket = sender.send(to, "Тема", "Текст")
+    assert ticket.wait(5)
+    return ticket
+
+
+def test_connection_is_reused(sender):
+    tickets = [send(sender, f"user{n}@example.com") for n in range(3)]
+
+    assert [ticket.status for ticket in tickets] == ["sent"] * 3
+    assert len(FakeSMTP.instances) == 1
+    smtp = FakeSMTP.instances[0]
+    assert smtp.calls == ["starttls", "login"]
+    assert smtp.delivered == ["user0@example.com", "user1@example.com", "user2@example.com"]
+    assert sender.metrics()["connections_total"] == 1 and sender.metrics()["sent_total"] == 3
+
+
+def test_temporary_error_is_retried(sender):
+    FakeSMTP.outcomes = [smtplib.SMTPDataError(451, b"Try again later")]
+    ticket = send(sender, "ivanov@example.com")
+
+    assert ticket.as_dict() == {"to": "ivanov@example.com", "status": "sent"}
+    assert ticket.attempts == 2
+    # После временной ошибки - новое соединение
+    assert len(FakeSMTP.instances) == 2 and FakeSMTP.instances[0].calls[-1] == "quit"
+    assert FakeSMTP.instances[1].delivered == ["ivanov@example.com"]
+
+
+@pytest.mark.parametrize("error, code", [
+    (smtplib.SMTPDataError(554, b"Message rejected"), "554"),
+    (smtplib.SMTPRecipientsRefused({"ivanov@example.com": (550, b"No such user")}), "550")
+])
+def test_permanent_error_is_not_retried(sender, error, code):
+    FakeSMTP.outcomes = [error]
+    ticket = send(sender, "ivanov@example.com")
+
+    assert ticket.status == "failed" and ticket.attempts == 1
+    assert code in ticket.error
+    assert len(FakeSMTP.instances) == 1
+    assert sender.metrics()["failed_total"] == 1
+
+    # Соединение осталось рабочим для следующих писем
+    assert send(sender, "petrov@example.com").status == "sent"
+    assert len(FakeSMTP.instances) == 1
+
+
+def test_full_queue_rejects_message(sender):
+    sender._queue.maxsize = 1
+    sender.queue_timeout = 0.05
+    FakeSMTP.gate = threading.Event()
+
+    first = sender.send("user0@example.com", "Тема", "Текст")
+    # Поток отправки забрал первое письмо и ждёт сервер - второе занимает очередь
+    while sender._queue.unfinished_tasks != 1 or sender._queue.qsize():
+        time.sleep(0.001)
+    second = sender.send("user1@example.com", "Тема", "Текст")
+    rejected = sender.send("user2@example.com", "Тема", "Текст")
+
+    assert rejected.as_dict() == {"to": "user2@example.com", "status": "failed", "error": "Очередь писем переполнена"}
+    FakeSMTP.gate.set()
+    assert first.wait(5) and second.wait(5)
+    assert first.status == second.status == "sent"
+    assert sender.metrics()["failed_total"] == 1
+
+
+def test_delivery_is_annotated_into_bulk_results(sender, monkeypatch):
+    for table in ("bulk_operations", "bulk_operation_items"):
+        get_connection().execute(f"DELETE FROM {table}")
+    monkeypatch.setattr(bulk, "mail_sender", sender)
+    FakeSMTP.outcomes = [None, smtplib.SMTPRecipientsRefused({"petrov@example.com": (550, b"No such user")})]
+
+    entries = {
+        "ivanov": {"username": "ivanov", "email": "ivanov@example.com", "yopass_link": "https://yopass/1"},
+        "petrov": {"username": "petrov", "identifier": "petrov@example.com", "password": "s3cret"},
+        "sidorov": {"username": "sidorov", "email": "sidorov@example.com"}
+    }
+
+    def action(client, identifier, resuming=False):
+        return "success", dict(entries[identifier])
+
+    operation = BulkOperation.open("bulk-reset-password-link", "admin", fingerprint(list(entries)), "key")
+    mailer = CredentialMailer(None, operation, "reset")
+    results = run_bulk(None, operation, [(key, key) for key in entries], action, after_item=mailer)
+    mailer.wait(5)
+
+    delivery = {entry["username"]: entry["delivery"] for entry in results["success"]}
+    assert delivery["ivanov"] == {"to": "ivanov@example.com", "status": "sent"}
+    assert delivery["petrov"]["status"] == "failed" and "550" in delivery["petrov"]["error"]
+    assert delivery["sidorov"] == {"status": "skipped", "error": "Нет пароля для отправки"}
+
+    # Итоговые статусы писем видны и в прогрессе операции
+    for _ in range(500):
+        journal = {item["item"]: item["delivery"] for item in get_progress(operation.id)["items"]}
+        if journal == delivery:
+            break
+        time.sleep(0.01)
+    assert journal == delivery
@@ -0,0 +1,86 @@
+import app.services.directory as directory
+import app.services.reconcile as reconcile
+from app.services.reconcile import build_plan, fingerprint_plan
+from excel_import.rows import parse_fio
+
+IVANOV = parse_fio("Иванов Иван")[2]
+PETROV = parse_fio("Петров Пётр")[2]
+
+
+def user(uid, mail, title=None, groups=(), locked=False):
+    return {"uid": [uid], "mail": [mail], "title": [title] if title else [],
+            "memberof_group": list(groups), "nsaccountlock": locked}
+
+
+class Catalog:
+    """Группы из файла существуют, кроме missing"""
+
+    def __init__(self, missing=()):
+        self._missing = set(missing)
+
+    def missing(self, client, groups):
+        return [group for group in groups if group in self._missing]
+
+    def describe_missing(self, client, groups):
+        return ", ".join(groups)
+
+
+def plan_for(monkeypatch, users, rows, missing=(), **kwargs):
+    monkeypatch.setattr(directory, "scan_users", lambda client: list(users))
+    monkeypatch.setattr(reconcile, "group_catalog", Catalog(missing))
+    return build_plan(object(), list(enumerate(rows, start=2)), **kwargs)
+
+
+def test_only_differences_are_planned(monkeypatch):
+    users = [
+        user(IVANOV, "ivanov@example.com", title="Engineer", groups=["dev"]),
+        user("old.user", "old@example.com", groups=["dev"]),
+        user("admin", "admin@example.com", groups=["dev"])
+    ]
+    rows = [
+        ("Иванов Иван", "ivanov@example.com", None, "Lead", "dev, qa"),
+        ("Петров Пётр", "petrov@example.com", None, None, "dev"),
+        ("Сидоров", "sidorov@example.com", None, None, "")
+    ]
+    plan = plan_for(monkeypatch, users, rows, disable_missing=True, scope_group="dev", protected={"admin"})
+
+    assert plan["update"] == [{"row": 2, "username": IVANOV, "matched_by": "username",
+                               "changes": {"title": {"from": "Engineer", "to": "Lead"}}}]
+    assert plan["group_add"] == {"qa": [IVANOV]}
+    assert plan["group_remove"] == {}
+    assert [entry["username"] for entry in plan["create"]] == [PETROV]
+    assert plan["disable"] == ["old.user"]
+    assert [error["row"] for error in plan["errors"]] == [4]
+
+
+def test_matched_state_gives_empty_plan(monkeypatch):
+    users = [user(IVANOV, "ivanov@example.com", title="Lead", groups=["dev"])]
+    rows = [("Иванов Иван", "IVANOV@example.com", None, "Lead", "dev")]
+    plan = plan_for(monkeypatch, users, rows)
+
+    assert plan["summary"]["unchanged"] == 1
+    assert not plan["create"] and not plan["update"] and not plan["group_add"] and not plan["group_remove"]
+
+
+def test_match_by_email_and_missing_groups(monkeypatch):
+    users = [user("i.ivanov", "ivanov@example.com", groups=["dev"])]
+    rows = [("Иванов Иван", "ivanov@example.com", None, None, "ghost"),
+            ("Петров Пётр", "petrov@example.com", None, None, "ghost")]
+    plan = plan_for(monkeypatch, users, rows, missing={"ghost"})
+
+    # Существующий пользователь найден по email; группа ghost не управляется
+    assert plan["update"] == [] and plan["group_add"] == {}
+    assert plan["create"] == []
+    assert {error["row"] for error in plan["errors"]} == {None, 3}
+
+
+def test_fingerprint_follows_the_plan(monkeypatch):
+    users = [user(IVANOV, "ivanov@example.com", title="Engineer", groups=["dev"])]
+    rows = [("Иванов Иван", "ivanov@example.com", None, "Lead", "dev, qa")]
+
+    first = fingerprint_plan(plan_for(monkeypatch, users, rows))
+    assert fingerprint_plan(plan_for(monkeypatch, users, rows)) == first
+
+    # Кто-то уже поменял title - план другой, apply с прежним отпечатком получит 409
+    users = [user(IVANOV, "ivanov@example.com", title="Lead", groups=["dev"])]
+    assert fingerprint_plan(plan_for(monkeypatch, users, rows)) != first
@@ -0,0 +1,34 @@
+import threading
+
+import app.services.freeipa as freeipa
+from app.services.freeipa import SCAN_WINDOW, scan_users
+
+
+def test_scan_keeps_a_bounded_window(monkeypatch):
+    monkeypatch.setattr(freeipa, "DIRECTORY_SCAN_BATCH", 2)
+    uids = [f"user{n:03}" for n in range(40)]
+    monkeypatch.setattr(freeipa, "_list_uids", lambda client: set(uids))
+    lock = threading.Lock()
+    requested = []
+
+    def show_batch(client, batch):
+        with lock:
+            requested.append(batch)
+        return [{"uid": [uid]} for uid in batch]
+
+    monkeypatch.setattr(freeipa, "_show_batch", show_batch)
+
+    scan = scan_users(object())
+    seen = []
+    for user in scan:
+        seen.append(user["uid"][0])
+        consumed = (len(seen) + 1) // 2
+        # Отправлены только забранные части и окно вперёд
+        assert len(requested) <= consumed + SCAN_WINDOW
+        if len(seen) == 10:
+            break
+    scan.close()
+    assert seen == uids[:10]
+    assert len(requested) <= 5 + SCAN_WINDOW
+
+    assert [user["uid"][0] for user in scan_users(object())] == uids
@@ -0,0 +1,31 @@
+import datetime
+import uuid
+
+import pytest
+
+import app.utils.serialization as serialization
+from app.utils.serialization import dumps
+
+VALUE = {
+    "created": datetime.datetime(2026, 1, 2, 3, 4, 5, 123456),
+    "expires": datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+    "day": datetime.date(2026, 1, 2),
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "fio": "Иванов Иван",
+    1: "ключ-число"
+}
+EXPECTED = (
+    '{"created":"2026-01-02T03:04:05.123456","expires":"2026-01-02T03:04:05+00:00",'
+    '"day":"2026-01-02","id":"12345678-1234-5678-1234-567812345678","fio":"Иванов Иван","1":"ключ-число"}'
+)
+
+
+def test_stdlib_json(monkeypatch):
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert dumps(VALUE).decode("utf-8") == EXPECTED
+
+
+def test_orjson_matches_stdlib():
+    if serialization.orjson is None:
+        pytest.skip("orjson не установлен")
+    assert dumps(VALUE).decode("utf-8") == EXPECTED
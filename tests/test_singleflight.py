@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+import requests
+from python_freeipa import Client
+
+from app.services.deadline import DeadlineExceeded, RequestDeadline, deadline_var
+from app.services.freeipa import LimitedClient, ipa_singleflight
+from app.services.singleflight import SingleFlight
+
+
+def wait_for_waiters(flight, count):
+    while flight.metrics()["waiting"] < count:
+        time.sleep(0.001)
+
+
+def run_follower(flight, key, fn, outcome):
+    def follow():
+        try:
+            outcome["result"] = flight.do(key, fn)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=follow)
+    thread.start()
+    return thread
+
+
+def test_followers_share_result_and_errors():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait()
+        return {"result": ["ivanov"]}
+
+    outcome = {}
+    follower = run_follower(flight, "key", slow, outcome)
+    while not calls:
+        time.sleep(0.001)
+    leader = {}
+    leader_thread = run_follower(flight, "key", slow, leader)
+    wait_for_waiters(flight, 1)
+    release.set()
+    follower.join()
+    leader_thread.join()
+
+    assert calls == [1]
+    assert outcome["result"] == leader["result"] == {"result": ["ivanov"]}
+    # У каждого своя копия
+    assert outcome["result"] is not leader["result"]
+
+    def broken():
+        calls.append(2)
+        release.wait()
+        raise ValueError("boom")
+
+    release.clear()
+    calls.clear()
+    outcome = {}
+    follower = run_follower(flight, "key", broken, outcome)
+    while not calls:
+        time.sleep(0.001)
+    other = {}
+    other_thread = run_follower(flight, "key", broken, other)
+    wait_for_waiters(flight, 1)
+    release.set()
+    follower.join()
+    other_thread.join()
+    assert isinstance(outcome["error"], ValueError) and isinstance(other["error"], ValueError)
+    assert calls == [2]
+
+
+def test_leader_deadline_is_not_shared(monkeypatch):
+    calls = []
+
+    def backend(self, method, args=None, params=None):
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            # Лидер: ждём, пока к вызову присоединится второй запрос, и упираемся в дедлайн лидера
+            wait_for_waiters(ipa_singleflight, 1)
+            time.sleep(0.1)
+            raise requests.exceptions.ReadTimeout("timed out")
+        return {"result": {"uid": ["ivanov"]}}
+
+    monkeypatch.setattr(Client, "_request", backend)
+    client = LimitedClient(host="ipa.example.com", verify_ssl=False)
+    client.principal = "admin"
+    outcome = {}
+
+    def call(name, timeout):
+        deadline_var.set(RequestDeadline(timeout))
+        try:
+            outcome[name] = client._request("user_show", args=["ivanov"], params={})
+        except Exception as e:
+            outcome[name] = e
+
+    leader = threading.Thread(target=call, args=("leader", 0.05), name="leader")
+    leader.start()
+    while not calls:
+        time.sleep(0.001)
+    follower = threading.Thread(target=call, args=("follower", 30), name="follower")
+    follower.start()
+    leader.join()
+    follower.join()
+
+    assert isinstance(outcome["leader"], DeadlineExceeded)
+    # Ожидающий не получил чужой 504, а выполнил вызов сам
+    assert outcome["follower"] == {"result": {"uid": ["ivanov"]}}
+    assert calls == ["leader", "follower"]
+
+
+def test_retry_errors_are_raised_to_the_leader():
+    flight = SingleFlight(retry_errors=(DeadlineExceeded,))
+
+    def expired():
+        raise DeadlineExceeded("deadline")
+
+    with pytest.raises(DeadlineExceeded):
+        flight.do("key", expired)
+    assert flight.metrics()["inflight"] == 0
@@ -0,0 +1,33 @@
+import os
+
+import app.services.snapshots as snapshots
+from app.services.snapshots import ReportSnapshots
+
+
+def scan(count, tag):
+    return lambda client: ({"uid": [f"{tag}{i}"], "mail": [f"{tag}{i}@example.com"]} for i in range(count))
+
+
+def test_download_survives_rebuilds(tmp_path, monkeypatch):
+    store = ReportSnapshots(str(tmp_path), interval=0, rebuild_delay=0)
+    monkeypatch.setattr(snapshots, "scan_users", scan(1000, "a"))
+    store.build(client=None)
+
+    # Выгрузка выбрала снимок и начала читать
+    meta, snapshot = store.open_latest()
+    records = store.iter_records(snapshot)
+    first = next(records)
+
+    # Две пересборки: файл первого снимка удалён из каталога
+    monkeypatch.setattr(snapshots, "scan_users", scan(10, "b"))
+    store.build(client=None)
+    store.build(client=None)
+    assert not os.path.exists(tmp_path / meta["file"])
+
+    rest = list(records)
+    assert [first["uid"][0]] + [r["uid"][0] for r in rest] == [f"a{i}" for i in range(1000)]
+    assert snapshot.closed
+
+
+def test_open_latest_without_snapshot(tmp_path):
+    assert ReportSnapshots(str(tmp_path), interval=0, rebuild_delay=0).open_latest() is None